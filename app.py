@@ -1,31 +1,45 @@
 import streamlit as st
-import mysql.connector
 import pandas as pd
 import time
 from datetime import datetime, timezone, timedelta
-import io
-import re
-import math
 import json, os
-from feedback_store import init_db, read_feedbacks, update_status
+from feedback_store import read_feedbacks, update_status
+from db_pool import get_connection, rerun_connection, release_rerun_connection
+from migrations import ensure_schema
+from query_cache import cached_query
+from data_versions import bump_versions
+from bulk_ops import bulk_transaction
+from shipping_state import refresh_customers, refresh_orders, rebuild_all
+from sql_trace import start_rerun, finish_rerun, trace_span, render_trace_toggle, render_trace_panel
+from sql_frames import read_sql_df  # 查詢結果直接解成有型別的 DataFrame
+from exports import format_picker, export_button
+from paged_editor import paged_editor, selection, clear_selection, reset_editor
+from return_requests import load_pending_requests, request_items, mark_requests, process_requests
+from table_format import order_table, mark_columns, check_marks, flag_tags, map_labels
+from order_store import (
+    set_flag, mark_returned,
+    load_dashboard_stats, profit_report,
+    load_shippable_orders, load_shippable_summary, shippable_totals, shippable_page,
+    shippable_by_ids, shippable_by_customers, shippable_ids_of_customers, has_shippable_of_customers,
+    batch_page, batch_totals, order_totals,
+    like_prefix, tracking_condition, day_range, order_search_query,
+)
+from inbound_parser import parse_inbound
+from inbound_files import FILE_TYPES, WATCH_DIR_ENV, configured_watch_dir, folder_status, ingest
+from retry_worker import request_run, retry_status
+from inbound_store import (
+    FAILED_AGES, FAILED_SORTS, clear_failed, failed_filter, failed_page, failed_totals, failed_error_types,
+    delete_failed, retry_failed, reassign_failed, apply_inbound, TRACKING_MAX_LEN,
+)
 
 
 st.set_page_config(page_title="橘貓代購系統", layout="wide")
 
-# ===== 安全 SQL 查詢 =====
-def read_sql_df(sql, conn, params=None):
-    params = params or []
-    conn.ping(reconnect=True, attempts=3, delay=1)
-    with conn.cursor(dictionary=True) as cur:
-        cur.execute(sql, tuple(params))
-        rows = cur.fetchall()
-    return pd.DataFrame(rows)
+# SQL / pandas 耗時追蹤：側邊欄開關，預設關閉（sql_trace.py）
+start_rerun("app")
+render_trace_toggle()
 
 
-if "db_inited" not in st.session_state:
-    init_db()
-    st.session_state["db_inited"] = True
-
 #確認小視窗
 def show_toast_once(key: str, msg: str, icon: str = "✅"):
     if st.session_state.get(key):
@@ -33,34 +47,46 @@ def show_toast_once(key: str, msg: str, icon: str = "✅"):
         st.session_state[key] = False
 
 
+# 熱門讀取走 query_cache：資料表沒變就不重查；查詢失敗不快取，由外層給預設值
+@cached_query("site_settings")
+def _exchange_rate_setting(conn):
+    df_rate = read_sql_df("""
+        SELECT setting_value
+        FROM site_settings
+        WHERE setting_key = 'current_exchange_rate'
+        LIMIT 1
+    """, conn)
+    return None if df_rate.empty else df_rate.iloc[0]["setting_value"]
+
+
 def get_current_exchange_rate(conn, default=4.78):
     try:
-        df_rate = read_sql_df("""
-            SELECT setting_value
-            FROM site_settings
-            WHERE setting_key = 'current_exchange_rate'
-            LIMIT 1
-        """, conn)
-        if not df_rate.empty:
-            return float(df_rate.iloc[0]["setting_value"])
+        value = _exchange_rate_setting(conn)
+        if value is not None:
+            return float(value)
     except Exception:
         pass
     return float(default)
 
 
+@cached_query("members")
+def _member_level(conn, customer_name):
+    df_member = read_sql_df("""
+        SELECT member_level
+        FROM members
+        WHERE customer_name = %s
+        LIMIT 1
+    """, conn, params=[customer_name])
+    if not df_member.empty and pd.notna(df_member.iloc[0]["member_level"]):
+        return str(df_member.iloc[0]["member_level"])
+    return None
+
+
 def get_member_level(conn, customer_name: str) -> str:
     try:
-        df_member = read_sql_df("""
-            SELECT member_level
-            FROM members
-            WHERE customer_name = %s
-            LIMIT 1
-        """, conn, params=[customer_name])
-        if not df_member.empty and pd.notna(df_member.iloc[0]["member_level"]):
-            return str(df_member.iloc[0]["member_level"])
+        return _member_level(conn, customer_name) or "一般會員"
     except Exception:
-        pass
-    return "一般會員"
+        return "一般會員"
 
 
 def calc_service_fee(amount_rmb: float, member_level: str, platform: str) -> float:
@@ -95,991 +121,462 @@ def calc_service_fee(amount_rmb: float, member_level: str, platform: str) -> flo
 
 
         
-def ensure_members_table(conn):
-    ddl = """
-    CREATE TABLE IF NOT EXISTS members (
-      member_id INT AUTO_INCREMENT PRIMARY KEY,
-      customer_name VARCHAR(255) NOT NULL,
-      member_level VARCHAR(50) NOT NULL DEFAULT '一般會員',
-      note TEXT NULL,
-      created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-      updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-      line_user_id VARCHAR(100) NULL,
-      line_name VARCHAR(100) NULL,
-      UNIQUE KEY uk_customer_name (customer_name)
-    ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
-    """
-    with conn.cursor() as cur:
-        cur.execute(ddl)
-
-        try:
-            cur.execute("ALTER TABLE members ADD COLUMN member_level VARCHAR(50) NOT NULL DEFAULT '一般會員'")
-        except Exception:
-            pass
-
-        try:
-            cur.execute("ALTER TABLE members ADD COLUMN note TEXT NULL")
-        except Exception:
-            pass
-
-        try:
-            cur.execute("ALTER TABLE members ADD COLUMN created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP")
-        except Exception:
-            pass
-
-        try:
-            cur.execute("ALTER TABLE members ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
-        except Exception:
-            pass
-
-        try:
-            cur.execute("ALTER TABLE members ADD COLUMN line_user_id VARCHAR(100) NULL")
-        except Exception:
-            pass
-
-        try:
-            cur.execute("ALTER TABLE members ADD COLUMN line_name VARCHAR(100) NULL")
-        except Exception:
-            pass
+MEMBER_SYNC_KEY = "members_synced_order_id"       # site_settings：上次同步到的 order_id
+MEMBER_FULL_SYNC_KEY = "members_full_synced_at"   # site_settings：上次全表補同步的時間（unix 秒）
+MEMBER_SYNC_OVERLAP = 1000                         # 每次從水位往回多掃幾個 order_id
+MEMBER_FULL_SYNC_SECONDS = 6 * 60 * 60             # 多久做一次全表補同步
 
-    conn.commit()
-
-def sync_members_from_orders(conn):
-    sql = """
+_MEMBER_INSERT_SQL = """
     INSERT IGNORE INTO members (customer_name)
     SELECT DISTINCT customer_name
     FROM orders
     WHERE customer_name IS NOT NULL
-      AND TRIM(customer_name) <> ''
-    """
-    with conn.cursor() as cur:
-        cur.execute(sql)
-    conn.commit()
-
-
-
-# ===== 入庫失敗佇列（純本機 JSON，無需改資料表） =====
-
-QUEUE_FILE = "failed_inbound_queue.json"
-
-def enqueue_failed(conn, tracking_number, weight_kg=None, raw_message=None, last_error=None):
-    ensure_failed_orders_table(conn)
-
-    # ✅ 防爆：last_error 太長會讓 VARCHAR(255) 直接 DataError
-    if last_error is not None:
-        last_error = str(last_error)
-        last_error = last_error[:250]   # 留點空間避免邊界問題
-
-    sql = """
-    INSERT INTO failed_orders (tracking_number, weight_kg, raw_message, retry_count, last_error)
-    VALUES (%s, %s, %s, 1, %s)
-    ON DUPLICATE KEY UPDATE
-      weight_kg = IFNULL(VALUES(weight_kg), weight_kg),
-      raw_message = IFNULL(VALUES(raw_message), raw_message),
-      last_error = VALUES(last_error),
-      retry_count = retry_count + 1,
-      updated_at = CURRENT_TIMESTAMP
-    """
-    with conn.cursor() as cur:
-        cur.execute(sql, (tracking_number, weight_kg, raw_message, last_error))
-    conn.commit()
-
-
-def ensure_forwarding_register_table(conn):
-    ddl = """
-    CREATE TABLE IF NOT EXISTS customer_forwarding_registers (
-      register_id INT AUTO_INCREMENT PRIMARY KEY,
-      customer_name VARCHAR(255) NOT NULL,
-      tracking_number VARCHAR(255) NOT NULL,
-      item_name VARCHAR(255) NOT NULL,
-      quantity INT NOT NULL DEFAULT 1,
-      unit_price_rmb DECIMAL(10,2) NOT NULL DEFAULT 0,
-      remarks TEXT NULL,
-      status ENUM('pending','processed','cancelled') NOT NULL DEFAULT 'pending',
-      created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-      updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-      UNIQUE KEY uk_tracking_number (tracking_number)
-    ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
-    """
-    with conn.cursor() as cur:
-        cur.execute(ddl)
-
-        try:
-            cur.execute("ALTER TABLE customer_forwarding_registers ADD COLUMN quantity INT NOT NULL DEFAULT 1")
-        except Exception:
-            pass
-
-        try:
-            cur.execute("ALTER TABLE customer_forwarding_registers ADD COLUMN unit_price_rmb DECIMAL(10,2) NOT NULL DEFAULT 0")
-        except Exception:
-            pass
-
-    conn.commit()
-
-
-def ensure_frontend_config_tables(conn):
-    ddl1 = """
-    CREATE TABLE IF NOT EXISTS site_settings (
-      setting_key VARCHAR(100) PRIMARY KEY,
-      setting_value TEXT NULL,
-      updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-    ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
-    """
-
-    ddl2 = """
-    CREATE TABLE IF NOT EXISTS shipping_batches (
-      batch_id INT AUTO_INCREMENT PRIMARY KEY,
-      batch_text VARCHAR(255) NOT NULL,
-      delivery_type VARCHAR(30) NOT NULL DEFAULT 'home_delivery',
-      sort_order INT NOT NULL DEFAULT 0,
-      is_active TINYINT(1) NOT NULL DEFAULT 1,
-      updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-      created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-    ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
-    """
-
-    with conn.cursor() as cur:
-        cur.execute(ddl1)
-        cur.execute(ddl2)
-
-        # 舊資料表補欄位用
-        try:
-            cur.execute("""
-                ALTER TABLE shipping_batches
-                ADD COLUMN delivery_type VARCHAR(30) NOT NULL DEFAULT 'home_delivery'
-            """)
-        except Exception:
-            pass
-
-        # 預設匯率
-        cur.execute("""
-            INSERT IGNORE INTO site_settings (setting_key, setting_value)
-            VALUES ('current_exchange_rate', '4.78')
-        """)
-
-    conn.commit()
-
-
-def ensure_failed_orders_table(conn):
-    ddl = """
-    CREATE TABLE IF NOT EXISTS failed_orders (
-      id INT AUTO_INCREMENT PRIMARY KEY,
-      tracking_number VARCHAR(64) NOT NULL,
-      weight_kg DECIMAL(10,3) NULL,
-      raw_message TEXT NULL,
-      retry_count INT NOT NULL DEFAULT 0,
-      last_error VARCHAR(255) NULL,
-      created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-      updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-      UNIQUE KEY uk_tracking (tracking_number)
-    ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
-    """
-    with conn.cursor() as cur:
-        cur.execute(ddl)
-    conn.commit()
-
-def load_failed(conn):
-    try:
-        ensure_failed_orders_table(conn)
-        with conn.cursor(dictionary=True) as cur:
-            cur.execute("""
-                SELECT tracking_number, weight_kg, raw_message, retry_count, last_error
-                FROM failed_orders
-                ORDER BY updated_at DESC
-            """)
-            rows = cur.fetchall()
-        return pd.DataFrame(rows)
-    except Exception as e:
-        st.error(f"讀取 failed_orders 發生錯誤：{e}")
-        return pd.DataFrame(columns=["tracking_number","weight_kg","raw_message","retry_count","last_error"])
-
-
-def clear_failed(conn):
-    ensure_failed_orders_table(conn)
-    with conn.cursor() as cur:
-        cur.execute("TRUNCATE TABLE failed_orders")
-    conn.commit()
-
-
-def retry_failed_all(conn):
-    df = load_failed(conn)
-    success = fail = 0
-    success_list = []   # ✅ NEW：記錄成功的單號
-
-    for _, row in df.iterrows():
-        tn, w, raw_msg = row["tracking_number"], row["weight_kg"], row["raw_message"]
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    UPDATE orders 
-                    SET is_arrived = 1,
-                        weight_kg = %s,
-                        remarks = CONCAT(COALESCE(remarks,''), '｜自動入庫', NOW())
-                    WHERE tracking_number = %s
-                    """,
-                    (w, tn)
-                )
-
-                if cur.rowcount > 0:
-                    conn.commit()
-
-                    # ✅ 成功：刪掉佇列 + 記錄成功單號
-                    with conn.cursor() as c2:
-                        c2.execute("DELETE FROM failed_orders WHERE tracking_number=%s", (tn,))
-                    conn.commit()
-
-                    success += 1
-                    success_list.append(str(tn))   # ✅ NEW
-                else:
-                    enqueue_failed(conn, tn, w, raw_msg, "找不到對應訂單")
-                    fail += 1
-
-        except Exception as e:
-            enqueue_failed(conn, tn, w, raw_msg, str(e))
-            fail += 1
-
-    return success, fail, success_list  # ✅ NEW：多回傳清單
-
-
-
-def delete_failed_one(conn, tracking_number: str):
-    """依 tracking_number 刪除 failed_orders 的單筆資料（唯一鍵）。"""
-    ensure_failed_orders_table(conn)
-    with conn.cursor() as cur:
-        cur.execute("DELETE FROM failed_orders WHERE tracking_number=%s LIMIT 1", (tracking_number,))
-    conn.commit()
-
-
-# ===== 前台欲運回申請資料表 =====
-
-def ensure_return_request_tables(conn):
-    ddl1 = """
-    CREATE TABLE IF NOT EXISTS customer_return_requests (
-      request_id INT AUTO_INCREMENT PRIMARY KEY,
-      customer_name VARCHAR(255) NOT NULL,
-      selected_shipping_batch VARCHAR(255) NOT NULL,
-      delivery_method VARCHAR(50) NOT NULL DEFAULT '面交/自取',
-      total_count INT NOT NULL DEFAULT 0,
-      total_weight DECIMAL(10,3) NOT NULL DEFAULT 0,
-      estimated_fee DECIMAL(10,2) NOT NULL DEFAULT 0,
-      status ENUM('pending','processed','cancelled') NOT NULL DEFAULT 'pending',
-      created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-      updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-    ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
-    """
+      AND TRIM(customer_name) <> ''{range}
+"""
 
-    ddl2 = """
-    CREATE TABLE IF NOT EXISTS customer_return_request_items (
-      id INT AUTO_INCREMENT PRIMARY KEY,
-      request_id INT NOT NULL,
-      order_id INT NOT NULL,
-      tracking_number VARCHAR(255) NULL,
-      platform VARCHAR(50) NULL,
-      weight_kg DECIMAL(10,3) NULL,
-      created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-      UNIQUE KEY uk_request_order (request_id, order_id),
-      CONSTRAINT fk_return_req_items_request
-        FOREIGN KEY (request_id) REFERENCES customer_return_requests(request_id)
-        ON DELETE CASCADE
-    ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
-    """
-
-    with conn.cursor() as cur:
-        cur.execute(ddl1)
-        cur.execute(ddl2)
-    conn.commit()
-
-
-def load_pending_return_requests(conn):
-    ensure_return_request_tables(conn)
-    sql = """
-    SELECT
-        r.request_id,
-        r.customer_name,
-        r.selected_shipping_batch,
-        r.delivery_method,
-        r.total_count,
-        r.total_weight,
-        r.estimated_fee,
-        r.status,
-        r.created_at,
-        GROUP_CONCAT(i.order_id ORDER BY i.order_id SEPARATOR ', ') AS order_ids,
-        GROUP_CONCAT(COALESCE(i.tracking_number, '') ORDER BY i.order_id SEPARATOR ', ') AS tracking_numbers
-FROM customer_return_requests r
-    LEFT JOIN customer_return_request_items i
-      ON r.request_id = i.request_id
-    WHERE r.status = 'pending'
-    GROUP BY
-        r.request_id,
-        r.customer_name,
-        r.selected_shipping_batch,
-        r.delivery_method,
-        r.total_count,
-        r.total_weight,
-        r.estimated_fee,
-        r.status,
-        r.created_at
-    ORDER BY r.created_at DESC, r.request_id DESC
-    """
-    return read_sql_df(sql, conn)
 
+def sync_members_from_orders(conn):
+    """把新訂單的客戶補進 members；回傳新增會員數。
 
-def load_request_items(conn, request_id):
-    sql = """
-    SELECT
-        i.order_id,
-        o.order_time,
-        o.customer_name,
-        o.platform,
-        o.tracking_number,
-        o.amount_rmb,
-        o.weight_kg,
-        o.is_arrived,
-        o.is_returned,
-        o.remarks
-    FROM customer_return_request_items i
-    LEFT JOIN orders o ON i.order_id = o.order_id
-    WHERE i.request_id = %s
-    ORDER BY i.order_id ASC
+    平常只掃水位附近的訂單：AUTO_INCREMENT 先拿到較小 id、卻比較晚提交的訂單，讀 MAX(order_id) 時還看不到，
+    所以每次從水位往回重掃 MEMBER_SYNC_OVERLAP 個 id（INSERT IGNORE，重掃無害）。
+    改過 customer_name 的舊訂單落在範圍外，靠每 MEMBER_FULL_SYNC_SECONDS 一次的全表補同步補上。
     """
-    return read_sql_df(sql, conn, params=[request_id])
-
-
-def mark_return_request_processed(conn, request_ids):
-    if not request_ids:
-        return
-    placeholders = ",".join(["%s"] * len(request_ids))
-    sql = f"UPDATE customer_return_requests SET status='processed' WHERE request_id IN ({placeholders})"
     with conn.cursor() as cur:
-        cur.execute(sql, request_ids)
-    conn.commit()
-
-
-def mark_return_request_cancelled(conn, request_ids):
-    if not request_ids:
-        return
-    placeholders = ",".join(["%s"] * len(request_ids))
-    sql = f"UPDATE customer_return_requests SET status='cancelled' WHERE request_id IN ({placeholders})"
-    with conn.cursor() as cur:
-        cur.execute(sql, request_ids)
+        cur.execute(
+            "SELECT setting_key, setting_value FROM site_settings WHERE setting_key IN (%s, %s)",
+            (MEMBER_SYNC_KEY, MEMBER_FULL_SYNC_KEY)
+        )
+        settings = {k: str(v or "") for k, v in cur.fetchall()}
+        last_id = int(settings[MEMBER_SYNC_KEY]) if settings.get(MEMBER_SYNC_KEY, "").isdigit() else 0
+        full_at = int(settings[MEMBER_FULL_SYNC_KEY]) if settings.get(MEMBER_FULL_SYNC_KEY, "").isdigit() else 0
+
+        cur.execute("SELECT COALESCE(MAX(order_id), 0) FROM orders")
+        max_id = int(cur.fetchone()[0])
+
+        now = int(time.time())
+        saved = [(MEMBER_SYNC_KEY, str(max(max_id, last_id)))]
+        if now - full_at >= MEMBER_FULL_SYNC_SECONDS:
+            cur.execute(_MEMBER_INSERT_SQL.format(range=""))
+            saved.append((MEMBER_FULL_SYNC_KEY, str(now)))
+        else:
+            cur.execute(
+                _MEMBER_INSERT_SQL.format(range="\n      AND order_id > %s"),
+                (max(last_id - MEMBER_SYNC_OVERLAP, 0),)
+            )
+        added = cur.rowcount
+
+        cur.executemany("""
+            INSERT INTO site_settings (setting_key, setting_value)
+            VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE setting_value = VALUES(setting_value)
+        """, saved)
+    if added:
+        bump_versions(conn, "members")
     conn.commit()
-    
-
-# ===
-# ===== 延後 / 已通知：用 remarks 的 tag（不改 DB 結構） =====
-
-DELAY_TAG  = "[延後]"
-NOTIFY_TAG = "[已通知]"
-
-def has_delay_tag(remarks: str) -> bool:
-    s = "" if remarks is None else str(remarks)
-    return DELAY_TAG in s
-
-def has_notify_tag(remarks: str) -> bool:
-    s = "" if remarks is None else str(remarks)
-    return NOTIFY_TAG in s
-
-def add_delay_tag_sql(order_ids):
-    placeholders = ",".join(["%s"] * len(order_ids))
-    sql = f"""
-    UPDATE orders
-    SET remarks = CASE
-        WHEN remarks IS NULL OR remarks = '' THEN %s
-        WHEN remarks LIKE %s THEN remarks
-        ELSE CONCAT(remarks, ' ', %s)
-    END
-    WHERE order_id IN ({placeholders})
-    """
-    params = [DELAY_TAG, f"%{DELAY_TAG}%", DELAY_TAG] + list(order_ids)
-    return sql, params
-
-def remove_delay_tag_sql(order_ids):
-    placeholders = ",".join(["%s"] * len(order_ids))
-    sql = f"""
-    UPDATE orders
-    SET remarks = TRIM(REPLACE(COALESCE(remarks,''), %s, ''))
-    WHERE order_id IN ({placeholders})
-    """
-    params = [DELAY_TAG] + list(order_ids)
-    return sql, params
-
-def add_notify_tag_sql(order_ids):
-    placeholders = ",".join(["%s"] * len(order_ids))
-    sql = f"""
-    UPDATE orders
-    SET remarks = CASE
-        WHEN remarks IS NULL OR remarks = '' THEN %s
-        WHEN remarks LIKE %s THEN remarks
-        ELSE CONCAT(remarks, ' ', %s)
-    END
-    WHERE order_id IN ({placeholders})
-    """
-    params = [NOTIFY_TAG, f"%{NOTIFY_TAG}%", NOTIFY_TAG] + list(order_ids)
-    return sql, params
-
-def remove_notify_tag_sql(order_ids):
-    placeholders = ",".join(["%s"] * len(order_ids))
-    sql = f"""
-    UPDATE orders
-    SET remarks = TRIM(REPLACE(COALESCE(remarks,''), %s, ''))
-    WHERE order_id IN ({placeholders})
-    """
-    params = [NOTIFY_TAG] + list(order_ids)
-    return sql, params
-
+    return added
 
-#
 
-def round_weight(w):
-    if w < 0.1:
-        return 0.1
-    # math.ceil(x) * 0.05 會往上進位到最近的 0.05
-    return round(math.ceil(w / 0.05) * 0.05, 2)
-
-# ===== 表格格式化工具：欄位改中文＋布林值轉 ✔ / ✘ =====
+# ===== 表格格式化工具：欄位改中文＋布林值轉 ✔ / ✘（table_format.py，整欄處理）=====
 def format_order_df(df):
-    column_mapping = {
-        "order_id": "訂單編號",
-        "order_time": "下單日期",
-        "customer_name": "客戶姓名",
-        "platform": "平台",
-        "tracking_number": "包裹單號",
-        "amount_rmb": "金額（人民幣）",
-        "amount_twd": "應付款項（台幣）",
-        "weight_kg": "公斤數",
-        "is_arrived": "是否到貨",
-        "is_returned": "是否已運回",
-        "is_early_returned": "提前運回",
-        "service_fee": "代購手續費",
-        "payment_method": "付款方式",
-        "payment_status": "付款狀態",
-        "paid_amount": "已付款金額",
-        "paid_at": "付款時間",
-        "payment_note": "付款備註",
-        "remarks": "備註",
-        "匯率價差利潤": "匯率價差利潤",
-        "代購手續費收入": "代購手續費收入",
-        "總利潤": "總利潤"
-    }
-    df = df.rename(columns=column_mapping)
-    if "是否到貨" in df.columns:
-        df["是否到貨"] = df["是否到貨"].apply(lambda x: "✔" if x else "✘")
-    if "是否已運回" in df.columns:
-        df["是否已運回"] = df["是否已運回"].apply(lambda x: "✔" if x else "✘")
-    if "提前運回" in df.columns:
-        df["提前運回"] = df["提前運回"].apply(lambda x: "✔" if x else "✘")
-    return df
+    with trace_span("format_order_df"):
+        return order_table(df)
 
 # ===== 資料庫連線 =====
 
-conn = mysql.connector.connect(
-    host=st.secrets["mysql"]["host"],
-    port=int(st.secrets["mysql"]["port"]),
-    user=st.secrets["mysql"]["user"],
-    password=st.secrets["mysql"]["password"],
-    database=st.secrets["mysql"]["database"],
-    charset="utf8mb4",
-    connection_timeout=10,
-    use_pure=True,
-)
-
-cursor = conn.cursor()
-cursor.execute("SET time_zone = '+08:00'")
-cursor.close()
-
-if "schema_inited" not in st.session_state:
+# 每次 rerun 從連線池借一條連線，整個腳本包在 try/finally 裡，結束時一定歸還（db_pool.rerun_connection）；
+# 時區在建立實體連線時設定一次；不再強制 use_pure，預設走 C extension（secrets 可設 use_pure = true 改回）。
+conn = rerun_connection()
+try:
+    # 資料表版本檢查：每個程序只做一次（migrations.py），不再每個 session 跑一輪 DDL
     try:
-        ensure_return_request_tables(conn)
-        ensure_frontend_config_tables(conn)
-        ensure_forwarding_register_table(conn)
-        ensure_members_table(conn)
-        sync_members_from_orders(conn)
-
-        st.session_state["schema_inited"] = True
+        ensure_schema()
     except Exception as e:
         st.error(f"初始化資料表失敗：{e}")
         st.stop()
 
-st.success("✅ DB connected")
+    if "schema_inited" not in st.session_state:
+        try:
+            sync_members_from_orders(conn)
+            st.session_state["schema_inited"] = True
+        except Exception as e:
+            st.error(f"同步會員資料失敗：{e}")
+            st.stop()
+
+    st.success("✅ DB connected")
 
 
 
     
-#歷史名字搜尋
+    #歷史名字搜尋
 
-def get_customer_names(conn):
-    df = read_sql_df("""
+    @cached_query("orders")
+    def get_customer_names(conn):
+        df = read_sql_df("""
         SELECT DISTINCT customer_name
         FROM orders
         WHERE customer_name IS NOT NULL AND customer_name <> ''
         ORDER BY customer_name
     """, conn)
-    return df["customer_name"].tolist()
-
-
-def load_dashboard_stats(conn):
-    """讀取後台首頁營運儀表板統計資料。"""
-    stats = {
-        "total_members": 0,
-        "line_bound": 0,
-        "binding_rate": 0.0,
-        "month_orders": 0,
-        "ready_count": 0,
-        "ready_weight": 0.0,
-    }
+        return df["customer_name"].tolist()
 
-    try:
-        df = read_sql_df("""
-            SELECT
-                COUNT(*) AS total_members,
-                SUM(
-                    CASE
-                        WHEN line_user_id IS NOT NULL AND TRIM(line_user_id) <> ''
-                        THEN 1 ELSE 0
-                    END
-                ) AS line_bound
-            FROM members
-        """, conn)
-
-        if not df.empty:
-            stats["total_members"] = int(df.loc[0, "total_members"] or 0)
-            stats["line_bound"] = int(df.loc[0, "line_bound"] or 0)
-            if stats["total_members"] > 0:
-                stats["binding_rate"] = stats["line_bound"] / stats["total_members"] * 100
-    except Exception:
-        pass
 
-    try:
-        df = read_sql_df("""
-            SELECT COUNT(*) AS month_orders
-            FROM orders
-            WHERE YEAR(order_time) = YEAR(CURDATE())
-              AND MONTH(order_time) = MONTH(CURDATE())
-              AND platform <> '集運'
-        """, conn)
-
-        if not df.empty:
-            stats["month_orders"] = int(df.loc[0, "month_orders"] or 0)
-    except Exception:
-        pass
+    def render_dashboard_cards(conn):
+        """後台首頁 KPI 卡片。"""
+        stats = load_dashboard_stats(conn)
 
-    try:
-        df = read_sql_df("""
-            SELECT
-                COUNT(*) AS ready_count,
-                COALESCE(SUM(weight_kg), 0) AS ready_weight
-            FROM orders
-            WHERE is_arrived = 1
-              AND (is_returned = 0 OR is_returned IS NULL)
-        """, conn)
-
-        if not df.empty:
-            stats["ready_count"] = int(df.loc[0, "ready_count"] or 0)
-            stats["ready_weight"] = float(df.loc[0, "ready_weight"] or 0)
-    except Exception:
-        pass
-
-    return stats
-
-
-def render_dashboard_cards(conn):
-    """後台首頁 KPI 卡片。"""
-    stats = load_dashboard_stats(conn)
+        st.markdown("### 📊 營運儀表板")
 
-    st.markdown("### 📊 營運儀表板")
+        c1, c2, c3 = st.columns(3)
+        c1.metric("👥 會員總數", f"{stats['total_members']:,}")
+        c2.metric("🔗 LINE已綁定", f"{stats['line_bound']:,}")
+        c3.metric("📈 綁定率", f"{stats['binding_rate']:.1f}%")
 
-    c1, c2, c3 = st.columns(3)
-    c1.metric("👥 會員總數", f"{stats['total_members']:,}")
-    c2.metric("🔗 LINE已綁定", f"{stats['line_bound']:,}")
-    c3.metric("📈 綁定率", f"{stats['binding_rate']:.1f}%")
+        c4, c5 = st.columns(2)
+        c4.metric("📦 本月訂單", f"{stats['month_orders']:,}")
+        c5.metric("🚚 可運回包裹", f"{stats['ready_count']:,} 件", f"{stats['ready_weight']:.2f} kg")
 
-    c4, c5 = st.columns(2)
-    c4.metric("📦 本月訂單", f"{stats['month_orders']:,}")
-    c5.metric("🚚 可運回包裹", f"{stats['ready_count']:,} 件", f"{stats['ready_weight']:.2f} kg")
-
-    st.divider()
+        st.divider()
 
 
-cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True)
 
 
-st.title("🐾 橘貓代購｜訂單管理系統")
+    st.title("🐾 橘貓代購｜訂單管理系統")
 
-render_dashboard_cards(conn)
+    render_dashboard_cards(conn)
 
-# ===== 側邊功能選單 =====
-menu = st.sidebar.selectbox("功能選單", ["🏠 首頁", 
-    "📋 訂單總表", "🧾 新增訂單", "✏️ 編輯訂單",
-    "🔍 搜尋訂單", "📦 可出貨名單", "📥 貼上入庫訊息",
-    "🚚 批次出貨", "💰 利潤報表/匯出", "💴 快速報價",
-    "👤 會員管理",
-    "📢 前台公告管理", "📮 集運登記管理", "📮 匿名回饋管理"
-])
+    # ===== 側邊功能選單 =====
+    menu = st.sidebar.selectbox("功能選單", ["🏠 首頁", 
+        "📋 訂單總表", "🧾 新增訂單", "✏️ 編輯訂單",
+        "🔍 搜尋訂單", "📦 可出貨名單", "📥 貼上入庫訊息",
+        "🚚 批次出貨", "💰 利潤報表/匯出", "💴 快速報價",
+        "👤 會員管理",
+        "📢 前台公告管理", "📮 集運登記管理", "📮 匿名回饋管理"
+    ])
 
-# ===== 功能實作 =====
+    # ===== 功能實作 =====
 
-# 首頁
-if menu == "🏠 首頁":
-    st.subheader("🏠 後台首頁")
-    st.info("請從左側功能選單選擇功能。")
+    # 首頁
+    if menu == "🏠 首頁":
+        st.subheader("🏠 後台首頁")
+        st.info("請從左側功能選單選擇功能。")
 
-# 1. 訂單總表
-elif menu == "📋 訂單總表":
-    st.subheader("📋 訂單總表")
-    df = read_sql_df("""
+    # 1. 訂單總表
+    elif menu == "📋 訂單總表":
+        st.subheader("📋 訂單總表")
+        df = read_sql_df("""
         SELECT order_id,order_time,customer_name,platform,tracking_number,
         amount_rmb,service_fee,weight_kg,is_arrived,is_returned,is_early_returned,remarks
         FROM orders
         ORDER BY order_id DESC
         LIMIT 1000
     """, conn)
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        arrived_filter = st.selectbox("是否到貨", ["全部", "是", "否"])
-    with col2:
-        returned_filter = st.selectbox("是否已運回", ["全部", "是", "否"])
-    with col3:
-        platform_filter = st.selectbox("平台", ["全部", "集運", "拼多多", "淘寶", "閒魚", "1688", "微店", "小紅書", "抖音", "京東", "得物"])
-    if arrived_filter != "全部":
-        df = df[df["is_arrived"] == (arrived_filter == "是")]
-    if returned_filter != "全部":
-        df = df[df["is_returned"] == (returned_filter == "是")]
-    if platform_filter != "全部":
-        df = df[df["platform"] == platform_filter]
-    df = format_order_df(df)
-    st.dataframe(df)
-
-
-# 2. 新增訂單
-elif menu == "🧾 新增訂單":
-
-    st.subheader("🧾 新增訂單")
-
-    if st.session_state.get("flash_toast"):
-        st.toast(st.session_state["flash_toast"])
-        st.session_state["flash_toast"] = None
-
-    st.session_state.setdefault("add_platform", "集運")
-
-    def sync_service_fee():
-        platform_now = st.session_state.get("add_platform", "集運")
-        amount_now = float(st.session_state.get("add_amount_rmb", 0.0) or 0.0)
-        name_now = (st.session_state.get("add_name") or "").strip()
-
-        member_level = get_member_level(conn, name_now) if name_now else "一般會員"
-        st.session_state["add_service_fee"] = calc_service_fee(amount_now, member_level, platform_now)
-
-    # 第一次進來先算預設手續費
-    default_fee = calc_service_fee(
-        float(st.session_state.get("add_amount_rmb", 0.0) or 0.0),
-        get_member_level(conn, (st.session_state.get("add_name") or "").strip()) if (st.session_state.get("add_name") or "").strip() else "一般會員",
-        st.session_state["add_platform"]
-    )
-
-    defaults = {
-        "add_tracking_number": "",
-        "add_amount_rmb": 0.0,
-        "add_service_fee": default_fee,
-        "add_weight_kg": 0.0,
-        "add_is_arrived": False,
-        "add_is_returned": False,
-        "add_remarks": "",
-    }
-    for k, v in defaults.items():
-        st.session_state.setdefault(k, v)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            arrived_filter = st.selectbox("是否到貨", ["全部", "是", "否"])
+        with col2:
+            returned_filter = st.selectbox("是否已運回", ["全部", "是", "否"])
+        with col3:
+            platform_filter = st.selectbox("平台", ["全部", "集運", "拼多多", "淘寶", "閒魚", "1688", "微店", "小紅書", "抖音", "京東", "得物"])
+        if arrived_filter != "全部":
+            df = df[df["is_arrived"] == (arrived_filter == "是")]
+        if returned_filter != "全部":
+            df = df[df["is_returned"] == (returned_filter == "是")]
+        if platform_filter != "全部":
+            df = df[df["platform"] == platform_filter]
+        df = format_order_df(df)
+        st.dataframe(df)
+
+
+    # 2. 新增訂單
+    elif menu == "🧾 新增訂單":
+
+        st.subheader("🧾 新增訂單")
+
+        if st.session_state.get("flash_toast"):
+            st.toast(st.session_state["flash_toast"])
+            st.session_state["flash_toast"] = None
+
+        st.session_state.setdefault("add_platform", "集運")
+
+        def sync_service_fee():
+            platform_now = st.session_state.get("add_platform", "集運")
+            amount_now = float(st.session_state.get("add_amount_rmb", 0.0) or 0.0)
+            name_now = (st.session_state.get("add_name") or "").strip()
+
+            # callback 在下一輪腳本開始前執行，這一輪的 conn 已歸還，另外借一條
+            if name_now:
+                with get_connection() as member_conn:
+                    member_level = get_member_level(member_conn, name_now)
+            else:
+                member_level = "一般會員"
+            st.session_state["add_service_fee"] = calc_service_fee(amount_now, member_level, platform_now)
 
-    st.session_state.setdefault("add_order_time", datetime.today().date())
+        # 第一次進來先算預設手續費
+        default_fee = calc_service_fee(
+            float(st.session_state.get("add_amount_rmb", 0.0) or 0.0),
+            get_member_level(conn, (st.session_state.get("add_name") or "").strip()) if (st.session_state.get("add_name") or "").strip() else "一般會員",
+            st.session_state["add_platform"]
+        )
 
-    if st.session_state.get("clear_add_name"):
-        st.session_state["add_name"] = ""
-        st.session_state["clear_add_name"] = False
+        defaults = {
+            "add_tracking_number": "",
+            "add_amount_rmb": 0.0,
+            "add_service_fee": default_fee,
+            "add_weight_kg": 0.0,
+            "add_is_arrived": False,
+            "add_is_returned": False,
+            "add_remarks": "",
+        }
+        for k, v in defaults.items():
+            st.session_state.setdefault(k, v)
+
+        st.session_state.setdefault("add_order_time", datetime.today().date())
+
+        if st.session_state.get("clear_add_name"):
+            st.session_state["add_name"] = ""
+            st.session_state["clear_add_name"] = False
+
+        if st.session_state.get("clear_add_fields"):
+            st.session_state["add_tracking_number"] = ""
+            st.session_state["add_amount_rmb"] = 0.0
+
+            name_now = (st.session_state.get("add_name") or "").strip()
+            member_level = get_member_level(conn, name_now) if name_now else "一般會員"
+            st.session_state["add_service_fee"] = calc_service_fee(
+                float(st.session_state.get("add_amount_rmb", 0.0) or 0.0),
+                member_level,
+                st.session_state.get("add_platform", "集運")
+            )
 
-    if st.session_state.get("clear_add_fields"):
-        st.session_state["add_tracking_number"] = ""
-        st.session_state["add_amount_rmb"] = 0.0
+            st.session_state["add_weight_kg"] = 0.0
+            st.session_state["add_is_arrived"] = False
+            st.session_state["add_is_returned"] = False
+            st.session_state["add_remarks"] = ""
+            st.session_state["clear_add_fields"] = False
 
-        name_now = (st.session_state.get("add_name") or "").strip()
-        member_level = get_member_level(conn, name_now) if name_now else "一般會員"
-        st.session_state["add_service_fee"] = calc_service_fee(
-            float(st.session_state.get("add_amount_rmb", 0.0) or 0.0),
-            member_level,
-            st.session_state.get("add_platform", "集運")
-        )
+        quick_submit = st.sidebar.button("✅ 新增訂單", use_container_width=True)
 
-        st.session_state["add_weight_kg"] = 0.0
-        st.session_state["add_is_arrived"] = False
-        st.session_state["add_is_returned"] = False
-        st.session_state["add_remarks"] = ""
-        st.session_state["clear_add_fields"] = False
+        name_options = get_customer_names(conn)
 
-    quick_submit = st.sidebar.button("✅ 新增訂單", use_container_width=True)
+        with st.container(border=True):
+            st.markdown("#### 客戶姓名")
 
-    name_options = get_customer_names(conn)
+            st.session_state.setdefault("keep_last_name", True)
 
-    with st.container(border=True):
-        st.markdown("#### 客戶姓名")
+            c1, c2 = st.columns([3, 1])
+            with c1:
+                st.toggle("新增後保留此客戶姓名", key="keep_last_name")
+            with c2:
+                if st.button("🧹 清空姓名", use_container_width=True):
+                    st.session_state["clear_add_name"] = True
+                    st.rerun()
 
-        st.session_state.setdefault("keep_last_name", True)
+            st.text_input(
+                "輸入姓名",
+                key="add_name",
+                label_visibility="collapsed",
+                placeholder="請輸入客戶名稱",
+                on_change=sync_service_fee
+            )
 
-        c1, c2 = st.columns([3, 1])
-        with c1:
-            st.toggle("新增後保留此客戶姓名", key="keep_last_name")
-        with c2:
-            if st.button("🧹 清空姓名", use_container_width=True):
-                st.session_state["clear_add_name"] = True
-                st.rerun()
+            q = (st.session_state.get("add_name") or "").strip().lower()
+            if q:
+                suggestions = [n for n in name_options if n.lower().startswith(q)][:8]
+                if suggestions:
+                    st.caption("點一下直接帶入")
+                    cols = st.columns(min(4, len(suggestions)))
+
+                    def _pick(n):
+                        st.session_state["add_name"] = n
+                        with get_connection() as member_conn:
+                            member_level = get_member_level(member_conn, n)
+                        st.session_state["add_service_fee"] = calc_service_fee(
+                            float(st.session_state.get("add_amount_rmb", 0.0) or 0.0),
+                            member_level,
+                            st.session_state.get("add_platform", "集運")
+                        )
+
+                    for i, s in enumerate(suggestions):
+                        cols[i % len(cols)].button(
+                            s,
+                            key=f"namepick_{i}",
+                            use_container_width=True,
+                            on_click=_pick,
+                            args=(s,)
+                        )
+            else:
+                st.caption("請輸入任一字母/文字")
 
-        st.text_input(
-            "輸入姓名",
-            key="add_name",
-            label_visibility="collapsed",
-            placeholder="請輸入客戶名稱",
+        order_time = st.date_input("下單日期", key="add_order_time")
+
+        platform = st.selectbox(
+            "下單平台",
+            ["集運", "拼多多", "淘寶", "閒魚", "1688", "微店", "小紅書", "抖音", "京東", "得物"],
+            key="add_platform",
             on_change=sync_service_fee
         )
 
-        q = (st.session_state.get("add_name") or "").strip().lower()
-        if q:
-            suggestions = [n for n in name_options if n.lower().startswith(q)][:8]
-            if suggestions:
-                st.caption("點一下直接帶入")
-                cols = st.columns(min(4, len(suggestions)))
-
-                def _pick(n):
-                    st.session_state["add_name"] = n
-                    member_level = get_member_level(conn, n)
-                    st.session_state["add_service_fee"] = calc_service_fee(
-                        float(st.session_state.get("add_amount_rmb", 0.0) or 0.0),
-                        member_level,
-                        st.session_state.get("add_platform", "集運")
-                    )
+        tracking_number = st.text_input("包裹單號", key="add_tracking_number")
 
-                for i, s in enumerate(suggestions):
-                    cols[i % len(cols)].button(
-                        s,
-                        key=f"namepick_{i}",
-                        use_container_width=True,
-                        on_click=_pick,
-                        args=(s,)
-                    )
-        else:
-            st.caption("請輸入任一字母/文字")
-
-    order_time = st.date_input("下單日期", key="add_order_time")
-
-    platform = st.selectbox(
-        "下單平台",
-        ["集運", "拼多多", "淘寶", "閒魚", "1688", "微店", "小紅書", "抖音", "京東", "得物"],
-        key="add_platform",
-        on_change=sync_service_fee
-    )
-
-    tracking_number = st.text_input("包裹單號", key="add_tracking_number")
-
-    amount_rmb = st.number_input(
-        "訂單金額（人民幣）",
-        min_value=0.0,
-        step=1.0,
-        key="add_amount_rmb",
-        on_change=sync_service_fee
-    )
-
-    service_fee = st.number_input("代購手續費（NT$）", min_value=0.0, step=10.0, key="add_service_fee")
-    weight_kg = st.number_input("包裹公斤數", min_value=0.0, step=0.1, key="add_weight_kg")
-
-    # 顯示目前會員等級與手續費說明
-    current_name = (st.session_state.get("add_name") or "").strip()
-    current_level = get_member_level(conn, current_name) if current_name else "一般會員"
-    st.caption(f"目前會員等級：{current_level}｜目前自動計算手續費：NT$ {float(st.session_state.get('add_service_fee', 0)):.0f}")
-
-    cA, cB = st.columns(2)
-    with cA:
-        is_arrived = st.checkbox("已到貨", key="add_is_arrived")
-    with cB:
-        is_returned = st.checkbox("已運回", key="add_is_returned")
-
-    with st.expander("備註（可選）", expanded=False):
-        remarks = st.text_area("備註", key="add_remarks")
-
-    submit_main = st.button("✅ 新增訂單", use_container_width=True)
-
-    if quick_submit or submit_main:
-        name_to_save = (st.session_state.get("add_name") or "").strip()
-        if not name_to_save:
-            st.error("⚠️ 請輸入客戶姓名")
-        else:
-            # 送出前再重新算一次，避免手動漏更新
-            member_level = get_member_level(conn, name_to_save)
-            final_service_fee = calc_service_fee(float(amount_rmb), member_level, platform)
+        amount_rmb = st.number_input(
+            "訂單金額（人民幣）",
+            min_value=0.0,
+            step=1.0,
+            key="add_amount_rmb",
+            on_change=sync_service_fee
+        )
+
+        service_fee = st.number_input("代購手續費（NT$）", min_value=0.0, step=10.0, key="add_service_fee")
+        weight_kg = st.number_input("包裹公斤數", min_value=0.0, step=0.1, key="add_weight_kg")
+
+        # 顯示目前會員等級與手續費說明
+        current_name = (st.session_state.get("add_name") or "").strip()
+        current_level = get_member_level(conn, current_name) if current_name else "一般會員"
+        st.caption(f"目前會員等級：{current_level}｜目前自動計算手續費：NT$ {float(st.session_state.get('add_service_fee', 0)):.0f}")
+
+        cA, cB = st.columns(2)
+        with cA:
+            is_arrived = st.checkbox("已到貨", key="add_is_arrived")
+        with cB:
+            is_returned = st.checkbox("已運回", key="add_is_returned")
+
+        with st.expander("備註（可選）", expanded=False):
+            remarks = st.text_area("備註", key="add_remarks")
 
-            cursor.execute(
-                """
+        submit_main = st.button("✅ 新增訂單", use_container_width=True)
+
+        if quick_submit or submit_main:
+            name_to_save = (st.session_state.get("add_name") or "").strip()
+            if not name_to_save:
+                st.error("⚠️ 請輸入客戶姓名")
+            else:
+                # 送出前再重新算一次，避免手動漏更新
+                member_level = get_member_level(conn, name_to_save)
+                final_service_fee = calc_service_fee(float(amount_rmb), member_level, platform)
+
+                cursor.execute(
+                    """
                 INSERT INTO orders 
                   (order_time, customer_name, platform, tracking_number,
                    amount_rmb, weight_kg, is_arrived, is_returned,
                    service_fee, remarks)
                 VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
                 """,
-                (
-                    order_time,
-                    name_to_save,
-                    platform,
-                    tracking_number,
-                    float(amount_rmb),
-                    float(weight_kg),
-                    bool(is_arrived),
-                    bool(is_returned),
-                    float(final_service_fee),
-                    remarks
+                    (
+                        order_time,
+                        name_to_save,
+                        platform,
+                        tracking_number,
+                        float(amount_rmb),
+                        float(weight_kg),
+                        bool(is_arrived),
+                        bool(is_returned),
+                        float(final_service_fee),
+                        remarks
+                    )
                 )
-            )
 
-            cursor.execute("""
+                cursor.execute("""
                 INSERT IGNORE INTO members (customer_name)
                 VALUES (%s)
             """, (name_to_save,))
 
-            conn.commit()
-
-            st.cache_data.clear()
-
-            if not st.session_state.get("keep_last_name", True):
-                st.session_state["clear_add_name"] = True
-
-            st.session_state["clear_add_fields"] = True
-            st.session_state["flash_toast"] = "✅ 訂單已新增！"
-            st.rerun()
-
-
-# 3. 編輯訂單
-elif menu == "✏️ 編輯訂單":
-    st.subheader("✏️ 編輯訂單")
-
-    show_toast_once("toast_updated", "訂單已更新！", icon="✅")
-    show_toast_once("toast_deleted", "訂單已刪除！", icon="🗑")
-
-    st.caption("為避免一次載入全部訂單，預設只顯示最近 100 筆；輸入條件後可精準搜尋。")
-
-    # —— 搜尋條件 ——
-    c1, c2 = st.columns(2)
-    with c1:
-        id_search = st.text_input("🔢 搜尋訂單編號")
-        name_search = st.text_input("👤 搜尋客戶姓名")
-        amount_search = st.text_input("💰 搜尋訂單金額（人民幣）")
-    with c2:
-        tracking_search = st.text_input("📦 搜尋包裹單號")
-        date_search = st.date_input("📅 搜尋下單日期", value=None)
-        returned_filter = st.selectbox("📦 是否已運回", ["全部", "✔ 已運回", "✘ 未運回"])
-
-    query = """
-        SELECT
-            order_id,
-            order_time,
-            customer_name,
-            platform,
-            tracking_number,
-            amount_rmb,
-            service_fee,
-            weight_kg,
-            is_arrived,
-            is_returned,
-            is_early_returned,
-            remarks
-        FROM orders
-        WHERE 1=1
-    """
-    params = []
-    input_error = None
+                refresh_customers(conn, [name_to_save])
+                bump_versions(conn, "orders", "members")  # 只讓依賴訂單 / 會員的快取失效
+                conn.commit()
+                sync_members_from_orders(conn)  # 推進會員同步水位，下次開 session 不用再掃這筆
 
-    if id_search.strip():
-        try:
-            query += " AND order_id = %s"
-            params.append(int(id_search.strip()))
-        except ValueError:
-            input_error = "訂單編號只能輸入整數。"
+                if not st.session_state.get("keep_last_name", True):
+                    st.session_state["clear_add_name"] = True
+
+                st.session_state["clear_add_fields"] = True
+                st.session_state["flash_toast"] = "✅ 訂單已新增！"
+                st.rerun()
 
-    if name_search.strip():
-        query += " AND customer_name LIKE %s"
-        params.append(f"%{name_search.strip()}%")
 
-    if amount_search.strip():
-        try:
-            query += " AND amount_rmb = %s"
-            params.append(float(amount_search.strip()))
-        except ValueError:
-            input_error = "訂單金額只能輸入數字。"
+    # 3. 編輯訂單
+    elif menu == "✏️ 編輯訂單":
+        st.subheader("✏️ 編輯訂單")
 
-    if tracking_search.strip():
-        query += " AND tracking_number LIKE %s"
-        params.append(f"%{tracking_search.strip()}%")
+        show_toast_once("toast_updated", "訂單已更新！", icon="✅")
+        show_toast_once("toast_deleted", "訂單已刪除！", icon="🗑")
 
-    if date_search:
-        query += " AND DATE(order_time) = %s"
-        params.append(date_search)
+        st.caption("為避免一次載入全部訂單，預設只顯示最近 100 筆；輸入條件後可精準搜尋（姓名比對開頭，單號可輸入開頭或末幾碼）。")
 
-    if returned_filter == "✔ 已運回":
-        query += " AND is_returned = 1"
-    elif returned_filter == "✘ 未運回":
-        query += " AND (is_returned = 0 OR is_returned IS NULL)"
+        # —— 搜尋條件 ——
+        c1, c2 = st.columns(2)
+        with c1:
+            id_search = st.text_input("🔢 搜尋訂單編號")
+            name_search = st.text_input("👤 搜尋客戶姓名")
+            amount_search = st.text_input("💰 搜尋訂單金額（人民幣）")
+        with c2:
+            tracking_search = st.text_input("📦 搜尋包裹單號")
+            date_search = st.date_input("📅 搜尋下單日期", value=None)
+            returned_filter = st.selectbox("📦 是否已運回", ["全部", "✔ 已運回", "✘ 未運回"])
 
-    query += " ORDER BY order_id DESC LIMIT 100"
+        query, params, input_error = order_search_query(
+            id_search, name_search, amount_search, tracking_search, date_search,
+            returned={"✔ 已運回": True, "✘ 未運回": False}.get(returned_filter),
+        )
 
-    if input_error:
-        st.warning(input_error)
-        df_raw = pd.DataFrame()
-    else:
-        try:
-            df_raw = read_sql_df(query, conn, params=params)
-        except Exception as e:
-            st.error(f"讀取訂單失敗：{e}")
+        if input_error:
+            st.warning(input_error)
             df_raw = pd.DataFrame()
+        else:
+            try:
+                df_raw = read_sql_df(query, conn, params=params)
+            except Exception as e:
+                st.error(f"讀取訂單失敗：{e}")
+                df_raw = pd.DataFrame()
 
-    if df_raw.empty:
-        st.info("目前沒有符合條件的訂單。")
-    else:
-        df_show = format_order_df(df_raw.copy())
-        st.dataframe(df_show, use_container_width=True, hide_index=True)
+        if df_raw.empty:
+            st.info("目前沒有符合條件的訂單。")
+        else:
+            df_show = format_order_df(df_raw.copy())
+            st.dataframe(df_show, use_container_width=True, hide_index=True)
 
-        edit_id = st.selectbox(
-            "選擇訂單編號",
-            df_raw["order_id"].astype(int).tolist(),
-            format_func=lambda x: f"訂單 #{x}",
-        )
-        rec = df_raw.loc[df_raw["order_id"].astype(int) == int(edit_id)].iloc[0]
-
-        platforms = ["集運", "拼多多", "淘寶", "閒魚", "1688", "微店", "小紅書", "抖音", "京東", "得物"]
-        current_platform = str(rec.get("platform") or "集運")
-        platform_index = platforms.index(current_platform) if current_platform in platforms else 0
-
-        raw_order_time = pd.to_datetime(rec.get("order_time"), errors="coerce")
-        default_order_date = raw_order_time.date() if pd.notna(raw_order_time) else datetime.today().date()
-
-        amount_value = pd.to_numeric(pd.Series([rec.get("amount_rmb")]), errors="coerce").fillna(0).iloc[0]
-        service_fee_value = pd.to_numeric(pd.Series([rec.get("service_fee")]), errors="coerce").fillna(0).iloc[0]
-        weight_value = pd.to_numeric(pd.Series([rec.get("weight_kg")]), errors="coerce").fillna(0).iloc[0]
-
-        with st.form("edit_form"):
-            order_time = st.date_input("下單日期", value=default_order_date)
-            name = st.text_input("客戶姓名", value=str(rec.get("customer_name") or ""))
-            platform = st.selectbox("平台", platforms, index=platform_index)
-            tracking_number = st.text_input("包裹單號", value=str(rec.get("tracking_number") or ""))
-            amount_rmb = st.number_input("訂單金額（人民幣）", min_value=0.0, value=float(amount_value), step=1.0)
-            service_fee = st.number_input("代購手續費（NT$）", min_value=0.0, value=float(service_fee_value), step=1.0)
-            weight_kg = st.number_input("包裹公斤數", min_value=0.0, value=float(weight_value), step=0.05)
-            is_arrived = st.checkbox("已到貨", value=bool(rec.get("is_arrived") or False))
-            is_returned = st.checkbox("已運回", value=bool(rec.get("is_returned") or False))
-            is_early_returned = st.checkbox("提前運回", value=bool(rec.get("is_early_returned") or False))
-            remarks = st.text_area("備註", value=str(rec.get("remarks") or ""))
-            save = st.form_submit_button("💾 儲存修改", use_container_width=True)
-
-        if save:
-            if not name.strip():
-                st.error("客戶姓名不可空白。")
-            else:
-                try:
-                    with conn.cursor() as cur:
-                        cur.execute(
-                            """
+            edit_id = st.selectbox(
+                "選擇訂單編號",
+                df_raw["order_id"].astype(int).tolist(),
+                format_func=lambda x: f"訂單 #{x}",
+            )
+            rec = df_raw.loc[df_raw["order_id"].astype(int) == int(edit_id)].iloc[0]
+
+            platforms = ["集運", "拼多多", "淘寶", "閒魚", "1688", "微店", "小紅書", "抖音", "京東", "得物"]
+            current_platform = str(rec.get("platform") or "集運")
+            platform_index = platforms.index(current_platform) if current_platform in platforms else 0
+
+            raw_order_time = pd.to_datetime(rec.get("order_time"), errors="coerce")
+            default_order_date = raw_order_time.date() if pd.notna(raw_order_time) else datetime.today().date()
+
+            amount_value = pd.to_numeric(pd.Series([rec.get("amount_rmb")]), errors="coerce").fillna(0).iloc[0]
+            service_fee_value = pd.to_numeric(pd.Series([rec.get("service_fee")]), errors="coerce").fillna(0).iloc[0]
+            weight_value = pd.to_numeric(pd.Series([rec.get("weight_kg")]), errors="coerce").fillna(0).iloc[0]
+
+            with st.form("edit_form"):
+                order_time = st.date_input("下單日期", value=default_order_date)
+                name = st.text_input("客戶姓名", value=str(rec.get("customer_name") or ""))
+                platform = st.selectbox("平台", platforms, index=platform_index)
+                tracking_number = st.text_input("包裹單號", value=str(rec.get("tracking_number") or ""))
+                amount_rmb = st.number_input("訂單金額（人民幣）", min_value=0.0, value=float(amount_value), step=1.0)
+                service_fee = st.number_input("代購手續費（NT$）", min_value=0.0, value=float(service_fee_value), step=1.0)
+                weight_kg = st.number_input("包裹公斤數", min_value=0.0, value=float(weight_value), step=0.05)
+                is_arrived = st.checkbox("已到貨", value=bool(rec.get("is_arrived") or False))
+                is_returned = st.checkbox("已運回", value=bool(rec.get("is_returned") or False))
+                is_early_returned = st.checkbox("提前運回", value=bool(rec.get("is_early_returned") or False))
+                remarks = st.text_area("備註", value=str(rec.get("remarks") or ""))
+                save = st.form_submit_button("💾 儲存修改", use_container_width=True)
+
+            if save:
+                if not name.strip():
+                    st.error("客戶姓名不可空白。")
+                else:
+                    try:
+                        with conn.cursor() as cur:
+                            cur.execute(
+                                """
                             UPDATE orders SET
                                 order_time = %s,
                                 customer_name = %s,
@@ -1094,1099 +591,931 @@ elif menu == "✏️ 編輯訂單":
                                 remarks = %s
                             WHERE order_id = %s
                             """,
-                            (
-                                order_time,
-                                name.strip(),
-                                platform,
-                                tracking_number.strip(),
-                                float(amount_rmb),
-                                float(weight_kg),
-                                int(bool(is_arrived)),
-                                int(bool(is_returned)),
-                                int(bool(is_early_returned)),
-                                float(service_fee),
-                                remarks,
-                                int(edit_id),
-                            ),
-                        )
+                                (
+                                    order_time,
+                                    name.strip(),
+                                    platform,
+                                    tracking_number.strip(),
+                                    float(amount_rmb),
+                                    float(weight_kg),
+                                    int(bool(is_arrived)),
+                                    int(bool(is_returned)),
+                                    int(bool(is_early_returned)),
+                                    float(service_fee),
+                                    remarks,
+                                    int(edit_id),
+                                ),
+                            )
+                            # 改名不會產生新的 order_id，水位同步抓不到，這裡直接補會員
+                            cur.execute(
+                                "INSERT IGNORE INTO members (customer_name) VALUES (%s)",
+                                (name.strip(),)
+                            )
+                        refresh_customers(conn, [rec.get("customer_name"), name.strip()])  # 改名時新舊姓名都要重算
+                        bump_versions(conn, "orders", "members")
+                        conn.commit()
+                        st.session_state["toast_updated"] = True
+                        st.rerun()
+                    except Exception as e:
+                        conn.rollback()
+                        st.error(f"更新失敗：{e}")
+
+            st.divider()
+            confirm_del = st.checkbox("我確認要刪除這筆訂單", key=f"confirm_delete_{edit_id}")
+            if st.button("🗑 刪除此訂單", disabled=not confirm_del, use_container_width=True):
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("DELETE FROM orders WHERE order_id = %s LIMIT 1", (int(edit_id),))
+                    refresh_customers(conn, [rec.get("customer_name")])
+                    bump_versions(conn, "orders")
                     conn.commit()
-                    st.session_state["toast_updated"] = True
+                    st.session_state["toast_deleted"] = True
                     st.rerun()
                 except Exception as e:
                     conn.rollback()
-                    st.error(f"更新失敗：{e}")
+                    st.error(f"刪除失敗：{e}")
 
-        st.divider()
-        confirm_del = st.checkbox("我確認要刪除這筆訂單", key=f"confirm_delete_{edit_id}")
-        if st.button("🗑 刪除此訂單", disabled=not confirm_del, use_container_width=True):
-            try:
-                with conn.cursor() as cur:
-                    cur.execute("DELETE FROM orders WHERE order_id = %s LIMIT 1", (int(edit_id),))
-                conn.commit()
-                st.session_state["toast_deleted"] = True
-                st.rerun()
-            except Exception as e:
-                conn.rollback()
-                st.error(f"刪除失敗：{e}")
 
+    # 4. 搜尋訂單
 
-# 4. 搜尋訂單
+    elif menu == "🔍 搜尋訂單":
+        st.subheader("🔍 搜尋訂單")
 
-elif menu == "🔍 搜尋訂單":
-    st.subheader("🔍 搜尋訂單")
+        # 用文字框搜文字／數字／單號
+        kw_text = st.text_input("搜尋姓名/單號/金額/ID")
+        # 用日期選擇器搜日期
+        kw_date = st.date_input("搜尋下單日期", value=None)
 
-    # 用文字框搜文字／數字／單號
-    kw_text = st.text_input("搜尋姓名/單號/金額/ID")
-    # 用日期選擇器搜日期
-    kw_date = st.date_input("搜尋下單日期", value=None)
-
-    # 組 SQL
-    query  = "SELECT * FROM orders WHERE 1=1"
-    params = []
-
-    if kw_text:
-        query += " AND (customer_name LIKE %s OR tracking_number LIKE %s)"
-        params += [f"%{kw_text}%", f"%{kw_text}%"]
-        try:
-            num = float(kw_text)
-            query += " OR order_id = %s OR amount_rmb = %s"
-            params += [int(num), num]
-        except ValueError:
-            pass
-
-    if kw_date:
-        query += " AND order_time = %s"
-        params.append(kw_date)
-
-    # 讀出結果
-    df = read_sql_df(query, conn, params=params)
-    st.dataframe(format_order_df(df))
-
-
-# 5. 可出貨名單
-# 5. 可出貨名單
-elif menu == "📦 可出貨名單":
-    st.subheader("📦 可出貨名單")
-
-    tab1, tab2 = st.tabs(["系統判定可出貨", "前台送出的運回申請"])
-
-    # =========================
-    # TAB 1：保留原本可出貨名單
-    # =========================
-    with tab1:
-        df_all = read_sql_df("SELECT * FROM orders", conn)
-        if df_all.empty:
-            st.info("目前沒有任何訂單資料。")
-        else:
-            # 條件1：同一客戶所有訂單都已到貨
-            arrived_all = df_all.groupby("customer_name")["is_arrived"].all()
-            names_all_arrived = arrived_all[arrived_all].index.tolist()
-            cond1 = df_all["customer_name"].isin(names_all_arrived)
-
-            # 條件2：這筆訂單到貨且標記提前運回
-            cond2 = (df_all["is_arrived"] == True) & (df_all["is_early_returned"] == True)
-
-            # 排除「已運回」的訂單
-            not_returned = df_all["is_returned"] == False
-
-            # 最終篩選：符合 cond1 or cond2，且還沒運回
-            df = df_all[(cond1 | cond2) & not_returned].copy()
-
-            df["單號後四碼"] = df["tracking_number"].astype(str).str[-4:]
-            df_show_all = format_order_df(df.copy())
-            st.dataframe(df_show_all)
-
-            towrite_full = io.BytesIO()
-            df_show_all.to_excel(towrite_full, index=False, engine="openpyxl")
-            towrite_full.seek(0)
-            st.download_button(
-                label="📥 下載可出貨名單.xlsx（全部）",
-                data=towrite_full,
-                file_name="可出貨名單.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+        # 組 SQL
+        query  = "SELECT * FROM orders WHERE 1=1"
+        params = []
 
-            st.divider()
-
-            df["delayed_flag"]  = df["remarks"].apply(has_delay_tag)
-            df["notified_flag"] = df["remarks"].apply(has_notify_tag)
-
-            df_display = format_order_df(df.copy())
-
-            def row_tags(i):
-                tags = []
-                if df.loc[i, "delayed_flag"]:
-                    tags.append("⚠️ 延後")
-                if df.loc[i, "notified_flag"]:
-                    tags.append("📣 已通知")
-                return " / ".join(tags)
-
-            df_display.insert(1, "標記", [row_tags(i) for i in df.index])
-
-            if "✅ 選取" not in df_display.columns:
-                df_display.insert(0, "✅ 選取", False)
-
-            edited = st.data_editor(
-                df_display,
-                key="ready_editor",
-                hide_index=True,
-                disabled=[c for c in df_display.columns if c != "✅ 選取"],
-                use_container_width=True,
-                height=460,
-                column_config={
-                    "✅ 選取": st.column_config.CheckboxColumn("✅ 選取", help="勾選要下載/延後/已通知操作的訂單"),
-                },
-            )
-
-            picked_ids = df.loc[edited["✅ 選取"].values, "order_id"].tolist()
-
-            c1, c2, c3, c4, c5 = st.columns(5)
+        if kw_text.strip():
+            kw = kw_text.strip()
+            tracking_cond, tracking_params = tracking_condition(kw)
+            conds = ["customer_name LIKE %s", tracking_cond]
+            params += [like_prefix(kw)] + tracking_params
+            try:
+                num = float(kw)
+                conds += ["order_id = %s", "amount_rmb = %s"]
+                params += [int(num), num]
+            except ValueError:
+                pass
+            query += " AND (" + " OR ".join(conds) + ")"
+
+        if kw_date:
+            query += " AND order_time >= %s AND order_time < %s"
+            params += list(day_range(kw_date))
+
+        # 讀出結果
+        df = read_sql_df(query, conn, params=params)
+        st.dataframe(format_order_df(df))
+
+
+    # 5. 可出貨名單
+    # 5. 可出貨名單
+    elif menu == "📦 可出貨名單":
+        st.subheader("📦 可出貨名單")
+
+        if st.session_state.get("flash_toast"):
+            st.toast(st.session_state["flash_toast"])
+            st.session_state["flash_toast"] = None
+
+        tab1, tab2 = st.tabs(["系統判定可出貨", "前台送出的運回申請"])
+
+        # =========================
+        # TAB 1：保留原本可出貨名單
+        # =========================
+        with tab1:
+            flag_source = "後台：可出貨名單"  # 寫進 delayed_by / notified_by
+            # 可出貨客戶來自 customer_shipping_state；數字和訂單對不起來時可整張重建
+            if st.button("🔄 重建出貨狀態", help="依 orders 重新計算每位客戶的到貨 / 未到貨件數（資料曾在系統外修改時使用）"):
+                try:
+                    n = rebuild_all(conn)
+                    bump_versions(conn, "orders")
+                    conn.commit()
+                    st.success(f"已重建 {n} 位客戶的出貨狀態。")
+                except Exception as e:
+                    conn.rollback()
+                    st.error(f"重建失敗：{e}")
 
-            with c1:
-                buf = io.BytesIO()
-                out_df = edited[edited["✅ 選取"] == True].drop(columns=["✅ 選取"]).copy()
-                out_df.to_excel(buf, index=False, engine="openpyxl")
-                buf.seek(0)
-                st.download_button(
-                    "📥 下載可出貨名單（只含勾選）",
-                    data=buf,
-                    file_name="可出貨名單_只含勾選.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    disabled=len(picked_ids) == 0,
-                    use_container_width=True
+            # 同一客戶全部到貨、或到貨且提前運回，並且還沒運回；在 SQL 端篩好、分頁讀取（order_store.py）
+            totals = shippable_totals(conn)
+            if totals["order_count"] == 0:
+                st.info("目前沒有可出貨的訂單。")
+            else:
+                m1, m2, m3, m4 = st.columns(4)
+                m1.metric("可出貨訂單", f"{totals['order_count']:,}")
+                m2.metric("總公斤數", f"{totals['total_weight']:.2f}")
+                m3.metric("延後", f"{totals['delayed_count']:,}")
+                m4.metric("已通知", f"{totals['notified_count']:,}")
+
+                def ready_table(df):
+                    df["單號後四碼"] = df["tracking_number"].astype(str).str[-4:]
+                    df_fmt = format_order_df(df.copy())
+                    df_fmt.insert(1, "標記", flag_tags(df["is_delayed"], df["is_notified"]))
+                    return df_fmt
+
+                # 匯出檔按下「產生」才組（exports.py），勾選時不再每次重做
+                export_fmt = format_picker("ready_export_format")
+                export_button(
+                    "📥 下載可出貨名單（全部）", "ready_all",
+                    lambda: ready_table(load_shippable_orders(conn)).drop(columns=["標記"]),
+                    "可出貨名單", fmt=export_fmt, conn=conn,
                 )
 
-            with c2:
-                if st.button("⏰ 延後運回（勾選）", disabled=len(picked_ids) == 0, use_container_width=True):
-                    try:
-                        sql, params = add_delay_tag_sql(picked_ids)
-                        cursor.execute(sql, params)
-                        conn.commit()
-                        st.success(f"已標記 {len(picked_ids)} 筆為【延後運回】。")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"發生錯誤：{e}")
-
-            with c3:
-                if st.button("🧹 取消延後（勾選）", disabled=len(picked_ids) == 0, use_container_width=True):
-                    try:
-                        sql2, params2 = remove_delay_tag_sql(picked_ids)
-                        cursor.execute(sql2, params2)
-                        conn.commit()
-                        st.success(f"已移除 {len(picked_ids)} 筆的【延後】標記。")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"發生錯誤：{e}")
+                st.divider()
 
-            with c4:
-                if st.button("📣 標記已通知（勾選）", disabled=len(picked_ids) == 0, use_container_width=True):
-                    try:
-                        sql3, params3 = add_notify_tag_sql(picked_ids)
-                        cursor.execute(sql3, params3)
-                        conn.commit()
-                        st.success(f"📣 已標記 {len(picked_ids)} 筆為【已通知】。")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"發生錯誤：{e}")
+                # 每頁只送 page_size 筆到瀏覽器；勾選存在 session_state，換頁不會消失（paged_editor.py）
+                paged_editor(
+                    "ready", lambda after_id, limit: shippable_page(conn, after_id, limit), ready_table,
+                    total=totals["order_count"], height=460, help="勾選要下載/延後/已通知操作的訂單",
+                )
+                picked_ids = sorted(selection("ready"))
 
-            with c5:
-                if st.button("🧹 取消已通知（勾選）", disabled=len(picked_ids) == 0, use_container_width=True):
+                def flag_picked(flag, value, message):
                     try:
-                        sql4, params4 = remove_notify_tag_sql(picked_ids)
-                        cursor.execute(sql4, params4)
-                        conn.commit()
-                        st.success(f"🧹 已移除 {len(picked_ids)} 筆的【已通知】標記。")
+                        with bulk_transaction(conn, "orders"):
+                            n = set_flag(conn, flag, picked_ids, value, by=flag_source)
+                            refresh_orders(conn, picked_ids)
+                        clear_selection("ready")
+                        st.session_state["flash_toast"] = message.format(n=n)
                         st.rerun()
                     except Exception as e:
                         st.error(f"發生錯誤：{e}")
 
-            st.markdown("### 📦 可出貨統整")
-
-            df_calc = df_all[(cond1 | cond2) & not_returned].copy()
-            df_calc["delayed_flag"]  = df_calc["remarks"].apply(has_delay_tag)
-            df_calc["notified_flag"] = df_calc["remarks"].apply(has_notify_tag)
-
-            df_nonzero = df_calc[pd.to_numeric(df_calc["weight_kg"], errors="coerce").fillna(0) > 0].copy()
-
-            grp = (
-                df_nonzero
-                .groupby(["customer_name", "platform"], as_index=False)
-                .agg(total_w=("weight_kg", "sum"),
-                     pkg_cnt=("order_id", "count"))
-            )
-
-            def billed_weight(w, pf):
-                base = 1.0 if pf == "集運" else 0.5
-                return max(base, math.ceil(float(w) / 0.5) * 0.5)
-
-            def unit_price(pf):
-                return 90.0 if pf == "集運" else 70.0
-
-            grp["billed_w"]     = grp.apply(lambda r: billed_weight(r["total_w"], r["platform"]), axis=1)
-            grp["price_per_kg"] = grp["platform"].apply(unit_price)
-            grp["fee"]          = grp["billed_w"] * grp["price_per_kg"]
-
-            per_customer_flags = (
-                df_calc.groupby("customer_name", as_index=False)
-                       .agg(
-                           延後數=("delayed_flag", "sum"),
-                           已通知數=("notified_flag", "sum"),
-                           本次清單總筆數=("order_id", "count")
-                       )
-            )
-
-            summary_fee = (
-                grp.groupby("customer_name", as_index=False)
-                  .agg(包裹總數=("pkg_cnt", "sum"),
-                        總公斤數=("total_w", "sum"),
-                        總國際運費=("fee", "sum"))
-            )
-
-            summary = summary_fee.merge(per_customer_flags, on="customer_name", how="left").fillna(0)
-
-            def delay_label(row):
-                d = int(row["延後數"])
-                t = int(row["本次清單總筆數"])
-                if t == 0 or d == 0:
-                    return ""
-                if d == t:
-                    return f"⛔ 全部延後（{d}/{t}）"
-                return f"⚠️ 部分延後（{d}/{t}）"
-
-            def notify_label(row):
-                n = int(row["已通知數"])
-                t = int(row["本次清單總筆數"])
-                if t == 0 or n == 0:
-                    return ""
-                if n == t:
-                    return f"✅ 已全通知（{n}/{t}）"
-                return f"🟡 部分通知（{n}/{t}）"
-
-            summary["標記"] = summary.apply(delay_label, axis=1)
-            summary["通知"] = summary.apply(notify_label, axis=1)
-
-            summary = summary.sort_values(["總國際運費", "總公斤數"], ascending=[False, False])
-
-            summary_display = summary.copy()
-            summary_display.rename(columns={"customer_name": "客戶姓名"}, inplace=True)
-            summary_display.insert(0, "✅ 選取", False)
-
-            cols = ["✅ 選取", "標記", "通知", "客戶姓名", "包裹總數", "本次清單總筆數", "延後數", "已通知數", "總公斤數", "總國際運費"]
-            summary_display = summary_display[[c for c in cols if c in summary_display.columns]]
-
-            edited_sum = st.data_editor(
-                summary_display,
-                key="summary_editor",
-                hide_index=True,
-                disabled=[c for c in summary_display.columns if c != "✅ 選取"],
-                use_container_width=True,
-                height=420,
-                column_config={
-                    "✅ 選取": st.column_config.CheckboxColumn("✅ 選取", help="勾選要操作的客戶（只影響本次清單內的訂單）")
-                }
-            )
-
-            picked_names = edited_sum.loc[edited_sum["✅ 選取"] == True, "客戶姓名"].tolist()
-
-            only_nondelay  = st.toggle("📄 匯出時排除延後（建議開啟）", value=True, help="下載細項時排除標記『延後』的訂單。")
-            only_unnotified = st.toggle("📣 匯出時排除已通知（避免重複通知）", value=False, help="下載細項時排除已標記『已通知』的訂單。")
-
-            cc0, cc1, cc2, cc3, cc4, cc5, cc6 = st.columns(7)
+                c1, c2, c3, c4, c5 = st.columns(5)
 
-            with cc0:
-                df_detail = df_calc[df_calc["customer_name"].isin(picked_names)].copy()
-                if only_nondelay:
-                    df_detail = df_detail[~df_detail["delayed_flag"]].copy()
-                if only_unnotified:
-                    df_detail = df_detail[~df_detail["notified_flag"]].copy()
+                with c1:
+                    export_button(
+                        "📥 下載可出貨名單（只含勾選）", "ready_picked",
+                        lambda: ready_table(shippable_by_ids(conn, picked_ids)),
+                        "可出貨名單_只含勾選", fmt=export_fmt, conn=conn, params=tuple(picked_ids),
+                        disabled=len(picked_ids) == 0, use_container_width=True,
+                    )
 
-                no_detail = (len(picked_names) == 0) or df_detail.empty
-                df_detail_fmt = format_order_df(df_detail.copy())
+                with c2:
+                    if st.button("⏰ 延後運回（勾選）", disabled=len(picked_ids) == 0, use_container_width=True):
+                        flag_picked("delayed", True, "已標記 {n} 筆為【延後運回】。")
+
+                with c3:
+                    if st.button("🧹 取消延後（勾選）", disabled=len(picked_ids) == 0, use_container_width=True):
+                        flag_picked("delayed", False, "已移除 {n} 筆的【延後】標記。")
+
+                with c4:
+                    if st.button("📣 標記已通知（勾選）", disabled=len(picked_ids) == 0, use_container_width=True):
+                        flag_picked("notified", True, "📣 已標記 {n} 筆為【已通知】。")
+
+                with c5:
+                    if st.button("🧹 取消已通知（勾選）", disabled=len(picked_ids) == 0, use_container_width=True):
+                        flag_picked("notified", False, "🧹 已移除 {n} 筆的【已通知】標記。")
+
+                st.markdown("### 📦 可出貨統整")
+
+                # 客戶 × 平台小計在 SQL 算好，不再讀全部可出貨訂單
+                with trace_span("可出貨統整：SQL 小計 + 運費"):
+                    summary = load_shippable_summary(conn)
+
+                summary_display = summary.copy()
+                summary_display.rename(columns={"customer_name": "客戶姓名"}, inplace=True)
+                summary_display.insert(0, "✅ 選取", False)
+
+                cols = ["✅ 選取", "標記", "通知", "客戶姓名", "包裹總數", "本次清單總筆數", "延後數", "已通知數", "總公斤數", "總國際運費"]
+                summary_display = summary_display[[c for c in cols if c in summary_display.columns]]
+
+                edited_sum = st.data_editor(
+                    summary_display,
+                    key="summary_editor",
+                    hide_index=True,
+                    disabled=[c for c in summary_display.columns if c != "✅ 選取"],
+                    use_container_width=True,
+                    height=420,
+                    column_config={
+                        "✅ 選取": st.column_config.CheckboxColumn("✅ 選取", help="勾選要操作的客戶（只影響本次清單內的訂單）")
+                    }
+                )
 
-                if "tracking_number" in df_detail_fmt.columns and "單號後四碼" not in df_detail_fmt.columns:
-                    df_detail_fmt.insert(1, "單號後四碼", df_detail["tracking_number"].astype(str).str[-4:])
+                picked_names = edited_sum.loc[edited_sum["✅ 選取"] == True, "客戶姓名"].tolist()
 
-                buf_detail = io.BytesIO()
-                df_detail_fmt.to_excel(buf_detail, index=False, engine="openpyxl")
-                buf_detail.seek(0)
+                only_nondelay  = st.toggle("📄 匯出時排除延後（建議開啟）", value=True, help="下載細項時排除標記『延後』的訂單。")
+                only_unnotified = st.toggle("📣 匯出時排除已通知（避免重複通知）", value=False, help="下載細項時排除已標記『已通知』的訂單。")
 
-                suffix = []
-                suffix.append("排除延後" if only_nondelay else "含延後")
-                suffix.append("排除已通知" if only_unnotified else "含已通知")
-                fname = "可出貨名單_依勾選_" + "_".join(suffix) + ".xlsx"
+                cc0, cc1, cc2, cc3, cc4, cc5, cc6 = st.columns(7)
 
-                st.download_button(
-                    "📥 下載可出貨名單（細項）",
-                    data=buf_detail,
-                    file_name=fname,
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    disabled=no_detail,
-                    use_container_width=True
-                )
+                with cc0:
+                    # 按鈕能不能按只查有沒有一筆；細項等按下「產生」才讀
+                    no_detail = not (
+                        picked_names
+                        and has_shippable_of_customers(conn, picked_names, only_nondelay, only_unnotified)
+                    )
 
-            with cc1:
-                buf2 = io.BytesIO()
-                out_sum = edited_sum[edited_sum["✅ 選取"] == True].drop(columns=["✅ 選取"]).copy()
-                out_sum.to_excel(buf2, index=False, engine="openpyxl")
-                buf2.seek(0)
-                st.download_button(
-                    "📥 下載可出貨統整",
-                    data=buf2,
-                    file_name="可出貨統整_只含勾選.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    disabled=len(picked_names) == 0,
-                    use_container_width=True
-                )
+                    def detail_export():
+                        df_detail = shippable_by_customers(conn, picked_names, only_nondelay, only_unnotified)
+                        df_detail_fmt = format_order_df(df_detail.copy())
+                        if "tracking_number" in df_detail_fmt.columns and "單號後四碼" not in df_detail_fmt.columns:
+                            df_detail_fmt.insert(1, "單號後四碼", df_detail["tracking_number"].astype(str).str[-4:])
+                        return df_detail_fmt
+
+                    suffix = []
+                    suffix.append("排除延後" if only_nondelay else "含延後")
+                    suffix.append("排除已通知" if only_unnotified else "含已通知")
+                    fname = "可出貨名單_依勾選_" + "_".join(suffix)
+
+                    export_button(
+                        "📥 下載可出貨名單（細項）", "ready_detail", detail_export, fname, fmt=export_fmt,
+                        conn=conn, params=(tuple(sorted(picked_names)), only_nondelay, only_unnotified),
+                        disabled=no_detail, use_container_width=True,
+                    )
 
-            with cc2:
-                if st.button("⏰ 延後運回", disabled=len(picked_names) == 0, use_container_width=True):
-                    try:
-                        ids = df_calc[df_calc["customer_name"].isin(picked_names)]["order_id"].tolist()
-                        if ids:
-                            sql, params = add_delay_tag_sql(ids)
-                            cursor.execute(sql, params)
-                            conn.commit()
-                            st.success(f"已標記 {len(ids)} 筆訂單為【延後運回】。")
-                            st.rerun()
-                    except Exception as e:
-                        st.error(f"發生錯誤：{e}")
+                with cc1:
+                    export_button(
+                        "📥 下載可出貨統整", "ready_summary",
+                        lambda: edited_sum[edited_sum["✅ 選取"] == True].drop(columns=["✅ 選取"]),
+                        "可出貨統整_只含勾選", fmt=export_fmt, conn=conn, params=tuple(sorted(picked_names)),
+                        disabled=len(picked_names) == 0, use_container_width=True,
+                    )
 
-            with cc3:
-                if st.button("🧹 取消延後", disabled=len(picked_names) == 0, use_container_width=True):
+                def flag_customers(flag, value, message):
                     try:
-                        ids = df_calc[df_calc["customer_name"].isin(picked_names)]["order_id"].tolist()
-                        if ids:
-                            sql2, params2 = remove_delay_tag_sql(ids)
-                            cursor.execute(sql2, params2)
-                            conn.commit()
-                            st.success(f"已移除 {len(ids)} 筆的【延後】標記。")
-                            st.rerun()
+                        ids = shippable_ids_of_customers(conn, picked_names)
+                        if not ids:
+                            st.info("本次清單中沒有可更新的訂單。")
+                            return
+                        with bulk_transaction(conn, "orders"):
+                            n = set_flag(conn, flag, ids, value, by=flag_source)
+                            refresh_customers(conn, picked_names)
+                        st.session_state["flash_toast"] = message.format(n=n)
+                        st.rerun()
                     except Exception as e:
                         st.error(f"發生錯誤：{e}")
 
-            with cc4:
-                if st.button("📣 標記已通知", disabled=len(picked_names) == 0, use_container_width=True):
-                    try:
-                        ids = df_calc[df_calc["customer_name"].isin(picked_names)]["order_id"].tolist()
-                        if ids:
-                            sql3, params3 = add_notify_tag_sql(ids)
-                            cursor.execute(sql3, params3)
-                            conn.commit()
-                            st.success(f"📣 已標記 {len(ids)} 筆訂單為【已通知】。")
-                            st.rerun()
-                    except Exception as e:
-                        st.error(f"發生錯誤：{e}")
+                with cc2:
+                    if st.button("⏰ 延後運回", disabled=len(picked_names) == 0, use_container_width=True):
+                        flag_customers("delayed", True, "已標記 {n} 筆訂單為【延後運回】。")
 
-            with cc5:
-                if st.button("🧹 取消已通知", disabled=len(picked_names) == 0, use_container_width=True):
-                    try:
-                        ids = df_calc[df_calc["customer_name"].isin(picked_names)]["order_id"].tolist()
-                        if ids:
-                            sql4, params4 = remove_notify_tag_sql(ids)
-                            cursor.execute(sql4, params4)
-                            conn.commit()
-                            st.success(f"🧹 已移除 {len(ids)} 筆訂單的【已通知】標記。")
-                            st.rerun()
-                    except Exception as e:
-                        st.error(f"發生錯誤：{e}")
+                with cc3:
+                    if st.button("🧹 取消延後", disabled=len(picked_names) == 0, use_container_width=True):
+                        flag_customers("delayed", False, "已移除 {n} 筆的【延後】標記。")
 
-            with cc6:
-                if st.button("✅ 標記為已運回", disabled=len(picked_names) == 0, use_container_width=True):
-                    try:
-                        ids = df_calc[df_calc["customer_name"].isin(picked_names)]["order_id"].tolist()
-                        if ids:
-                            placeholders = ",".join(["%s"] * len(ids))
-                            sql = f"UPDATE orders SET is_returned = 1 WHERE order_id IN ({placeholders})"
-                            cursor.execute(sql, ids)
-                            conn.commit()
-                            st.success(f"✅ 已更新：{len(ids)} 筆訂單標記為『已運回』")
-                            st.rerun()
-                        else:
-                            st.info("本次清單中沒有可更新的訂單。")
-                    except Exception as e:
-                        st.error(f"❌ 發生錯誤：{e}")
+                with cc4:
+                    if st.button("📣 標記已通知", disabled=len(picked_names) == 0, use_container_width=True):
+                        flag_customers("notified", True, "📣 已標記 {n} 筆訂單為【已通知】。")
 
-    # =========================
-    # TAB 2：前台送出的運回申請
-    # =========================
-    with tab2:
-        st.markdown("### 📨 前台送出的運回申請")
-        req_df = load_pending_return_requests(conn)
+                with cc5:
+                    if st.button("🧹 取消已通知", disabled=len(picked_names) == 0, use_container_width=True):
+                        flag_customers("notified", False, "🧹 已移除 {n} 筆訂單的【已通知】標記。")
 
-        if req_df.empty:
-            st.info("目前沒有前台送出的待處理運回申請。")
-        else:
-            req_show = req_df.copy()
-            req_show["選取"] = False
-            req_show["created_at"] = req_show["created_at"].astype(str)
-
-            req_show = req_show[[
-                "選取", "request_id", "customer_name", "selected_shipping_batch",
-                "delivery_method", "total_count", "total_weight", "estimated_fee",
-                "order_ids", "tracking_numbers", "created_at"
-            ]].rename(columns={
-                "request_id": "申請編號",
-                "customer_name": "客戶姓名",
-                "selected_shipping_batch": "船班",
-                "delivery_method": "台灣端寄送",
-                "total_count": "件數",
-                "total_weight": "總重量(kg)",
-                "estimated_fee": "預估運費",
-                "order_ids": "訂單編號清單",
-                "tracking_numbers": "快遞單號清單",
-                "created_at": "申請時間"
-            })
+                with cc6:
+                    if st.button("✅ 標記為已運回", disabled=len(picked_names) == 0, use_container_width=True):
+                        try:
+                            ids = shippable_ids_of_customers(conn, picked_names)
+                            if ids:
+                                with bulk_transaction(conn, "orders"):
+                                    n = mark_returned(conn, ids)
+                                    refresh_customers(conn, picked_names)
+                                st.session_state["flash_toast"] = f"✅ 已更新：{n} 筆訂單標記為『已運回』"
+                                st.rerun()
+                            else:
+                                st.info("本次清單中沒有可更新的訂單。")
+                        except Exception as e:
+                            st.error(f"❌ 發生錯誤：{e}")
 
-            edited_req = st.data_editor(
-                req_show,
-                key="pending_return_requests_editor",
-                hide_index=True,
-                use_container_width=True,
-                height=420,
-                disabled=[c for c in req_show.columns if c != "選取"],
-                column_config={
-                    "選取": st.column_config.CheckboxColumn("選取", help="勾選要處理的前台運回申請")
-                }
-            )
+        # =========================
+        # TAB 2：前台送出的運回申請
+        # =========================
+        with tab2:
+            st.markdown("### 📨 前台送出的運回申請")
+            # 申請與明細一句 SQL 讀回；版本沒變不查、只有新申請時只讀新的（return_requests.py）
+            req_df, req_items = load_pending_requests(conn, st.session_state.setdefault("return_requests_cache", {}))
+
+            result = st.session_state.pop("return_process_result", None)
+            if result is not None and not result.empty:
+                done = result[result["processed"]]
+                st.success(
+                    f"已處理 {len(done)} 筆申請，{int(done['to_return'].sum())} 筆訂單標記為已運回"
+                    f"（其中 {int(done['early_count'].sum())} 筆為提前運回）。"
+                )
+                if len(done) < len(result):
+                    st.caption(f"{len(result) - len(done)} 筆申請已不是待處理狀態，未重複處理。")
+                st.dataframe(result.rename(columns={
+                    "request_id": "申請編號", "customer_name": "客戶姓名", "status_before": "原本狀態",
+                    "item_count": "明細筆數", "to_return": "標記運回", "early_count": "其中提前運回",
+                    "processed": "本次處理",
+                }), use_container_width=True, hide_index=True)
+
+            if req_df.empty:
+                st.info("目前沒有前台送出的待處理運回申請。")
+            else:
+                req_show = req_df.copy()
+                req_show["選取"] = False
+                req_show["created_at"] = req_show["created_at"].astype(str)
+
+                req_show = req_show[[
+                    "選取", "request_id", "customer_name", "selected_shipping_batch",
+                    "delivery_method", "total_count", "total_weight", "estimated_fee",
+                    "order_ids", "tracking_numbers", "created_at"
+                ]].rename(columns={
+                    "request_id": "申請編號",
+                    "customer_name": "客戶姓名",
+                    "selected_shipping_batch": "船班",
+                    "delivery_method": "台灣端寄送",
+                    "total_count": "件數",
+                    "total_weight": "總重量(kg)",
+                    "estimated_fee": "預估運費",
+                    "order_ids": "訂單編號清單",
+                    "tracking_numbers": "快遞單號清單",
+                    "created_at": "申請時間"
+                })
 
-            picked_request_ids = edited_req.loc[edited_req["選取"] == True, "申請編號"].tolist()
+                edited_req = st.data_editor(
+                    req_show,
+                    key="pending_return_requests_editor",
+                    hide_index=True,
+                    use_container_width=True,
+                    height=420,
+                    disabled=[c for c in req_show.columns if c != "選取"],
+                    column_config={
+                        "選取": st.column_config.CheckboxColumn("選取", help="勾選要處理的前台運回申請")
+                    }
+                )
 
-            st.markdown("### 🔎 查看申請明細")
-            preview_request_id = st.selectbox(
-                "選擇要查看的申請編號",
-                options=req_df["request_id"].tolist(),
-                format_func=lambda x: f"申請 #{x}｜{req_df.loc[req_df['request_id'] == x, 'customer_name'].iloc[0]}"
-            )
+                picked_request_ids = edited_req.loc[edited_req["選取"] == True, "申請編號"].tolist()
 
-            detail_df = load_request_items(conn, preview_request_id)
-            if not detail_df.empty:
-                st.dataframe(format_order_df(detail_df), use_container_width=True, hide_index=True)
-            else:
-                st.caption("這筆申請目前沒有明細資料。")
+                st.markdown("### 🔎 查看申請明細")
+                preview_request_id = st.selectbox(
+                    "選擇要查看的申請編號",
+                    options=req_df["request_id"].tolist(),
+                    format_func=lambda x: f"申請 #{x}｜{req_df.loc[req_df['request_id'] == x, 'customer_name'].iloc[0]}"
+                )
 
-            c1, c2 = st.columns(2)
+                detail_df = request_items(req_items, preview_request_id)
+                if not detail_df.empty:
+                    st.dataframe(format_order_df(detail_df), use_container_width=True, hide_index=True)
+                else:
+                    st.caption("這筆申請目前沒有明細資料。")
 
-            with c1:
-                if st.button("✅ 標記申請為已處理", disabled=len(picked_request_ids) == 0, use_container_width=True):
-                    try:
-                        mark_return_request_processed(conn, picked_request_ids)
-                        st.success(f"已將 {len(picked_request_ids)} 筆前台申請標記為已處理。")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"發生錯誤：{e}")
+                c1, c2 = st.columns(2)
 
-            with c2:
-                if st.button("🗑 標記申請為取消", disabled=len(picked_request_ids) == 0, use_container_width=True):
-                    try:
-                        mark_return_request_cancelled(conn, picked_request_ids)
-                        st.warning(f"已將 {len(picked_request_ids)} 筆前台申請標記為取消。")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"發生錯誤：{e}")
+                with c1:
+                    # 申請 → 已處理、申請裡的訂單 → 已運回（記下船班），同一個交易（return_requests.py）
+                    if st.button("✅ 處理申請（訂單標記已運回）", disabled=len(picked_request_ids) == 0, use_container_width=True):
+                        try:
+                            st.session_state["return_process_result"] = process_requests(conn, picked_request_ids)
+                            st.rerun()
+                        except Exception as e:
+                            st.error(f"發生錯誤：{e}")
 
+                with c2:
+                    if st.button("🗑 標記申請為取消", disabled=len(picked_request_ids) == 0, use_container_width=True):
+                        try:
+                            n = mark_requests(conn, picked_request_ids, "cancelled")
+                            st.warning(f"已將 {n} 筆前台申請標記為取消。")
+                            st.rerun()
+                        except Exception as e:
+                            st.error(f"發生錯誤：{e}")
 
-# ========== 📥 貼上入庫訊息 → 自動更新 ==========
 
-elif menu == "📥 貼上入庫訊息":
-    st.subheader("📥 貼上入庫訊息 → 更新到貨狀態")
+    # ========== 📥 貼上入庫訊息 → 自動更新 ==========
 
-    raw = st.text_area(
-        "把 LINE 官方帳號的入庫訊息整段貼上（可多則）",
-        height=260,
-        placeholder="例：\n順豐快遞SF3280813696247，入庫重量 0.14 KG\n中通快遞78935908059095，入庫重量 0.27 KG\n..."
-    )
+    elif menu == "📥 貼上入庫訊息":
+        st.subheader("📥 貼上入庫訊息 → 更新到貨狀態")
 
-    # 解析樣式（沿用你原本的）
-    patterns = [
-        r'([A-Z]{1,3}\d{8,})[^0-9]*入庫重量\s*([0-9.]+)\s*KG',       # SF3280813696247 入庫重量 0.14 KG
-        r'(\d{9,})[^0-9]*入庫重量\s*([0-9.]+)\s*KG',                 # 78935908059095 入庫重量 0.27 KG
-        r'單號[:：]?\s*([A-Z0-9]{8,})[^0-9]*重量[:：]?\s*([0-9.]+)',  # 備用：單號xxx 重量x.xx
-    ]
+        if st.session_state.get("flash_toast"):
+            st.toast(st.session_state["flash_toast"])
+            st.session_state["flash_toast"] = None
 
-    # 進頁可選自動重試
-    auto_retry = st.toggle("進入此頁時自動重試佇列", value=True)
-    if auto_retry:
-        ensure_failed_orders_table(conn)
-        ok, fail, ok_list = retry_failed_all(conn)
-        if ok or fail:
-            st.caption(f"🔁 自動重試：成功 {ok} 筆、仍待 {fail} 筆")
-            if ok_list:
-                st.success("✅ 本次自動重試成功單號：")
-                st.dataframe(pd.DataFrame({"tracking_number": ok_list}), use_container_width=True)
+        raw = st.text_area(
+            "把 LINE 官方帳號的入庫訊息整段貼上（可多則）",
+            height=260,
+            placeholder="例：\n順豐快遞SF3280813696247，入庫重量 0.14 KG\n中通快遞78935908059095，入庫重量 0.27 KG\n..."
+        )
 
-            
-    if st.button("🔎 解析並更新"):
-        found = []
-        lines = raw.splitlines()
-        for line in lines:
-            t = line.strip()
-            if not t:
-                continue
-            matched = None
-            for p in patterns:
-                m = re.search(p, t, flags=re.IGNORECASE)
-                if m:
-                    raw_w = float(m.group(2))
-                    adj_w = round_weight(raw_w)  # ⚠️ 保留你原本的重量處理
-                    matched = (m.group(1), adj_w, t)  # 加上原始訊息 t
-                    break
-            if matched:
-                found.append(matched)
-
-        if not found:
-            st.warning("沒解析到任何『單號＋重量』，請確認範例格式或貼更多原文。")
+        # 佇列由背景的 retry_worker 重試；這裡只顯示最近一輪的結果（一句 SELECT）
+        retry = retry_status(conn)
+        if retry["finished_at"] is None:
+            st.caption(f"🔁 背景重試尚未執行過（python retry_worker.py --loop）；佇列 {retry['queued']} 筆")
         else:
-            st.success(f"解析到 {len(found)} 筆：")
-            df_parsed = pd.DataFrame(
-                [{"tracking_number": tn, "weight_kg": w} for (tn, w, _) in found]
+            st.caption(
+                f"🔁 背景重試：上次 {retry['finished_at']:%m/%d %H:%M}（{'背景' if retry['run_by'] == 'worker' else '手動'}），"
+                f"到期 {retry['due_count']} 筆、成功 {retry['succeeded']}、仍失敗 {retry['still_failed']}；"
+                f"佇列 {retry['queued']} 筆，其中 {retry['due']} 筆已到重試時間"
             )
-            st.dataframe(df_parsed, use_container_width=True)
+            if retry["error"]:
+                st.warning(f"上次重試中斷：{retry['error']}")
+        if retry["run_requested_at"]:
+            st.caption(f"⏳ 已於 {retry['run_requested_at']} 請背景立即執行，等待 retry_worker 接手")
+        if retry["stale"] and retry["due"]:
+            st.warning("背景重試似乎沒有在跑，請確認 retry_worker 是否啟動；急著處理的單號可勾選後按「重試勾選」。")
 
             
-            
-            
-            # 寫回資料庫（同單號只計一次：全部歸 0，再選一筆當主筆）
-            updated, missing = 0, []
-            ok_rows = []     # ✅ 成功表格
-            fail_rows = []   # ✅ 失敗表格
-            cursor = conn.cursor()  # ✅ 你下面有 cursor.execute，需要這行
+        if st.button("🔎 解析並更新"):
+            # 解析樣式在 inbound_parser（新倉庫格式用 register_format 註冊）
+            parsed = parse_inbound(raw)
+            found = [(r.tracking_number, r.weight_kg, r.source_line) for r in parsed]
 
-            for tn, w, raw_line in found:
-
-                tn = str(tn).strip()
-
-                # (A) 先確認此單號是否存在；不存在 → 丟進佇列（並抓客戶姓名）
-                try:
-                    df_match = read_sql_df(
-                        """
-                        SELECT customer_name
-                        FROM orders
-                        WHERE tracking_number = %s
-                        ORDER BY order_id ASC
-                        LIMIT 1
-                        """,
-                        conn, params=[tn],
-                    )
-
-                    if df_match.empty:
-                        missing.append(tn)
-                        enqueue_failed(conn, tn, w, raw_line, "找不到對應訂單")
-                        fail_rows.append({
-                            "tracking_number": tn,
-                            "customer_name": "",
-                            "weight_kg": w,
-                            "inbound_date": datetime.today().date(),
-                            "note": "找不到對應訂單",
-                        })
-                        continue
-
-                    customer_name = str(df_match.iloc[0]["customer_name"] or "").strip()
-                    if not customer_name:
-                        customer_name = "（未填姓名）"
-                
-                except Exception as e:
-                    missing.append(tn)
-                    enqueue_failed(conn, tn, w, raw_line, f"查詢失敗: {e}")
-                    fail_rows.append({
-                        "tracking_number": tn,
-                        "customer_name": "",
-                        "weight_kg": w,
-                        "inbound_date": datetime.today().date(),
-                        "note": f"查詢失敗: {e}",
-                    })
-                    continue
-
-
-
-                # (B) 先把這個單號「全部設為 0kg + 已到貨」
-                cursor.execute("""
-                    UPDATE orders
-                    SET is_arrived = 1,
-                        weight_kg = 0,
-                        remarks = CONCAT(COALESCE(remarks,''), '｜自動入庫(', NOW(), ') 同單號=0kg')
-                    WHERE tracking_number = %s
-                """, (tn,))
-
-                # (C) 再從裡面挑一筆設為這次的重量（主筆），LIMIT 1 保證只一筆
-                cursor.execute("""
-                    UPDATE orders
-                    SET weight_kg = %s,
-                        remarks = CONCAT(COALESCE(remarks,''), '｜自動入庫(', NOW(), ') 主筆=', %s, 'kg')
-                    WHERE tracking_number = %s
-                    LIMIT 1
-                """, (w, str(w), tn))
-
-                # 如果 LIMIT 1 沒更新到任何列 → 有怪，丟進佇列
-                if cursor.rowcount == 0:
-                    missing.append(tn)
-                    enqueue_failed(conn, tn, w, raw_line, "存在該單號，但更新主筆失敗")
-                    fail_rows.append({
-                        "tracking_number": tn,
-                        "customer_name": customer_name,
-                        "weight_kg": w,
-                        "inbound_date": datetime.today().date(),
-                        "note": "存在該單號，但更新主筆失敗",
-                    })
-                    continue
-
-                # ✅ 成功
-                ok_rows.append({
-                    "tracking_number": tn,
-                    "customer_name": customer_name,
-                    "weight_kg": w,
-                    "inbound_date": datetime.today().date()
-                })
-                updated += 1
-
-
-
-
-            conn.commit()
-    
-            st.success(f"✅ 成功更新 {updated} 筆到貨資料")
-
-            st.markdown("### ✅ 成功登記")
-            if ok_rows:
-                st.dataframe(pd.DataFrame(ok_rows), use_container_width=True)
-            else:
-                st.info("本次沒有成功登記的資料。")
-
-            st.markdown("### ⚠️ 未成功（本次，已加入重試佇列）")
-            if fail_rows:
-                st.dataframe(pd.DataFrame(fail_rows), use_container_width=True)
+            if not found:
+                st.warning("沒解析到任何『單號＋重量』，請確認範例格式或貼更多原文。")
             else:
-                st.caption("本次沒有未成功的資料。")
-
+                st.success(f"解析到 {len(found)} 筆：")
+                df_parsed = pd.DataFrame(
+                    parsed, columns=list(parsed[0]._fields)
+                )[["tracking_number", "raw_weight", "weight_kg", "format"]]
+                st.dataframe(df_parsed, use_container_width=True)
 
+            
+            
+            
+                # 寫回資料庫（同單號只計一次：全部歸 0，再選一筆當主筆）
+                updated, missing, ok_rows, fail_rows = apply_inbound(conn, found)
 
+                st.success(f"✅ 成功更新 {updated} 筆到貨資料")
 
-    # === 佇列檢視 / 操作 ===
-    st.markdown("### 📨 未成功單號佇列")
-    df_q = load_failed(conn)
-    if not df_q.empty:
-        st.caption(f"共有 {len(df_q)} 筆待重試")
-    
-        # 逐列顯示 + 單筆刪除
-        for i, row in df_q.iterrows():
-            tn = str(row["tracking_number"])
-            w  = row.get("weight_kg", None)
-            msg = row.get("raw_message", "")
-            rc  = int(row.get("retry_count", 0))
-            err = row.get("last_error", "")
-
-            c1, c2, c3 = st.columns([7, 4, 1])
-            with c1:
-                st.markdown(f"**{tn}**｜入庫重量 **{w if w is not None else '—'} kg**")
-                if msg:
-                    st.caption(msg)
-            with c2:
-                st.write(f"重試次數：{rc}")
-                st.write(f"最後錯誤：{err}")
-            with c3:
-                if st.button("🗑️", key=f"del_fail_{tn}_{i}", help="刪除此筆"):
-                    delete_failed_one(conn, tn)
-                    st.toast(f"已刪除：{tn}")
-                    st.rerun()
+                st.markdown("### ✅ 成功登記")
+                if ok_rows:
+                    st.dataframe(pd.DataFrame(ok_rows), use_container_width=True)
+                else:
+                    st.info("本次沒有成功登記的資料。")
 
-        st.divider()
-        c1, _, c3 = st.columns(3)
-        with c1:
-            if st.button("🔁 重試全部", use_container_width=True):
-                ok, fail, ok_list = retry_failed_all(conn)
-                st.success(f"已重試：成功 {ok} 筆、仍待 {fail} 筆")
+                st.markdown("### ⚠️ 未成功（本次；找不到訂單的已加入重試佇列）")
+                if fail_rows:
+                    st.dataframe(pd.DataFrame(fail_rows), use_container_width=True)
+                else:
+                    st.caption("本次沒有未成功的資料。")
 
-                if ok_list:
-                    st.markdown("#### ✅ 本次重試成功單號")
-                    st.dataframe(pd.DataFrame({"tracking_number": ok_list}), use_container_width=True)
 
-                st.stop()  # ✅ 先停住，讓你看得到結果（不然 rerun 就洗掉）
 
-        with c3:
-            if st.button("🧹 清空佇列", use_container_width=True):
-                clear_failed(conn)
-                st.warning("佇列已清空。")
+
+        # === 倉庫匯出檔：上傳（串流分段讀取，走同一套解析＋寫回）===
+        st.markdown("### 📄 匯入倉庫檔案")
+        uploads = st.file_uploader(
+            "上傳倉庫匯出檔（CSV / XLSX 表頭要有「單號」「重量」欄；TXT 或其他表格逐行當入庫訊息解析）",
+            type=list(FILE_TYPES), accept_multiple_files=True, key="inbound_uploads",
+        )
+        u1, u2 = st.columns(2)
+        run_upload = u1.button("📥 匯入上傳的檔案", disabled=not uploads, use_container_width=True)
+
+        # 監看資料夾只由 retry_worker --watch 處理（大檔不佔住頁面，兩個分頁也不會同時跑同一批檔案）；
+        # 頁面只顯示狀態，按鈕是請 worker 立即跑一輪
+        watch_dir = configured_watch_dir()
+        if not watch_dir:
+            u2.button("📂 請背景處理監看資料夾", disabled=True, use_container_width=True,
+                      help=f"未設定：環境變數 {WATCH_DIR_ENV} 或 secrets 的 [inbound] watch_dir")
+        else:
+            try:
+                folder = folder_status(watch_dir)
+            except OSError as e:
+                folder = None
+                st.caption(f"📂 監看資料夾 {watch_dir} 讀不到：{e}")
+            if u2.button(
+                "📂 請背景處理監看資料夾", disabled=bool(retry["run_requested_at"]), use_container_width=True,
+                help=f"資料夾：{watch_dir}；retry_worker --watch 每輪會處理，按下後幾秒內提早跑一輪",
+            ):
+                request_run(conn)
+                st.session_state["flash_toast"] = "已通知背景程序處理監看資料夾"
                 st.rerun()
-    else:
-        st.caption("目前沒有待重試的單號。")
+            if folder is not None:
+                st.caption(
+                    f"📂 {watch_dir}：待處理 {folder['pending']} 個檔案；error/ 裡 {folder['errors']} 個"
+                    + (f"；已匯入但搬不走 {folder['unmoved']} 個（不會重複匯入）" if folder["unmoved"] else "")
+                    + (f"（最近：{'、'.join(folder['recent_errors'])}）" if folder["recent_errors"] else "")
+                )
+
+        if run_upload:
+            bar = st.progress(0.0, text="匯入中…")
 
+            def show_progress(fraction, summary):
+                bar.progress(
+                    min(fraction or 0.0, 1.0),
+                    text=f"{summary['file']}：已讀 {summary['lines']:,} 行，登記 {summary['updated']:,} 筆、"
+                         f"對不到 {summary['missing']:,} 筆",
+                )
+
+            file_results = []
+            for upload in uploads:
+                try:
+                    file_results.append(ingest(conn, upload, upload.name, show_progress))
+                except Exception as e:
+                    file_results.append({"file": upload.name, "error": str(e)})
+            bar.progress(1.0, text="匯入完成")
+
+            if file_results:
+                df_files = pd.DataFrame(file_results).reindex(
+                    columns=["file", "lines", "parsed", "updated", "missing", "rejected", "error"]
+                ).rename(columns={
+                    "file": "檔案", "lines": "行數", "parsed": "解析筆數", "updated": "登記到貨",
+                    "missing": "對不到（已進佇列）", "rejected": f"單號超過 {TRACKING_MAX_LEN} 字元（未登記）",
+                    "error": "錯誤",
+                })
+                st.dataframe(df_files, use_container_width=True, hide_index=True)
+                samples = [tn for r in file_results for tn in r.get("missing_samples", [])]
+                if samples:
+                    st.caption("對不到訂單的單號（部分）：" + "、".join(samples[:50]))
+
+        # === 佇列檢視 / 操作 ===
+        # 篩選、排序、分頁都在 SQL；畫面上只有一頁的勾選表，佇列再長重跑成本都一樣
+        st.markdown("### 📨 未成功單號佇列")
+        if retry["queued"]:
+            error_types = failed_error_types(conn)
+            f1, f2, f3, f4 = st.columns(4)
+            age_label = f1.selectbox("等待時間", list(FAILED_AGES), key="failed_age")
+            min_retries = f2.number_input("重試次數至少", min_value=0, step=1, key="failed_min_retries")
+            error_type = f3.selectbox(
+                "錯誤類型", [None] + [t for t, _ in error_types], key="failed_error_type",
+                format_func=lambda t: "全部" if t is None else f"{t or '（無）'}（{dict(error_types)[t]}）",
+            )
+            sort = f4.selectbox("排序", list(FAILED_SORTS), key="failed_sort")
+
+            where, params = failed_filter(FAILED_AGES[age_label], min_retries, error_type)
+            total_failed = failed_totals(conn, where, params)
+
+            def failed_table(df):
+                return df.drop(columns=["id"]).rename(columns={
+                    "tracking_number": "包裹單號",
+                    "weight_kg": "入庫重量",
+                    "raw_message": "原始訊息",
+                    "retry_count": "重試次數",
+                    "last_error": "最後錯誤",
+                    "created_at": "進佇列時間",
+                    "next_retry_at": "下次重試",
+                })
 
+            paged_editor(
+                "failed_queue", lambda offset, limit: failed_page(conn, where, params, sort, offset, limit),
+                failed_table, total=total_failed, scope=(age_label, min_retries, error_type, sort),
+                height=380, id_col="id", next_cursor=lambda page, offset: offset + len(page),
+            )
+            picked_failed = sorted(selection("failed_queue"))
 
-# =====🚚 批次出貨=====
+            def on_failed_picked(action, message):
+                try:
+                    result = action(picked_failed)
+                except Exception as e:
+                    st.error(f"操作失敗：{e}")
+                    return
+                reset_editor("failed_queue")
+                st.session_state["flash_toast"] = message(*result)
+                st.rerun()
 
-elif menu == "🚚 批次出貨":
-    st.subheader("🚚 批次出貨")
+            st.caption(f"已勾選 {len(picked_failed)} 筆")
+            a1, a2, a3, a4 = st.columns([1, 1, 2, 1])
+            if a1.button("🔁 重試勾選", disabled=not picked_failed, use_container_width=True):
+                on_failed_picked(
+                    lambda ids: retry_failed(conn, ids), lambda ok, fail: f"已重試：成功 {ok} 筆、仍待 {fail} 筆",
+                )
+            if a2.button("🗑️ 刪除勾選", disabled=not picked_failed, use_container_width=True):
+                on_failed_picked(lambda ids: (delete_failed(conn, ids),), lambda n: f"已刪除 {n} 筆")
+            assignee = a3.text_input(
+                "指派給客戶", key="failed_assignee", label_visibility="collapsed",
+                placeholder="指派給客戶（沒有訂單的單號新增集運訂單）",
+            )
+            def reassign_picked(ids):
+                created, arrived = reassign_failed(conn, ids, assignee)
+                if created:
+                    sync_members_from_orders(conn)  # 新客戶補進會員表（同 📮 集運登記管理）
+                return created, arrived
+
+            if a4.button("👤 指派勾選", disabled=not (picked_failed and assignee.strip()), use_container_width=True):
+                on_failed_picked(
+                    reassign_picked,
+                    lambda created, arrived: f"已指派給 {assignee.strip()}：新增 {created} 筆集運訂單、登記到貨 {arrived} 筆",
+                )
 
-    name = st.text_input("🔍 請輸入客戶姓名")
-    if name.strip():
-        # 1) 查詢訂單
-        df = read_sql_df(
-            "SELECT * FROM orders WHERE customer_name LIKE %s",
-            conn,
-            params=[f"%{name}%"]
-        )
+            st.divider()
+            c1, _, c3 = st.columns(3)
+            with c1:
+                # 不在頁面上重試整個佇列：只留請求給 retry_worker，幾秒內由它跑一輪（照常只重試已到期的）
+                if st.button(
+                    "🔁 請背景立即執行", disabled=bool(retry["run_requested_at"]), use_container_width=True,
+                    help="retry_worker 幾秒內跑一輪已到重試時間的單號；要馬上重試特定單號請勾選後按「重試勾選」",
+                ):
+                    request_run(conn)
+                    st.session_state["flash_toast"] = "已通知背景程序，幾秒內會執行一輪"
+                    st.rerun()
 
-        if df.empty:
-            st.warning("⚠️ 查無資料")
+            with c3:
+                if st.button("🧹 清空佇列", use_container_width=True):
+                    clear_failed(conn)
+                    reset_editor("failed_queue")
+                    st.warning("佇列已清空。")
+                    st.rerun()
         else:
-            # 2) 顯示用表格（中文欄位 + ✔✘），保留「訂單編號」作為更新依據
-            df_display = df.copy()
+            st.caption("目前沒有待重試的單號。")
 
-            column_mapping = {
-                "order_id": "訂單編號",
-                "order_time": "下單日期",
-                "customer_name": "客戶姓名",
-                "platform": "平台",
-                "tracking_number": "包裹單號",
-                "amount_rmb": "金額（人民幣）",
-                "weight_kg": "公斤數",
-                "is_arrived": "是否到貨",
-                "is_returned": "是否已運回",
-                "is_early_returned": "提前運回",
-                "service_fee": "代購手續費",
-                "remarks": "備註"
-            }
-            df_display = df_display.rename(columns=column_mapping)
-
-            # 轉日期/空值，避免序列化問題
-            if "下單日期" in df_display.columns:
-                df_display["下單日期"] = pd.to_datetime(df_display["下單日期"], errors="coerce").dt.strftime("%Y-%m-%d")
-            df_display = df_display.fillna("")
-
-            # 布林欄位顯示為 ✔/✘（只影響顯示）
-            for col in ["是否到貨", "是否已運回", "提前運回"]:
-                if col in df_display.columns:
-                    df_display[col] = df_display[col].apply(lambda x: "✔" if bool(x) else "✘")
-
-            # 3) data_editor：加「✅ 選取」欄 / 只允許勾選該欄
-            ui = df_display.copy()
-            if "✅ 選取" not in ui.columns:
-                ui.insert(0, "✅ 選取", False)
-
-            disabled_cols = [c for c in ui.columns if c != "✅ 選取"]
-            edited = st.data_editor(
-                ui,
-                key="batch_editor",
-                hide_index=True,
-                disabled=disabled_cols,          # 只讓「✅ 選取」能變動
-                use_container_width=True,
-                height=420,
-            )
 
-            # 4) 取得使用者勾選的「訂單編號」
-            picked_ids = edited.loc[edited["✅ 選取"] == True, "訂單編號"].tolist()
 
-            
-            if picked_ids:
-                sel = df["order_id"].isin(picked_ids)
-                total_weight = pd.to_numeric(df.loc[sel, "weight_kg"], errors="coerce").fillna(0).sum()
+    # =====🚚 批次出貨=====
 
-                st.success(f"✅ 已選擇 {len(picked_ids)} 筆訂單，共 {total_weight:.2f} 公斤")
+    elif menu == "🚚 批次出貨":
+        st.subheader("🚚 批次出貨")
 
-                c1, c2 = st.columns(2)
+        if st.session_state.get("flash_toast"):
+            st.toast(st.session_state["flash_toast"])
+            st.session_state["flash_toast"] = None
 
-                with c1:
-                    if st.button("🚚 標記為『已運回』"):
-                        try:
-                            placeholders = ",".join(["%s"] * len(picked_ids))
-                            sql = f"UPDATE orders SET is_returned = 1 WHERE order_id IN ({placeholders})"
-                            cursor.execute(sql, picked_ids)
-                            conn.commit()
-                        except Exception as e:
-                            st.error(f"❌ 發生錯誤：{e}")
-                        else:
-                           st.success("🚚 更新成功：已標記為『已運回』")
+        name = st.text_input("🔍 請輸入客戶姓名")
+        if name.strip():
+            # 1) 筆數在 SQL 算好；表格分頁讀取，勾選跨頁保留（paged_editor.py）
+            total_count, _ = batch_totals(conn, name)
 
-                with c2:
-                    if st.button("📦 標記為『提前運回』"):
-                        try:
-                            placeholders = ",".join(["%s"] * len(picked_ids))
-                            sql = f"UPDATE orders SET is_early_returned = 1 WHERE order_id IN ({placeholders})"
-                            cursor.execute(sql, picked_ids)
-                            conn.commit()
-                        except Exception as e:
-                            st.error(f"❌ 發生錯誤：{e}")
-                        else:
-                            st.success("📦 更新成功：已標記為『提前運回』")
+            if total_count == 0:
+                st.warning("⚠️ 查無資料")
             else:
-                st.info("📋 請勾選欲標記的訂單")
+                # 2) 顯示用表格（中文欄位 + ✔✘），保留「訂單編號」作為更新依據
+                column_mapping = {
+                    "order_id": "訂單編號",
+                    "order_time": "下單日期",
+                    "customer_name": "客戶姓名",
+                    "platform": "平台",
+                    "tracking_number": "包裹單號",
+                    "amount_rmb": "金額（人民幣）",
+                    "weight_kg": "公斤數",
+                    "is_arrived": "是否到貨",
+                    "is_returned": "是否已運回",
+                    "is_early_returned": "提前運回",
+                    "is_delayed": "延後",
+                    "is_notified": "已通知",
+                    "service_fee": "代購手續費",
+                    "remarks": "備註"
+                }
 
+                def batch_table(df_page):
+                    df_display = df_page.rename(columns=column_mapping)
 
-                
-# 6. 利潤報表/匯出
-elif menu == "💰 利潤報表/匯出":
-    st.subheader("💰 利潤報表與匯出")
-
-    # 匯率輸入
-    rate_col1, rate_col2, rate_col3 = st.columns(3)
-    with rate_col1:
-        rmb_rate = st.number_input(
-            "人民幣匯率",
-            min_value=0.0,
-            value=0.0,
-            step=0.01,
-            format="%.2f"
-        )
-    with rate_col2:
-        payment_sell_rate = st.number_input(
-            "代付定價匯率",
-            min_value=0.0,
-            value=0.0,
-            step=0.01,
-            format="%.2f"
-        )
-    with rate_col3:
-        purchase_sell_rate = st.number_input(
-            "代購定價匯率",
-            min_value=0.0,
-            value=0.0,
-            step=0.01,
-            format="%.2f"
-        )
+                    # 轉日期/空值，避免序列化問題
+                    if "下單日期" in df_display.columns:
+                        df_display["下單日期"] = pd.to_datetime(df_display["下單日期"], errors="coerce").dt.strftime("%Y-%m-%d")
+                    df_display = df_display.fillna("")
+
+                    # 布林欄位顯示為 ✔/✘（只影響顯示）
+                    return mark_columns(df_display)
 
-    st.caption("客戶姓名完全等於「代付」的訂單使用代付定價匯率；其餘訂單使用代購定價匯率。")
+                # 3) data_editor：只允許勾選「✅ 選取」欄；換客戶名稱時清空勾選
+                paged_editor(
+                    "batch", lambda after_id, limit: batch_page(conn, name, after_id, limit), batch_table,
+                    total=total_count, scope=name.strip(),
+                )
 
-    # 讀出所有訂單
-    df = read_sql_df("SELECT * FROM orders", conn)
+                # 4) 使用者勾選的「訂單編號」（所有頁）
+                picked_ids = sorted(selection("batch"))
 
-    if df.empty:
-        st.info("目前沒有任何訂單資料。")
-    else:
-        # 轉日期欄位
-        df["order_time"] = pd.to_datetime(df["order_time"], errors="coerce")
+            
+                if picked_ids:
+                    _, total_weight = order_totals(conn, picked_ids)
+
+                    st.success(f"✅ 已選擇 {len(picked_ids)} 筆訂單，共 {total_weight:.2f} 公斤")
+
+                    c1, c2 = st.columns(2)
+
+                    with c1:
+                        if st.button("🚚 標記為『已運回』"):
+                            try:
+                                with bulk_transaction(conn, "orders"):
+                                    n = mark_returned(conn, picked_ids, "is_returned")
+                                    refresh_orders(conn, picked_ids)
+                            except Exception as e:
+                                st.error(f"❌ 發生錯誤：{e}")
+                            else:
+                                clear_selection("batch")
+                                st.session_state["flash_toast"] = f"🚚 更新成功：{n} 筆已標記為『已運回』"
+                                st.rerun()
+
+                    with c2:
+                        if st.button("📦 標記為『提前運回』"):
+                            try:
+                                with bulk_transaction(conn, "orders"):
+                                    n = mark_returned(conn, picked_ids, "is_early_returned")
+                                    refresh_orders(conn, picked_ids)
+                            except Exception as e:
+                                st.error(f"❌ 發生錯誤：{e}")
+                            else:
+                                clear_selection("batch")
+                                st.session_state["flash_toast"] = f"📦 更新成功：{n} 筆已標記為『提前運回』"
+                                st.rerun()
+                else:
+                    st.info("📋 請勾選欲標記的訂單")
 
-        # 只保留有日期的資料（避免 min/max 出錯）
-        df_valid = df.dropna(subset=["order_time"]).copy()
 
-        if df_valid.empty:
-            st.warning("目前沒有可用的下單日期資料（order_time 皆為空或格式錯誤）。")
-        else:
-            # MySQL DECIMAL 讀進 pandas 後可能是 Decimal，
-            # 先統一轉成 float，避免 Decimal 與 float 混算造成 TypeError。
-            for col in ["amount_rmb", "service_fee"]:
-                if col not in df_valid.columns:
-                    df_valid[col] = 0.0
+                
+    # 6. 利潤報表/匯出
+    elif menu == "💰 利潤報表/匯出":
+        st.subheader("💰 利潤報表與匯出")
+
+        # 匯率輸入
+        rate_col1, rate_col2, rate_col3 = st.columns(3)
+        with rate_col1:
+            rmb_rate = st.number_input(
+                "人民幣匯率",
+                min_value=0.0,
+                value=0.0,
+                step=0.01,
+                format="%.2f"
+            )
+        with rate_col2:
+            payment_sell_rate = st.number_input(
+                "代付定價匯率",
+                min_value=0.0,
+                value=0.0,
+                step=0.01,
+                format="%.2f"
+            )
+        with rate_col3:
+            purchase_sell_rate = st.number_input(
+                "代購定價匯率",
+                min_value=0.0,
+                value=0.0,
+                step=0.01,
+                format="%.2f"
+            )
 
-                df_valid[col] = pd.to_numeric(
-                    df_valid[col],
-                    errors="coerce"
-                ).fillna(0.0).astype(float)
+        st.caption("客戶姓名完全等於「代付」的訂單使用代付定價匯率；其餘訂單使用代購定價匯率。")
 
-            if "customer_name" not in df_valid.columns:
-                df_valid["customer_name"] = ""
+        # 讀出所有訂單
+        df = read_sql_df("SELECT * FROM orders", conn)
 
+        if df.empty:
+            st.info("目前沒有任何訂單資料。")
+        else:
+            # 逐筆計算利潤（order_store.py）；只保留有下單日期的資料
+            df_valid = profit_report(df, rmb_rate, payment_sell_rate, purchase_sell_rate)
             rmb_rate_float = float(rmb_rate or 0.0)
-            payment_sell_rate_float = float(payment_sell_rate or 0.0)
-            purchase_sell_rate_float = float(purchase_sell_rate or 0.0)
-
-            # 客戶姓名完全等於「代付」時，判斷為代付訂單
-            is_payment_order = (
-                df_valid["customer_name"]
-                .fillna("")
-                .astype(str)
-                .str.strip()
-                .eq("代付")
-            )
 
-            df_valid["訂單類型"] = "代購"
-            df_valid.loc[is_payment_order, "訂單類型"] = "代付"
-
-            # 每筆訂單依類型套用不同定價匯率
-            df_valid["適用定價匯率"] = purchase_sell_rate_float
-            df_valid.loc[is_payment_order, "適用定價匯率"] = payment_sell_rate_float
-
-            # 計算三個利潤欄位（即時計算，不存 DB）
-            df_valid["匯率價差利潤"] = (
-                df_valid["amount_rmb"]
-                * (df_valid["適用定價匯率"] - rmb_rate_float)
-            ).round(2)
-
-            df_valid["代購手續費收入"] = (
-                df_valid["service_fee"]
-            ).round(2)
-
-            df_valid["總利潤"] = (
-                df_valid["匯率價差利潤"]
-                + df_valid["代購手續費收入"]
-            ).round(2)
-
-            # ----- 日期區間選擇器（預設：本月 1 號～今天）-----
-            min_d = df_valid["order_time"].dt.date.min()
-            max_d = df_valid["order_time"].dt.date.max()
-
-            today = datetime.today().date()
-            this_month_start = today.replace(day=1)
-
-            # 預設值要落在可選範圍內（夾住）
-            default_start = max(this_month_start, min_d)
-            default_end = min(today, max_d)
-
-            colA, colB = st.columns(2)
-            with colA:
-                start_date = st.date_input(
-                    "起始日期",
-                    value=default_start,
-                    min_value=min_d,
-                    max_value=max_d
-                )
-            with colB:
-                end_date = st.date_input(
-                    "結束日期",
-                    value=default_end,
-                    min_value=min_d,
-                    max_value=max_d
-                )
+            if df_valid.empty:
+                st.warning("目前沒有可用的下單日期資料（order_time 皆為空或格式錯誤）。")
+            else:
+                # ----- 日期區間選擇器（預設：本月 1 號～今天）-----
+                min_d = df_valid["order_time"].dt.date.min()
+                max_d = df_valid["order_time"].dt.date.max()
+
+                today = datetime.today().date()
+                this_month_start = today.replace(day=1)
+
+                # 預設值要落在可選範圍內（夾住）
+                default_start = max(this_month_start, min_d)
+                default_end = min(today, max_d)
+
+                colA, colB = st.columns(2)
+                with colA:
+                    start_date = st.date_input(
+                        "起始日期",
+                        value=default_start,
+                        min_value=min_d,
+                        max_value=max_d
+                    )
+                with colB:
+                    end_date = st.date_input(
+                        "結束日期",
+                        value=default_end,
+                        min_value=min_d,
+                        max_value=max_d
+                    )
 
-            # 防呆：若選反，自動交換
-            if start_date > end_date:
-                start_date, end_date = end_date, start_date
+                # 防呆：若選反，自動交換
+                if start_date > end_date:
+                    start_date, end_date = end_date, start_date
 
-            # 篩選區間（含頭含尾）
-            start_dt = pd.to_datetime(start_date)
-            end_dt = pd.to_datetime(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+                # 篩選區間（含頭含尾）
+                start_dt = pd.to_datetime(start_date)
+                end_dt = pd.to_datetime(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
 
-            df_sel = df_valid[
-                (df_valid["order_time"] >= start_dt)
-                & (df_valid["order_time"] <= end_dt)
-            ].copy()
+                df_sel = df_valid[
+                    (df_valid["order_time"] >= start_dt)
+                    & (df_valid["order_time"] <= end_dt)
+                ].copy()
 
-            st.markdown(f"#### {start_date} ～ {end_date} 訂單統計（共 {len(df_sel)} 筆）")
+                st.markdown(f"#### {start_date} ～ {end_date} 訂單統計（共 {len(df_sel)} 筆）")
 
-            # 顯示總計 KPI
-            col1, col2, col3 = st.columns(3)
-            col1.metric("匯率價差利潤 (NT$)", f"{df_sel['匯率價差利潤'].sum():,.2f}")
-            col2.metric("手續費收入 (NT$)", f"{df_sel['代購手續費收入'].sum():,.2f}")
-            col3.metric("總利潤 (NT$)", f"{df_sel['總利潤'].sum():,.2f}")
+                # 顯示總計 KPI
+                col1, col2, col3 = st.columns(3)
+                col1.metric("匯率價差利潤 (NT$)", f"{df_sel['匯率價差利潤'].sum():,.2f}")
+                col2.metric("手續費收入 (NT$)", f"{df_sel['代購手續費收入'].sum():,.2f}")
+                col3.metric("總利潤 (NT$)", f"{df_sel['總利潤'].sum():,.2f}")
 
-            # 顯示代付 / 代購分開統計
-            payment_df = df_sel[df_sel["訂單類型"] == "代付"]
-            purchase_df = df_sel[df_sel["訂單類型"] == "代購"]
+                # 顯示代付 / 代購分開統計
+                payment_df = df_sel[df_sel["訂單類型"] == "代付"]
+                purchase_df = df_sel[df_sel["訂單類型"] == "代購"]
 
-            st.markdown("### 📊 分類統計")
-            type_col1, type_col2 = st.columns(2)
+                st.markdown("### 📊 分類統計")
+                type_col1, type_col2 = st.columns(2)
 
-            with type_col1:
-                st.metric(
-                    "代付訂單",
-                    f"{len(payment_df)} 筆",
-                    f"總利潤 NT$ {payment_df['總利潤'].sum():,.2f}"
-                )
+                with type_col1:
+                    st.metric(
+                        "代付訂單",
+                        f"{len(payment_df)} 筆",
+                        f"總利潤 NT$ {payment_df['總利潤'].sum():,.2f}"
+                    )
 
-            with type_col2:
-                st.metric(
-                    "代購訂單",
-                    f"{len(purchase_df)} 筆",
-                    f"總利潤 NT$ {purchase_df['總利潤'].sum():,.2f}"
-                )
+                with type_col2:
+                    st.metric(
+                        "代購訂單",
+                        f"{len(purchase_df)} 筆",
+                        f"總利潤 NT$ {purchase_df['總利潤'].sum():,.2f}"
+                    )
 
-            # 匯出區間報表
-            st.markdown("### 📤 下載報表")
-            df_export = df_sel.copy()
-
-            # 匯出時保留本次計算使用的人民幣匯率
-            df_export["人民幣匯率"] = rmb_rate_float
-
-            # 調整匯出欄位順序，讓訂單類型與匯率資訊靠近金額欄位
-            preferred_columns = [
-                "order_id",
-                "order_time",
-                "customer_name",
-                "訂單類型",
-                "platform",
-                "tracking_number",
-                "amount_rmb",
-                "人民幣匯率",
-                "適用定價匯率",
-                "service_fee",
-                "匯率價差利潤",
-                "代購手續費收入",
-                "總利潤",
-                "weight_kg",
-                "is_arrived",
-                "is_returned",
-                "is_early_returned",
-                "remarks",
-            ]
-            remaining_columns = [
-                col for col in df_export.columns
-                if col not in preferred_columns
-            ]
-            df_export = df_export[
-                [col for col in preferred_columns if col in df_export.columns]
-                + remaining_columns
-            ]
-
-            df_export = format_order_df(df_export)  # 中文＋✔✘
-
-            towrite = io.BytesIO()
-            df_export.to_excel(towrite, index=False, engine="openpyxl")
-            towrite.seek(0)
-
-            st.download_button(
-                label=f"📥 下載 {start_date}～{end_date} 報表",
-                data=towrite,
-                file_name=f"代購利潤報表_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+                # 匯出區間報表
+                st.markdown("### 📤 下載報表")
+                df_export = df_sel.copy()
+
+                # 匯出時保留本次計算使用的人民幣匯率
+                df_export["人民幣匯率"] = rmb_rate_float
+
+                # 調整匯出欄位順序，讓訂單類型與匯率資訊靠近金額欄位
+                preferred_columns = [
+                    "order_id",
+                    "order_time",
+                    "customer_name",
+                    "訂單類型",
+                    "platform",
+                    "tracking_number",
+                    "amount_rmb",
+                    "人民幣匯率",
+                    "適用定價匯率",
+                    "service_fee",
+                    "匯率價差利潤",
+                    "代購手續費收入",
+                    "總利潤",
+                    "weight_kg",
+                    "is_arrived",
+                    "is_returned",
+                    "is_early_returned",
+                    "remarks",
+                ]
+                remaining_columns = [
+                    col for col in df_export.columns
+                    if col not in preferred_columns
+                ]
+                df_export = df_export[
+                    [col for col in preferred_columns if col in df_export.columns]
+                    + remaining_columns
+                ]
+
+                export_fmt = format_picker("profit_export_format")
+                export_button(
+                    f"📥 下載 {start_date}～{end_date} 報表", "profit_report",
+                    lambda: format_order_df(df_export),  # 中文＋✔✘
+                    f"代購利潤報表_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}",
+                    fmt=export_fmt, conn=conn,
+                    params=(start_date, end_date, rmb_rate_float, payment_sell_rate, purchase_sell_rate),
+                )
 
 
-# 7. 快速報價
-elif menu == "💴 快速報價":
-    st.subheader("💴 快速報價小工具")
+    # 7. 快速報價
+    elif menu == "💴 快速報價":
+        st.subheader("💴 快速報價小工具")
 
-    rmb = st.number_input("商品價格（RMB）", min_value=0.00, step=0.01, format="%.2f")
-    base_sell_rate = st.number_input("一般客戶匯率", value=4.6, step=0.01)
-    vip_level = st.selectbox("VIP 等級", ["一般", "VIP1", "VIP2", "VIP3"])
+        rmb = st.number_input("商品價格（RMB）", min_value=0.00, step=0.01, format="%.2f")
+        base_sell_rate = st.number_input("一般客戶匯率", value=4.6, step=0.01)
+        vip_level = st.selectbox("VIP 等級", ["一般", "VIP1", "VIP2", "VIP3"])
 
-    # ===== 計算邏輯 =====
-    VIP_FEE_DISCOUNT = {"一般": 1.00, "VIP1": 0.90, "VIP2": 0.85, "VIP3": 0.80}
-    MIN_FEE = 20  # 折扣後手續費下限
+        # ===== 計算邏輯 =====
+        VIP_FEE_DISCOUNT = {"一般": 1.00, "VIP1": 0.90, "VIP2": 0.85, "VIP3": 0.80}
+        MIN_FEE = 20  # 折扣後手續費下限
 
-    def calc_base_fee(rmb: int) -> int:
-        # 以 500 RMB 為級距：0~499→30；每多一個 500 → +50
-        bin = rmb // 500
-        return 30 if bin == 0 else bin * 50
+        def calc_base_fee(rmb: int) -> int:
+            # 以 500 RMB 為級距：0~499→30；每多一個 500 → +50
+            bin = rmb // 500
+            return 30 if bin == 0 else bin * 50
 
-    def quote_twd(rmb: int, level: str, rate: float) -> int:
-        goods_ntd = rmb * rate
-        base_fee = calc_base_fee(rmb)
-        fee_after_discount = max(int(round(base_fee * VIP_FEE_DISCOUNT.get(level, 1.0))), MIN_FEE)
-        return int(round(goods_ntd + fee_after_discount))
+        def quote_twd(rmb: int, level: str, rate: float) -> int:
+            goods_ntd = rmb * rate
+            base_fee = calc_base_fee(rmb)
+            fee_after_discount = max(int(round(base_fee * VIP_FEE_DISCOUNT.get(level, 1.0))), MIN_FEE)
+            return int(round(goods_ntd + fee_after_discount))
 
-    if rmb > 0:
-        total_ntd = quote_twd(rmb, vip_level, base_sell_rate)
-        st.success(f"【報價單】\n商品價格：{rmb} RMB\n換算台幣價格：NT$ {total_ntd:,}")
+        if rmb > 0:
+            total_ntd = quote_twd(rmb, vip_level, base_sell_rate)
+            st.success(f"【報價單】\n商品價格：{rmb} RMB\n換算台幣價格：NT$ {total_ntd:,}")
 
-        # ===== 一鍵複製：報價文字（自動帶入） =====
+            # ===== 一鍵複製：報價文字（自動帶入） =====
 
-        # 折扣顯示文字（只負責顯示，不影響前面計算）
-        discount_label_map = {"一般": "原價", "VIP1": "9 折", "VIP2": "85 折", "VIP3": "8 折"}
-        discount_text = discount_label_map.get(vip_level, "原價")
+            # 折扣顯示文字（只負責顯示，不影響前面計算）
+            discount_label_map = {"一般": "原價", "VIP1": "9 折", "VIP2": "85 折", "VIP3": "8 折"}
+            discount_text = discount_label_map.get(vip_level, "原價")
 
-        # 顯示用字串
-        price_rmb = f"{rmb:.1f}".rstrip("0").rstrip(".")   # 150 -> "150", 150.0 -> "150"
-        price_twd = f"{total_ntd:,}"                       # 12345 -> "12,345"
+            # 顯示用字串
+            price_rmb = f"{rmb:.1f}".rstrip("0").rstrip(".")   # 150 -> "150", 150.0 -> "150"
+            price_twd = f"{total_ntd:,}"                       # 12345 -> "12,345"
 
-        quote_text = f"""【報價單】
+            quote_text = f"""【報價單】
  VIP 等級：{vip_level}（手續費 {discount_text}）
  商品價格：{price_rmb} RMB 
  換算台幣價格：{price_twd} 台幣 
  沒問題的話跟我說一聲～
  幫您扣款下單"""
 
-        # 預覽（方便手動複製）
-        st.text_area("要複製的內容（預覽）", value=quote_text, height=160)
+            # 預覽（方便手動複製）
+            st.text_area("要複製的內容（預覽）", value=quote_text, height=160)
 
-        # —— 高相容一鍵複製（不使用 navigator.clipboard；不使用 f-string/.format）——
-        import html as ihtml
-        import streamlit.components.v1 as components
+            # —— 高相容一鍵複製（不使用 navigator.clipboard；不使用 f-string/.format）——
+            import html as ihtml
+            import streamlit.components.v1 as components
 
-        escaped = ihtml.escape(quote_text).replace("\n", "&#10;")  # 保留換行
-        html_block = (
-            '''
+            escaped = ihtml.escape(quote_text).replace("\n", "&#10;")  # 保留換行
+            html_block = (
+                '''
             <div>
               <textarea id="copySrc" style="position:absolute;left:-9999px;top:-9999px">'''
-            + escaped +
-            '''</textarea>
+                + escaped +
+                '''</textarea>
               <button id="copyBtn" style="padding:8px 12px;border:none;border-radius:8px;cursor:pointer;">
                 📋 一鍵複製
               </button>
@@ -2207,26 +1536,26 @@ elif menu == "💴 快速報價":
               </script>
             </div>
             '''
-        )
-        components.html(html_block, height=60)
+            )
+            components.html(html_block, height=60)
 
-elif menu == "👤 會員管理":
-    st.subheader("👤 會員管理")
+    elif menu == "👤 會員管理":
+        st.subheader("👤 會員管理")
 
-    try:
-        if "members_synced" not in st.session_state:
-            sync_members_from_orders(conn)
-            st.session_state["members_synced"] = True
-    except Exception as e:
-        st.error(f"會員資料初始化失敗：{e}")
+        try:
+            if "members_synced" not in st.session_state:
+                sync_members_from_orders(conn)
+                st.session_state["members_synced"] = True
+        except Exception as e:
+            st.error(f"會員資料初始化失敗：{e}")
 
-    c1, c2 = st.columns(2)
-    with c1:
-        kw = st.text_input("搜尋會員姓名")
-    with c2:
-        level_filter = st.selectbox("會員等級", ["全部", "一般會員", "VIP1", "VIP2", "VIP3"])
+        c1, c2 = st.columns(2)
+        with c1:
+            kw = st.text_input("搜尋會員姓名")
+        with c2:
+            level_filter = st.selectbox("會員等級", ["全部", "一般會員", "VIP1", "VIP2", "VIP3"])
 
-    query = """
+        query = """
     SELECT
         m.member_id,
         m.customer_name,
@@ -2239,255 +1568,257 @@ elif menu == "👤 會員管理":
     FROM members m
     WHERE 1=1
     """
-    params = []
-
-    if kw.strip():
-        query += " AND m.customer_name LIKE %s"
-        params.append(f"%{kw.strip()}%")
+        params = []
 
-    if level_filter != "全部":
-        query += " AND m.member_level = %s"
-        params.append(level_filter)
+        if kw.strip():
+            query += " AND m.customer_name LIKE %s"
+            params.append(f"%{kw.strip()}%")
 
-    query += " ORDER BY m.updated_at DESC, m.member_id DESC"
+        if level_filter != "全部":
+            query += " AND m.member_level = %s"
+            params.append(level_filter)
 
-    try:
-        df_members = read_sql_df(query, conn, params=params)
-    except Exception as e:
-        st.error(f"讀取會員資料失敗：{e}")
-        st.stop()
+        query += " ORDER BY m.updated_at DESC, m.member_id DESC"
 
-    if df_members.empty:
-        st.info("目前沒有會員資料。")
-    else:
         try:
-            df_order_count = read_sql_df("""
+            df_members = read_sql_df(query, conn, params=params)
+        except Exception as e:
+            st.error(f"讀取會員資料失敗：{e}")
+            st.stop()
+
+        if df_members.empty:
+            st.info("目前沒有會員資料。")
+        else:
+            try:
+                df_order_count = read_sql_df("""
                 SELECT customer_name, COUNT(*) AS order_count
                 FROM orders
                 GROUP BY customer_name
             """, conn)
-            df_members = df_members.merge(df_order_count, on="customer_name", how="left")
-            df_members["order_count"] = df_members["order_count"].fillna(0).astype(int)
-        except Exception:
-            df_members["order_count"] = 0
-
-        df_show = df_members.rename(columns={
-            "member_id": "會員編號",
-            "customer_name": "客戶姓名",
-            "member_level": "會員等級",
-            "line_user_id": "LINE User ID",
-            "line_name": "LINE 名稱",
-            "note": "備註",
-            "created_at": "建立時間",
-            "updated_at": "更新時間",
-            "order_count": "訂單數"
-        })
-        st.dataframe(df_show, use_container_width=True, hide_index=True)
-
-        picked_member_id = st.selectbox("選擇要管理的會員", df_members["member_id"].tolist())
-        picked_row = df_members[df_members["member_id"] == picked_member_id].iloc[0]
-
-        st.markdown("### 會員資料編輯")
-        with st.form("member_edit_form"):
-            edit_level = st.selectbox(
-                "會員等級",
-                ["一般會員", "VIP1", "VIP2", "VIP3"],
-                index=["一般會員", "VIP1", "VIP2", "VIP3"].index(picked_row["member_level"])
-                if picked_row["member_level"] in ["一般會員", "VIP1", "VIP2", "VIP3"] else 0
-            )
-            edit_note = st.text_area("備註", value=picked_row["note"] or "")
-            save_member = st.form_submit_button("💾 儲存會員資料")
+                df_members = df_members.merge(df_order_count, on="customer_name", how="left")
+                df_members["order_count"] = df_members["order_count"].fillna(0).astype(int)
+            except Exception:
+                df_members["order_count"] = 0
 
-        if save_member:
-            try:
-                with conn.cursor() as cur:
-                    cur.execute("""
+            df_show = df_members.rename(columns={
+                "member_id": "會員編號",
+                "customer_name": "客戶姓名",
+                "member_level": "會員等級",
+                "line_user_id": "LINE User ID",
+                "line_name": "LINE 名稱",
+                "note": "備註",
+                "created_at": "建立時間",
+                "updated_at": "更新時間",
+                "order_count": "訂單數"
+            })
+            st.dataframe(df_show, use_container_width=True, hide_index=True)
+
+            picked_member_id = st.selectbox("選擇要管理的會員", df_members["member_id"].tolist())
+            picked_row = df_members[df_members["member_id"] == picked_member_id].iloc[0]
+
+            st.markdown("### 會員資料編輯")
+            with st.form("member_edit_form"):
+                edit_level = st.selectbox(
+                    "會員等級",
+                    ["一般會員", "VIP1", "VIP2", "VIP3"],
+                    index=["一般會員", "VIP1", "VIP2", "VIP3"].index(picked_row["member_level"])
+                    if picked_row["member_level"] in ["一般會員", "VIP1", "VIP2", "VIP3"] else 0
+                )
+                edit_note = st.text_area("備註", value=picked_row["note"] or "")
+                save_member = st.form_submit_button("💾 儲存會員資料")
+
+            if save_member:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("""
                         UPDATE members
                         SET member_level = %s,
                             note = %s
                         WHERE member_id = %s
                     """, (
-                        edit_level,
-                        edit_note,
-                        int(picked_member_id)
-                    ))
-                conn.commit()
-                st.success("會員資料已更新。")
-                st.rerun()
-            except Exception as e:
-                st.error(f"更新失敗：{e}")
+                            edit_level,
+                            edit_note,
+                            int(picked_member_id)
+                        ))
+                    bump_versions(conn, "members")
+                    conn.commit()
+                    st.success("會員資料已更新。")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"更新失敗：{e}")
 
-        st.markdown("### 📦 此會員訂單紀錄")
+            st.markdown("### 📦 此會員訂單紀錄")
 
-        try:
-            df_orders = read_sql_df("""
+            try:
+                df_orders = read_sql_df("""
                 SELECT *
                 FROM orders
                 WHERE customer_name = %s
                 ORDER BY order_time DESC, order_id DESC
             """, conn, params=[picked_row["customer_name"]])
 
-            if df_orders.empty:
-                st.caption("此會員目前沒有訂單紀錄。")
-            else:
-                st.dataframe(format_order_df(df_orders), use_container_width=True, hide_index=True)
-        except Exception as e:
-            st.error(f"讀取會員訂單紀錄失敗：{e}")
+                if df_orders.empty:
+                    st.caption("此會員目前沒有訂單紀錄。")
+                else:
+                    st.dataframe(format_order_df(df_orders), use_container_width=True, hide_index=True)
+            except Exception as e:
+                st.error(f"讀取會員訂單紀錄失敗：{e}")
 
 
-# "前台公告管理":
-elif menu == "📢 前台公告管理":
-    st.subheader("📢 前台公告管理")
-        # ===== 前台訂單資料更新時間 =====
-    st.markdown("### 🕒 訂單資料更新時間")
+    # "前台公告管理":
+    elif menu == "📢 前台公告管理":
+        st.subheader("📢 前台公告管理")
+            # ===== 前台訂單資料更新時間 =====
+        st.markdown("### 🕒 訂單資料更新時間")
 
-    df_update_time = read_sql_df("""
+        df_update_time = read_sql_df("""
         SELECT setting_value
         FROM site_settings
         WHERE setting_key = 'orders_last_update_time'
         LIMIT 1
     """, conn)
 
-    if df_update_time.empty:
-        st.caption("目前尚未設定訂單資料更新時間。")
-    else:
-        st.info(f"目前前台顯示：{df_update_time.iloc[0]['setting_value']}")
+        if df_update_time.empty:
+            st.caption("目前尚未設定訂單資料更新時間。")
+        else:
+            st.info(f"目前前台顯示：{df_update_time.iloc[0]['setting_value']}")
 
-    if st.button("✅ 更新前台訂單資料時間", use_container_width=True):
-        try:
-            taiwan_tz = timezone(timedelta(hours=8))
-            now_str = datetime.now(taiwan_tz).strftime("%Y/%m/%d %H:%M")
+        if st.button("✅ 更新前台訂單資料時間", use_container_width=True):
+            try:
+                taiwan_tz = timezone(timedelta(hours=8))
+                now_str = datetime.now(taiwan_tz).strftime("%Y/%m/%d %H:%M")
 
-            with conn.cursor() as cur:
-                cur.execute("""
+                with conn.cursor() as cur:
+                    cur.execute("""
                     INSERT INTO site_settings (setting_key, setting_value)
                     VALUES ('orders_last_update_time', %s)
                     ON DUPLICATE KEY UPDATE setting_value = VALUES(setting_value)
                 """, (now_str,))
 
-            conn.commit()
-            st.success(f"已更新前台訂單資料時間：{now_str}")
-            st.rerun()
+                bump_versions(conn, "site_settings")
+                conn.commit()
+                st.success(f"已更新前台訂單資料時間：{now_str}")
+                st.rerun()
 
-        except Exception as e:
-            st.error(f"更新失敗：{e}")
+            except Exception as e:
+                st.error(f"更新失敗：{e}")
 
-    st.divider()
+        st.divider()
 
-    # ===== 讀取目前匯率 =====
-    df_rate = read_sql_df(
-        "SELECT setting_value FROM site_settings WHERE setting_key = 'current_exchange_rate'",
-        conn
-    )
-    current_rate = 4.78
-    if not df_rate.empty:
-        try:
-            current_rate = float(df_rate.iloc[0]["setting_value"])
-        except:
-            current_rate = 4.78
+        # ===== 讀取目前匯率 =====
+        df_rate = read_sql_df(
+            "SELECT setting_value FROM site_settings WHERE setting_key = 'current_exchange_rate'",
+            conn
+        )
+        current_rate = 4.78
+        if not df_rate.empty:
+            try:
+                current_rate = float(df_rate.iloc[0]["setting_value"])
+            except:
+                current_rate = 4.78
 
-    st.markdown("### 💱 當前匯率")
-    new_rate = st.number_input("前台顯示匯率", min_value=0.0, value=float(current_rate), step=0.01)
+        st.markdown("### 💱 當前匯率")
+        new_rate = st.number_input("前台顯示匯率", min_value=0.0, value=float(current_rate), step=0.01)
 
-    if st.button("💾 儲存匯率", use_container_width=True):
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
+        if st.button("💾 儲存匯率", use_container_width=True):
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
                     INSERT INTO site_settings (setting_key, setting_value)
                     VALUES ('current_exchange_rate', %s)
                     ON DUPLICATE KEY UPDATE setting_value = VALUES(setting_value)
                 """, (str(new_rate),))
-            conn.commit()
-            st.success("已更新前台顯示匯率。")
-            st.rerun()
-        except Exception as e:
-            st.error(f"更新失敗：{e}")
+                bump_versions(conn, "site_settings")
+                conn.commit()
+                st.success("已更新前台顯示匯率。")
+                st.rerun()
+            except Exception as e:
+                st.error(f"更新失敗：{e}")
 
-    st.divider()
+        st.divider()
 
-    # ===== 新增船班 =====
-    st.markdown("### 🚢 近期運回船班")
+        # ===== 新增船班 =====
+        st.markdown("### 🚢 近期運回船班")
 
-    with st.form("add_shipping_batch_form"):
-        delivery_type = st.selectbox(
-            "適用運回方式",
-            ["宅配", "賣貨便"],
-            index=0
-        )
-        batch_text = st.text_input("船班文字", placeholder="例如：3/20 海快船班｜預計 3/23-3/24 到台")
-        sort_order = st.number_input("排序", min_value=0, step=1, value=0)
-        submitted = st.form_submit_button("➕ 新增船班")
+        with st.form("add_shipping_batch_form"):
+            delivery_type = st.selectbox(
+                "適用運回方式",
+                ["宅配", "賣貨便"],
+                index=0
+            )
+            batch_text = st.text_input("船班文字", placeholder="例如：3/20 海快船班｜預計 3/23-3/24 到台")
+            sort_order = st.number_input("排序", min_value=0, step=1, value=0)
+            submitted = st.form_submit_button("➕ 新增船班")
         
-    if submitted:
-        if not batch_text.strip():
-            st.warning("請輸入船班文字。")
-        else:
-            try:
-                with conn.cursor() as cur:
+        if submitted:
+            if not batch_text.strip():
+                st.warning("請輸入船班文字。")
+            else:
+                try:
+                    with conn.cursor() as cur:
                     
-                    delivery_type_db = "home_delivery" if delivery_type == "宅配" else "shop_delivery"
+                        delivery_type_db = "home_delivery" if delivery_type == "宅配" else "shop_delivery"
 
-                    cur.execute("""
+                        cur.execute("""
                         INSERT INTO shipping_batches (batch_text, delivery_type, sort_order, is_active)
                         VALUES (%s, %s, %s, 1)
                     """, (batch_text.strip(), delivery_type_db, int(sort_order)))
-                conn.commit()
-                st.success("已新增船班。")
-                st.rerun()
-            except Exception as e:
-                st.error(f"新增失敗：{e}")
+                    bump_versions(conn, "shipping_batches")
+                    conn.commit()
+                    st.success("已新增船班。")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"新增失敗：{e}")
 
-    # ===== 顯示目前船班 =====
-    df_batches = read_sql_df("""
+        # ===== 顯示目前船班 =====
+        df_batches = read_sql_df("""
         SELECT batch_id, batch_text, delivery_type, sort_order, is_active, updated_at
         FROM shipping_batches
         ORDER BY delivery_type ASC, is_active DESC, sort_order ASC, batch_id DESC
     """, conn)
 
-    if df_batches.empty:
-        st.info("目前沒有任何船班公告。")
-    else:
-        st.markdown("### 📋 目前船班列表")
+        if df_batches.empty:
+            st.info("目前沒有任何船班公告。")
+        else:
+            st.markdown("### 📋 目前船班列表")
+
+            df_show = df_batches.copy()
+            df_show["delivery_type"] = map_labels(df_show["delivery_type"], {"home_delivery": "宅配"}, "賣貨便")
+            df_show["is_active"] = check_marks(df_show["is_active"], "顯示中", "已隱藏")
+            df_show = df_show.rename(columns={
+                "batch_id": "編號",
+                "batch_text": "船班內容",
+                "delivery_type": "適用運回方式",
+                "sort_order": "排序",
+                "is_active": "狀態",
+                "updated_at": "更新時間"
+            })
+            st.dataframe(df_show, use_container_width=True, hide_index=True)
 
-        df_show = df_batches.copy()
-        df_show["delivery_type"] = df_show["delivery_type"].apply(
-            lambda x: "宅配" if x == "home_delivery" else "賣貨便"
-        )
-        df_show["is_active"] = df_show["is_active"].apply(lambda x: "顯示中" if x else "已隱藏")
-        df_show = df_show.rename(columns={
-            "batch_id": "編號",
-            "batch_text": "船班內容",
-            "delivery_type": "適用運回方式",
-            "sort_order": "排序",
-            "is_active": "狀態",
-            "updated_at": "更新時間"
-        })
-        st.dataframe(df_show, use_container_width=True, hide_index=True)
-
-        batch_ids = df_batches["batch_id"].tolist()
-        picked_batch_id = st.selectbox("選擇要操作的船班編號", batch_ids)
-
-        picked_row = df_batches[df_batches["batch_id"] == picked_batch_id].iloc[0]
-
-        current_delivery_label = "宅配" if picked_row["delivery_type"] == "home_delivery" else "賣貨便"
-
-        with st.form("edit_shipping_batch_form"):
-            edit_delivery_type = st.selectbox(
-                "適用運回方式",
-                ["宅配", "賣貨便"],
-                index=0 if current_delivery_label == "宅配" else 1
-            )
-            edit_text = st.text_input("修改船班內容", value=picked_row["batch_text"])
-            edit_sort = st.number_input("修改排序", min_value=0, step=1, value=int(picked_row["sort_order"]))
-            edit_active = st.checkbox("前台顯示", value=bool(picked_row["is_active"]))
-            save_batch = st.form_submit_button("💾 儲存船班修改")
+            batch_ids = df_batches["batch_id"].tolist()
+            picked_batch_id = st.selectbox("選擇要操作的船班編號", batch_ids)
 
-        if save_batch:
-            try:
-                with conn.cursor() as cur:
-                    edit_delivery_type_db = "home_delivery" if edit_delivery_type == "宅配" else "shop_delivery"
+            picked_row = df_batches[df_batches["batch_id"] == picked_batch_id].iloc[0]
 
-                    cur.execute("""
+            current_delivery_label = "宅配" if picked_row["delivery_type"] == "home_delivery" else "賣貨便"
+
+            with st.form("edit_shipping_batch_form"):
+                edit_delivery_type = st.selectbox(
+                    "適用運回方式",
+                    ["宅配", "賣貨便"],
+                    index=0 if current_delivery_label == "宅配" else 1
+                )
+                edit_text = st.text_input("修改船班內容", value=picked_row["batch_text"])
+                edit_sort = st.number_input("修改排序", min_value=0, step=1, value=int(picked_row["sort_order"]))
+                edit_active = st.checkbox("前台顯示", value=bool(picked_row["is_active"]))
+                save_batch = st.form_submit_button("💾 儲存船班修改")
+
+            if save_batch:
+                try:
+                    with conn.cursor() as cur:
+                        edit_delivery_type_db = "home_delivery" if edit_delivery_type == "宅配" else "shop_delivery"
+
+                        cur.execute("""
                         UPDATE shipping_batches
                         SET batch_text = %s,
                             delivery_type = %s,
@@ -2495,106 +1826,108 @@ elif menu == "📢 前台公告管理":
                             is_active = %s
                         WHERE batch_id = %s
                     """, (
-                        edit_text.strip(),
-                        edit_delivery_type_db,
-                        int(edit_sort),
-                        int(edit_active),
-                        int(picked_batch_id)
-                    ))
-                conn.commit()
-                st.success("已更新船班。")
-                st.rerun()
-            except Exception as e:
-                st.error(f"更新失敗：{e}")
+                            edit_text.strip(),
+                            edit_delivery_type_db,
+                            int(edit_sort),
+                            int(edit_active),
+                            int(picked_batch_id)
+                        ))
+                    bump_versions(conn, "shipping_batches")
+                    conn.commit()
+                    st.success("已更新船班。")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"更新失敗：{e}")
 
-        if st.button("🗑 刪除此船班", use_container_width=True):
-            try:
-                with conn.cursor() as cur:
-                    cur.execute("DELETE FROM shipping_batches WHERE batch_id = %s", (int(picked_batch_id),))
-                conn.commit()
-                st.success("已刪除船班。")
-                st.rerun()
-            except Exception as e:
-                st.error(f"刪除失敗：{e}")
+            if st.button("🗑 刪除此船班", use_container_width=True):
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("DELETE FROM shipping_batches WHERE batch_id = %s", (int(picked_batch_id),))
+                    bump_versions(conn, "shipping_batches")
+                    conn.commit()
+                    st.success("已刪除船班。")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"刪除失敗：{e}")
 
 
 
 
-elif menu == "📮 集運登記管理":
-    st.subheader("📮 集運登記管理")
+    elif menu == "📮 集運登記管理":
+        st.subheader("📮 集運登記管理")
 
-    df_reg = read_sql_df("""
+        df_reg = read_sql_df("""
         SELECT register_id, customer_name, tracking_number, item_name, quantity, unit_price_rmb, remarks, status, created_at
         FROM customer_forwarding_registers
         ORDER BY created_at DESC, register_id DESC
     """, conn)
 
-    if df_reg.empty:
-        st.info("目前沒有前台送出的集運登記資料。")
-    else:
-        df_show = df_reg.rename(columns={
-            "register_id": "登記編號",
-            "customer_name": "客戶名稱",
-            "tracking_number": "快遞單號",
-            "item_name": "內容物",
-            "quantity": "數量",
-            "unit_price_rmb": "單價（人民幣）",
-            "remarks": "備註",
-            "status": "狀態",
-            "created_at": "建立時間",
-        })
-
-        st.dataframe(df_show, use_container_width=True, hide_index=True)
-
-        reg_ids = df_reg["register_id"].tolist()
-        picked_reg_id = st.selectbox("選擇要處理的登記編號", reg_ids)
-
-        picked_row = df_reg[df_reg["register_id"] == picked_reg_id].iloc[0]
-
-        st.markdown("### 🔎 登記內容")
-        st.write(f"**客戶名稱：** {picked_row['customer_name']}")
-        st.write(f"**快遞單號：** {picked_row['tracking_number']}")
-        st.write(f"**內容物：** {picked_row['item_name']}")
-        st.write(f"**數量：** {picked_row['quantity']}")
-        st.write(f"**單價（人民幣）：** {picked_row['unit_price_rmb']}")
-        st.write(f"**備註：** {picked_row['remarks'] if picked_row['remarks'] else '—'}")
-        st.write(f"**狀態：** {picked_row['status']}")
+        if df_reg.empty:
+            st.info("目前沒有前台送出的集運登記資料。")
+        else:
+            df_show = df_reg.rename(columns={
+                "register_id": "登記編號",
+                "customer_name": "客戶名稱",
+                "tracking_number": "快遞單號",
+                "item_name": "內容物",
+                "quantity": "數量",
+                "unit_price_rmb": "單價（人民幣）",
+                "remarks": "備註",
+                "status": "狀態",
+                "created_at": "建立時間",
+            })
 
-        c1, c2 = st.columns(2)
+            st.dataframe(df_show, use_container_width=True, hide_index=True)
 
-        with c1:
-            if st.button("✅ 標記為已處理", use_container_width=True):
-                try:
-                    picked_row = df_reg[df_reg["register_id"] == picked_reg_id].iloc[0]
+            reg_ids = df_reg["register_id"].tolist()
+            picked_reg_id = st.selectbox("選擇要處理的登記編號", reg_ids)
 
-                    customer_name = str(picked_row["customer_name"]).strip()
-                    tracking_number = str(picked_row["tracking_number"]).strip()
-                    item_name = str(picked_row["item_name"]).strip()
-                    quantity = int(picked_row["quantity"])
-                    unit_price_rmb = float(picked_row["unit_price_rmb"])
-                    remarks = str(picked_row["remarks"]).strip() if pd.notna(picked_row["remarks"]) else ""
+            picked_row = df_reg[df_reg["register_id"] == picked_reg_id].iloc[0]
 
-                    amount_rmb = 0
+            st.markdown("### 🔎 登記內容")
+            st.write(f"**客戶名稱：** {picked_row['customer_name']}")
+            st.write(f"**快遞單號：** {picked_row['tracking_number']}")
+            st.write(f"**內容物：** {picked_row['item_name']}")
+            st.write(f"**數量：** {picked_row['quantity']}")
+            st.write(f"**單價（人民幣）：** {picked_row['unit_price_rmb']}")
+            st.write(f"**備註：** {picked_row['remarks'] if picked_row['remarks'] else '—'}")
+            st.write(f"**狀態：** {picked_row['status']}")
 
-                    df_exist = read_sql_df(
-                        "SELECT order_id FROM orders WHERE tracking_number = %s LIMIT 1",
-                        conn,
-                        params=[tracking_number]
-                    )
+            c1, c2 = st.columns(2)
 
-                    with conn.cursor() as cur:
-                        cur.execute(
-                            "UPDATE customer_forwarding_registers SET status='processed' WHERE register_id=%s",
-                            (picked_reg_id,)
-                        )
+            with c1:
+                if st.button("✅ 標記為已處理", use_container_width=True):
+                    try:
+                        picked_row = df_reg[df_reg["register_id"] == picked_reg_id].iloc[0]
 
-                        if df_exist.empty:
-                            auto_remarks = f"前台集運登記｜內容物：{item_name}｜數量：{quantity}｜單價：{unit_price_rmb} RMB"
-                            if remarks:
-                                auto_remarks += f"｜備註：{remarks}"
+                        customer_name = str(picked_row["customer_name"]).strip()
+                        tracking_number = str(picked_row["tracking_number"]).strip()
+                        item_name = str(picked_row["item_name"]).strip()
+                        quantity = int(picked_row["quantity"])
+                        unit_price_rmb = float(picked_row["unit_price_rmb"])
+                        remarks = str(picked_row["remarks"]).strip() if pd.notna(picked_row["remarks"]) else ""
 
+                        amount_rmb = 0
+
+                        df_exist = read_sql_df(
+                            "SELECT order_id FROM orders WHERE tracking_number = %s LIMIT 1",
+                            conn,
+                            params=[tracking_number]
+                        )
+
+                        with conn.cursor() as cur:
                             cur.execute(
-                                """
+                                "UPDATE customer_forwarding_registers SET status='processed' WHERE register_id=%s",
+                                (picked_reg_id,)
+                            )
+
+                            if df_exist.empty:
+                                auto_remarks = f"前台集運登記｜內容物：{item_name}｜數量：{quantity}｜單價：{unit_price_rmb} RMB"
+                                if remarks:
+                                    auto_remarks += f"｜備註：{remarks}"
+
+                                cur.execute(
+                                    """
                                 INSERT INTO orders
                                 (
                                     order_time,
@@ -2610,74 +1943,84 @@ elif menu == "📮 集運登記管理":
                                 )
                                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                                 """,
-                                (
-                                    datetime.today().date(),
-                                    customer_name,
-                                    "集運",
-                                    tracking_number,
-                                    amount_rmb,
-                                    0.0,
-                                    0,
-                                    0,
-                                    0.0,
-                                    auto_remarks
+                                    (
+                                        datetime.today().date(),
+                                        customer_name,
+                                        "集運",
+                                        tracking_number,
+                                        amount_rmb,
+                                        0.0,
+                                        0,
+                                        0,
+                                        0.0,
+                                        auto_remarks
+                                    )
                                 )
-                            )
         
-                    conn.commit()
+                        refresh_customers(conn, [customer_name])
+                        bump_versions(conn, "orders", "customer_forwarding_registers")
+                        conn.commit()
 
-                    if df_exist.empty:
-                        st.success("已標記為已處理，並成功新增到訂單。")
-                    else:
-                        st.warning("已標記為已處理，但 orders 已有相同單號，所以沒有重複新增訂單。")
+                        if df_exist.empty:
+                            sync_members_from_orders(conn)
+                            st.success("已標記為已處理，並成功新增到訂單。")
+                        else:
+                            st.warning("已標記為已處理，但 orders 已有相同單號，所以沒有重複新增訂單。")
 
-                    st.rerun()
+                        st.rerun()
 
-                except Exception as e:
-                    st.error(f"更新失敗：{e}")
+                    except Exception as e:
+                        st.error(f"更新失敗：{e}")
 
 
-# "匿名回饋管理":
-elif menu == "📮 匿名回饋管理":
-    st.subheader("📮 匿名回饋管理")
-
-    # 篩選列
-    c1, c2, c3 = st.columns([2,1,1])
-    with c1:
-        keyword = st.text_input("關鍵字（內容／備註）", key="adm_kw")
-    with c2:
-        status = st.selectbox("狀態", ["全部","未處理","已讀","已回覆","忽略"], index=0, key="adm_status")
-    with c3:
-        if st.button("重新整理"):
-            st.rerun()
-
-    rows = read_feedbacks(keyword, status)
-    df = pd.DataFrame(rows)
-    st.caption(f"共 {0 if df.empty else len(df)} 筆")
-    st.dataframe(
-        df if not df.empty else pd.DataFrame(columns=["id","created_at","content","status","staff_note"]),
-        use_container_width=True, hide_index=True
-    )
-
-    # 批次處理
-    st.subheader("批次處理")
-    ids_text = st.text_input("輸入要更新的 ID（逗號分隔）例：12,15,18", key="adm_ids")
-    ids = [int(x) for x in ids_text.split(",") if x.strip().isdigit()] if ids_text else []
-
-    cA, cB, cC = st.columns([1,1,2])
-    with cA:
-        new_status = st.selectbox("將狀態設為", ["已讀","已回覆","忽略"], key="adm_new_status")
-    with cC:
-        note = st.text_input("備註（選填，會覆蓋同欄位）", key="adm_note")
-    with cB:
-        if st.button("套用狀態"):
-            if not ids:
-                st.warning("請先輸入要更新的 ID")
-            else:
-                try:
-                    update_status(ids, new_status, note or None)
-                    st.success("已更新")
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"更新失敗：{e}")
+    # "匿名回饋管理":
+    elif menu == "📮 匿名回饋管理":
+        st.subheader("📮 匿名回饋管理")
+
+        # 篩選列
+        c1, c2, c3 = st.columns([2,1,1])
+        with c1:
+            keyword = st.text_input("關鍵字（內容／備註）", key="adm_kw")
+        with c2:
+            status = st.selectbox("狀態", ["全部","未處理","已讀","已回覆","忽略"], index=0, key="adm_status")
+        with c3:
+            if st.button("重新整理"):
+                st.rerun()
+
+        rows = read_feedbacks(keyword, status)
+        df = pd.DataFrame(rows)
+        st.caption(f"共 {0 if df.empty else len(df)} 筆")
+        st.dataframe(
+            df if not df.empty else pd.DataFrame(columns=["id","created_at","content","status","staff_note"]),
+            use_container_width=True, hide_index=True
+        )
+
+        # 批次處理
+        st.subheader("批次處理")
+        ids_text = st.text_input("輸入要更新的 ID（逗號分隔）例：12,15,18", key="adm_ids")
+        ids = [int(x) for x in ids_text.split(",") if x.strip().isdigit()] if ids_text else []
+
+        cA, cB, cC = st.columns([1,1,2])
+        with cA:
+            new_status = st.selectbox("將狀態設為", ["已讀","已回覆","忽略"], key="adm_new_status")
+        with cC:
+            note = st.text_input("備註（選填，會覆蓋同欄位）", key="adm_note")
+        with cB:
+            if st.button("套用狀態"):
+                if not ids:
+                    st.warning("請先輸入要更新的 ID")
+                else:
+                    try:
+                        update_status(ids, new_status, note or None)
+                        st.success("已更新")
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"更新失敗：{e}")
     
+
+
+    # ===== SQL 追蹤面板（側邊欄開啟時才顯示） =====
+    render_trace_panel(finish_rerun(menu))
+finally:
+    # 不管正常跑完、st.stop() / st.rerun() 還是例外提早結束，這一輪借的連線都還回池子
+    release_rerun_connection()
@@ -0,0 +1,12 @@
+"""效能量測腳本（不進 Streamlit，從專案根目錄執行）。
+
+    python -m benchmarks.bench_read_sql_df --rows 100000
+    python -m benchmarks.bench_shipping_fees --packages 50000
+    python -m benchmarks.bench_formatting --rows 100000
+    python -m benchmarks.bench_inbound_parser --lines 50000
+    python -m benchmarks.bench_inbound_files --lines 300000
+    python -m benchmarks.seed --scale 100k                  # 需要本機 MySQL / MariaDB
+    python -m benchmarks.bench_pages --scale 100k --compare
+    python -m benchmarks.explain_orders                     # orders 查詢不得全表掃描
+    python -m benchmarks.check_return_requests              # 運回申請處理的實機檢查（會 commit）
+"""
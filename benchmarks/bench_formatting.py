@@ -0,0 +1,136 @@
+# 表格顯示欄位：舊的逐列 apply / df.loc 和 table_format 整欄版本比較（不需要資料庫）。
+#
+#     python -m benchmarks.bench_formatting --rows 100000
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.seed import PURCHASE_PLATFORMS
+from table_format import (
+    ORDER_COLUMN_LABELS, arrival_status, check_marks, flag_tags, order_table, ratio_labels,
+)
+
+
+def make_orders(n, seed_value=20240601):
+    """n 筆訂單，只放顯示用得到的欄位；旗標大約照實際比例。"""
+    rnd = random.Random(seed_value)
+    rows = []
+    for i in range(n):
+        arrived = int(rnd.random() < 0.6)
+        rows.append((
+            i + 1,
+            f"客戶{rnd.randrange(max(20, n // 8)):06d}",
+            "集運" if rnd.random() < 0.4 else rnd.choice(PURCHASE_PLATFORMS),
+            "" if rnd.random() < 0.15 else f"SF{rnd.randrange(10**11):011d}",
+            round(rnd.uniform(0.05, 5), 2),
+            arrived,
+            int(arrived and rnd.random() < 0.5),
+            int(rnd.random() < 0.03),
+            int(rnd.random() < 0.1),
+            int(rnd.random() < 0.2),
+        ))
+    return pd.DataFrame(rows, columns=[
+        "order_id", "customer_name", "platform", "tracking_number", "weight_kg",
+        "is_arrived", "is_returned", "is_early_returned", "is_delayed", "is_notified",
+    ])
+
+
+# ===== 改版前的寫法 =====
+
+def legacy_order_table(df):
+    df = df.rename(columns=ORDER_COLUMN_LABELS)
+    for col in ["是否到貨", "是否已運回", "提前運回", "延後", "已通知"]:
+        df[col] = df[col].apply(lambda x: "✔" if x else "✘")
+    return df
+
+
+def legacy_flag_tags(df):
+    def row_tags(i):
+        tags = []
+        if df.loc[i, "is_delayed"]:
+            tags.append("⚠️ 延後")
+        if df.loc[i, "is_notified"]:
+            tags.append("📣 已通知")
+        return " / ".join(tags)
+    return [row_tags(i) for i in df.index]
+
+
+def legacy_delay_labels(summary):
+    def delay_label(row):
+        d = int(row["延後數"])
+        t = int(row["本次清單總筆數"])
+        if t == 0 or d == 0:
+            return ""
+        if d == t:
+            return f"⛔ 全部延後（{d}/{t}）"
+        return f"⚠️ 部分延後（{d}/{t}）"
+    return summary.apply(delay_label, axis=1)
+
+
+def legacy_arrival_status(df):
+    def get_arrived_status(row):
+        tracking = "" if pd.isna(row["tracking_number"]) else str(row["tracking_number"]).strip()
+        if int(row["is_arrived"]) == 1:
+            return "已到倉"
+        return "運送中" if tracking else "賣家尚未寄出"
+    return df.apply(get_arrived_status, axis=1)
+
+
+# ===== 量測 =====
+
+def best_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return min(times), result
+
+
+def same(a, b):
+    if isinstance(a, pd.DataFrame):
+        return a.equals(b)
+    return list(np.asarray(a, dtype=object)) == list(np.asarray(b, dtype=object))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="表格顯示欄位：逐列 vs 整欄")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    df = make_orders(args.rows)
+    summary = (
+        df.groupby("customer_name", as_index=False)
+          .agg(延後數=("is_delayed", "sum"), 本次清單總筆數=("order_id", "count"))
+    )
+
+    cases = [
+        ("✔/✘ 欄位", lambda: legacy_order_table(df), lambda: order_table(df)),
+        ("標記（延後/已通知）", lambda: legacy_flag_tags(df),
+         lambda: flag_tags(df["is_delayed"], df["is_notified"])),
+        (f"延後標籤（{len(summary):,} 位客戶）", lambda: legacy_delay_labels(summary),
+         lambda: ratio_labels(summary["延後數"], summary["本次清單總筆數"], "⛔ 全部延後", "⚠️ 部分延後")),
+        ("前台到倉狀態", lambda: legacy_arrival_status(df),
+         lambda: arrival_status(df["is_arrived"], df["tracking_number"])),
+        ("前台運回狀態", lambda: df["is_returned"].apply(lambda x: "已運回" if int(x) == 1 else "未運回"),
+         lambda: check_marks(df["is_returned"], "已運回", "未運回")),
+    ]
+
+    print(f"{args.rows:,} 筆訂單")
+    total_old = total_new = 0.0
+    for label, old_fn, new_fn in cases:
+        old_ms, old = best_ms(old_fn, args.repeat)
+        new_ms, new = best_ms(new_fn, args.repeat)
+        total_old += old_ms
+        total_new += new_ms
+        print(f"  {label:<24}{old_ms:>9.1f} ms → {new_ms:>7.1f} ms   "
+              f"({old_ms / max(new_ms, 1e-3):.0f}x){'' if same(old, new) else '  結果不一致！'}")
+    print(f"  {'合計':<24}{total_old:>9.1f} ms → {total_new:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# 倉庫檔案入庫：串流分段解析（inbound_files）的時間與記憶體高峰（不需要資料庫，不寫回訂單）。
+#
+#     python -m benchmarks.bench_inbound_files --lines 300000
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from openpyxl import Workbook
+
+from inbound_files import INGEST_CHUNK_LINES, iter_parsed_chunks
+from inbound_parser import parse_inbound
+
+
+def write_files(folder, n, seed_value=20240601):
+    """同一批包裹寫成 TXT（訊息格式）、CSV 與 XLSX（單號、重量兩欄）。"""
+    rnd = random.Random(seed_value)
+    packages = [(f"SF{rnd.randrange(10**13):013d}", f"{rnd.uniform(0.01, 8):.2f}") for _ in range(n)]
+    paths = {ext: os.path.join(folder, f"inbound.{ext}") for ext in ("txt", "csv", "xlsx")}
+    with open(paths["txt"], "w", encoding="utf-8") as f:
+        for tn, w in packages:
+            f.write(f"順豐快遞{tn}，入庫重量 {w} KG\n")
+    with open(paths["csv"], "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["快遞單號", "重量(KG)", "備註"])
+        writer.writerows((tn, w, "") for tn, w in packages)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["快遞單號", "重量(KG)"])
+    for tn, w in packages:
+        ws.append([tn, float(w)])
+    wb.save(paths["xlsx"])
+    return paths
+
+
+def measure(fn):
+    """(秒數, 記憶體高峰, 結果)；tracemalloc 本身很慢，時間另外跑一次不追蹤的量。"""
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def streamed(path, chunk_lines):
+    parsed = 0
+    with open(path, "rb") as f:
+        for _, chunk, _ in iter_parsed_chunks(f, os.path.basename(path), chunk_lines):
+            parsed += len(chunk)
+    return parsed
+
+
+def whole_text(path):
+    # 對照：整份讀進來再一次解析（等於把檔案內容貼進文字框）
+    with open(path, encoding="utf-8") as f:
+        return len(parse_inbound(f.read()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="倉庫檔案入庫：串流分段解析")
+    parser.add_argument("--lines", type=int, default=300_000)
+    parser.add_argument("--chunk", type=int, default=INGEST_CHUNK_LINES)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_files(folder, args.lines)
+        print(f"{args.lines:,} 行，每段 {args.chunk:,} 行")
+        cases = [(f"{ext.upper()} 串流", lambda p=path: streamed(p, args.chunk)) for ext, path in paths.items()]
+        cases.append(("TXT 整份一次解析", lambda: whole_text(paths["txt"])))
+        for label, fn in cases:
+            elapsed, peak, parsed = measure(fn)
+            print(f"  {label:<18}{elapsed:>7.2f} s   記憶體高峰 {peak / 2**20:>7.1f} MB   解析 {parsed:,} 筆")
+
+
+if __name__ == "__main__":
+    main()
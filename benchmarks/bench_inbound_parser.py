@@ -0,0 +1,80 @@
+# 入庫訊息解析：舊的逐行 re.search 迴圈和 inbound_parser 單次掃描比較（不需要資料庫）。
+#
+#     python -m benchmarks.bench_inbound_parser --lines 50000
+import argparse
+import random
+import re
+import time
+
+from inbound_parser import parse_inbound, round_weight
+
+# 改版前 📥 貼上入庫訊息 的樣式
+LEGACY_PATTERNS = [
+    r'([A-Z]{1,3}\d{8,})[^0-9]*入庫重量\s*([0-9.]+)\s*KG',
+    r'(\d{9,})[^0-9]*入庫重量\s*([0-9.]+)\s*KG',
+    r'單號[:：]?\s*([A-Z0-9]{8,})[^0-9]*重量[:：]?\s*([0-9.]+)',
+]
+
+
+def make_paste(n, seed_value=20240601):
+    """n 行入庫訊息：三種格式混雜，另有空行與聊天雜訊。"""
+    rnd = random.Random(seed_value)
+    lines = []
+    for _ in range(n):
+        r = rnd.random()
+        w = f"{rnd.uniform(0.01, 8):.2f}"
+        if r < 0.45:
+            lines.append(f"順豐快遞SF{rnd.randrange(10**13):013d}，入庫重量 {w} KG")
+        elif r < 0.75:
+            lines.append(f"中通快遞{rnd.randrange(10**14):014d}，入庫重量 {w} kg")
+        elif r < 0.85:
+            lines.append(f"  單號：YT{rnd.randrange(10**10):010d}  重量:{w}")
+        elif r < 0.92:
+            lines.append("")
+        else:
+            lines.append(rnd.choice(["您好，以下為今日入庫明細", "謝謝", "倉庫明天休息", "請確認"]))
+    return "\n".join(lines)
+
+
+def legacy_parse(raw):
+    found = []
+    for line in raw.splitlines():
+        t = line.strip()
+        if not t:
+            continue
+        for p in LEGACY_PATTERNS:
+            m = re.search(p, t, flags=re.IGNORECASE)
+            if m:
+                found.append((m.group(1), round_weight(float(m.group(2))), t))
+                break
+    return found
+
+
+def best_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return min(times), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="入庫訊息解析：逐行迴圈 vs 單次掃描")
+    parser.add_argument("--lines", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    raw = make_paste(args.lines)
+    old_ms, old = best_ms(lambda: legacy_parse(raw), args.repeat)
+    new_ms, new = best_ms(lambda: parse_inbound(raw), args.repeat)
+    same = old == [(r.tracking_number, r.weight_kg, r.source_line) for r in new]
+
+    print(f"{args.lines:,} 行，解析出 {len(new):,} 筆")
+    print(f"  逐行 re.search   {old_ms:>9.1f} ms")
+    print(f"  inbound_parser   {new_ms:>9.1f} ms   ({old_ms / max(new_ms, 1e-3):.1f}x)"
+          f"{'' if same else '  結果不一致！'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# 後台 / 前台各頁的資料處理量測（不開 Streamlit 畫面）。
+#
+#     python -m benchmarks.seed --scale 100k
+#     python -m benchmarks.bench_pages --scale 100k --save      # 存成基準
+#     python -m benchmarks.bench_pages --scale 100k --compare   # 和基準比較
+#
+# 每個階段在獨立的子程序裡跑，回報：耗時、SQL 次數、子程序的最高 RSS。
+# inbound_apply / retry_failed 會改資料，放在最後；要重跑同一組數字請加 --reseed。
+import argparse
+import json
+import multiprocessing as mp
+import resource
+import time
+from pathlib import Path
+
+from benchmarks.db import add_db_args, bench_connect, db_config
+from benchmarks.seed import parse_scale, seed
+
+BASELINE_DIR = Path(__file__).with_name("baselines")
+INBOUND_BATCH = 200
+
+
+# ===== SQL 計數 =====
+
+class CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, *args, **kwargs):
+        self._counter["queries"] += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._counter["queries"] += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+
+class CountingConnection:
+    """包一層連線，記下這段期間送出幾次 SQL。"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.counter = {"queries": 0}
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self.counter)
+
+
+# ===== 各頁的資料處理 =====
+
+def stage_dashboard(conn):
+    from order_store import load_dashboard_stats
+    return load_dashboard_stats(conn)
+
+
+def stage_shippable(conn):
+    """📦 可出貨名單 tab1：SQL 筆數 → 第一頁（100 筆）→ SQL 小計算統整。"""
+    from order_store import load_shippable_summary, shippable_page, shippable_totals
+    from shipping_fees import read_rates
+
+    totals = shippable_totals(conn)
+    page = shippable_page(conn, 0, 101)
+    summary = load_shippable_summary(conn, read_rates(conn))
+    return {"ready": totals["order_count"], "page": min(len(page), 100), "customers": len(summary)}
+
+
+def stage_profit(conn):
+    """💰 利潤報表：讀全部訂單 → 逐筆算利潤 → 篩本月。"""
+    import pandas as pd
+
+    from order_store import profit_report
+    from sql_frames import read_sql_df
+
+    df = read_sql_df("SELECT * FROM orders", conn)
+    df_valid = profit_report(df, 4.5, 4.78, 4.85)
+    month_start = pd.Timestamp.today().normalize().replace(day=1)
+    df_sel = df_valid[df_valid["order_time"] >= month_start]
+    return {"orders": len(df_valid), "this_month": len(df_sel), "profit": round(float(df_sel["總利潤"].sum()), 2)}
+
+
+def stage_customer_query(conn):
+    """前台 📦 查詢訂單：訂單最多的那位客戶，未運回 + 全部歷史各查一次。"""
+    from order_store import customer_orders
+
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT customer_name FROM orders
+            GROUP BY customer_name ORDER BY COUNT(*) DESC LIMIT 1
+        """)
+        name = cur.fetchone()[0]
+    conn.counter["queries"] = 0  # 挑客戶那一次不算
+
+    pending = customer_orders(conn, name, show_all=False)
+    history = customer_orders(conn, name, show_all=True)
+    return {"pending": len(pending), "history": len(history)}
+
+
+def inbound_batch(conn, n=INBOUND_BATCH):
+    """組一批入庫訊息：3/4 是未到貨訂單的單號，1/4 是不存在的單號。"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT tracking_number FROM orders
+            WHERE is_arrived = 0 AND tracking_number <> ''
+            ORDER BY tracking_number
+            LIMIT %s
+        """, (n * 3 // 4,))
+        known = [r[0] for r in cur.fetchall()]
+    unknown = [f"ZZ{i:012d}" for i in range(n - len(known))]
+    return [(tn, 0.35, f"順豐快遞{tn}，入庫重量 0.35 KG") for tn in known + unknown]
+
+
+def stage_inbound_apply(conn):
+    """📥 貼上入庫訊息 → 寫回訂單（失敗的進佇列）。"""
+    from inbound_store import apply_inbound
+
+    found = inbound_batch(conn)
+    conn.counter["queries"] = 0
+    updated, missing, _, _ = apply_inbound(conn, found)
+    return {"lines": len(found), "updated": updated, "missing": len(missing)}
+
+
+def stage_retry_failed(conn):
+    """📥 失敗佇列重試一輪（retry_worker；不管下次重試時間，整個佇列都試）。"""
+    from retry_worker import run_once
+
+    result = run_once(conn, run_by="bench", due_only=False)
+    return {"ok": result["succeeded"], "fail": result["still_failed"]}
+
+
+STAGES = {
+    "dashboard": stage_dashboard,
+    "shippable": stage_shippable,
+    "profit": stage_profit,
+    "customer_query": stage_customer_query,
+    "inbound_apply": stage_inbound_apply,
+    "retry_failed": stage_retry_failed,
+}
+
+
+# ===== 執行 =====
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux 單位是 KB
+
+
+def _run_stage(name, cfg, queue):
+    conn = CountingConnection(bench_connect(cfg))
+    try:
+        rss_before = _peak_rss_mb()
+        t0 = time.perf_counter()
+        info = STAGES[name](conn)
+        wall = time.perf_counter() - t0
+        queue.put({
+            "stage": name,
+            "wall_ms": round(wall * 1000, 1),
+            "queries": conn.counter["queries"],
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            "rss_growth_mb": round(_peak_rss_mb() - rss_before, 1),
+            "info": info,
+        })
+    finally:
+        conn.close()
+
+
+def run_stage(name, cfg):
+    """在乾淨的子程序裡跑一個階段，RSS 才不會被前一個階段墊高。"""
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_stage, args=(name, cfg, queue))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        raise RuntimeError(f"階段 {name} 執行失敗（exit code {proc.exitcode}）")
+    return queue.get()
+
+
+def compare(results, baseline):
+    base = {r["stage"]: r for r in baseline["results"]}
+    print(f"\n和基準比較（{baseline.get('saved_at', '')}）")
+    for r in results:
+        b = base.get(r["stage"])
+        if not b:
+            print(f"  {r['stage']:<16}（基準沒有這個階段）")
+            continue
+        delta = (r["wall_ms"] - b["wall_ms"]) / b["wall_ms"] * 100 if b["wall_ms"] else 0.0
+        print(
+            f"  {r['stage']:<16}{b['wall_ms']:>10.1f} → {r['wall_ms']:>10.1f} ms ({delta:+.0f}%)"
+            f"   SQL {b['queries']} → {r['queries']}"
+            f"   RSS {b['peak_rss_mb']:.0f} → {r['peak_rss_mb']:.0f} MB"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="各頁資料處理的耗時 / SQL 次數 / 記憶體")
+    parser.add_argument("--scale", default="10k", help="資料量標籤，需和 benchmarks.seed 灌的一致")
+    parser.add_argument("--stages", default=",".join(STAGES), help="逗號分隔，預設全部")
+    parser.add_argument("--reseed", action="store_true", help="量測前先重灌資料")
+    parser.add_argument("--save", action="store_true", help="把結果存成 baselines/<scale>.json")
+    parser.add_argument("--compare", action="store_true", help="和 baselines/<scale>.json 比較")
+    add_db_args(parser)
+    args = parser.parse_args(argv)
+
+    cfg = db_config(args)
+    if args.reseed:
+        conn = bench_connect(cfg)
+        try:
+            seed(conn, parse_scale(args.scale))
+        finally:
+            conn.close()
+
+    results = []
+    print(f"scale={args.scale}")
+    for name in [s.strip() for s in args.stages.split(",") if s.strip()]:
+        r = run_stage(name, cfg)
+        results.append(r)
+        print(
+            f"  {name:<16}{r['wall_ms']:>10.1f} ms   SQL {r['queries']:>5}"
+            f"   peak RSS {r['peak_rss_mb']:>7.1f} MB (+{r['rss_growth_mb']:.1f})   {r['info']}"
+        )
+
+    path = BASELINE_DIR / f"{args.scale.lower()}.json"
+    if args.compare:
+        if path.exists():
+            compare(results, json.loads(path.read_text(encoding="utf-8")))
+        else:
+            print(f"\n找不到基準檔 {path}，請先用 --save 建立。")
+    if args.save:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        payload = {"scale": args.scale, "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}
+        path.write_text(json.dumps(payload, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+        print(f"\n已存基準：{path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# 量測 read_sql_df：舊的 dictionary cursor + pd.DataFrame(rows) + to_numeric 修正
+# vs. sql_frames 的 fetchmany + 逐欄解碼。
+#
+# 不需要資料庫：用假的 cursor 回放 MySQL driver 會產生的 Python 值
+# （Decimal、date、0/1、str），兩條路徑拿到的是同一批資料。
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pandas as pd
+from mysql.connector.constants import FieldType
+
+from sql_frames import read_sql_df
+
+ORDER_COLUMNS = [
+    ("order_id", FieldType.LONG),
+    ("order_time", FieldType.DATE),
+    ("customer_name", FieldType.VAR_STRING),
+    ("platform", FieldType.VAR_STRING),
+    ("tracking_number", FieldType.VAR_STRING),
+    ("amount_rmb", FieldType.NEWDECIMAL),
+    ("service_fee", FieldType.NEWDECIMAL),
+    ("weight_kg", FieldType.NEWDECIMAL),
+    ("is_arrived", FieldType.TINY),
+    ("is_returned", FieldType.TINY),
+    ("is_early_returned", FieldType.TINY),
+    ("remarks", FieldType.BLOB),
+]
+DECIMAL_COLUMNS = ["amount_rmb", "service_fee", "weight_kg"]
+
+
+def make_rows(n, seed=7):
+    rnd = random.Random(seed)
+    platforms = ["集運", "淘寶", "拼多多", "閒魚", "1688"]
+    start = date(2023, 1, 1)
+    rows = []
+    for i in range(1, n + 1):
+        rows.append((
+            i,
+            start + timedelta(days=rnd.randrange(900)),
+            f"客戶{rnd.randrange(n // 20 + 1)}",
+            rnd.choice(platforms),
+            f"SF{rnd.randrange(10**12):012d}",
+            Decimal(f"{rnd.uniform(0, 2000):.2f}"),
+            Decimal(rnd.choice(["0.00", "30.00", "50.00", "100.00"])),
+            None if rnd.random() < 0.05 else Decimal(f"{rnd.uniform(0, 5):.2f}"),
+            rnd.random() < 0.7,
+            rnd.random() < 0.5,
+            rnd.random() < 0.05,
+            rnd.choice([None, "", "[延後]", "｜自動入庫 主筆=0.35kg"]),
+        ))
+    return rows
+
+
+class FakeCursor:
+    def __init__(self, rows, dictionary=False):
+        self._rows = rows
+        self._dictionary = dictionary
+        self._pos = 0
+        self.description = [(name, code, None, None, None, None, 1, 0, 45) for name, code in ORDER_COLUMNS]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        self._pos = 0
+
+    def _shape(self, rows):
+        if not self._dictionary:
+            return rows
+        names = [d[0] for d in self.description]
+        return [dict(zip(names, r)) for r in rows]  # dictionary cursor 每列建一個 dict
+
+    def fetchall(self):
+        rows, self._pos = self._rows[self._pos:], len(self._rows)
+        return self._shape(rows)
+
+    def fetchmany(self, size):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return self._shape(rows)
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self._rows, dictionary=dictionary)
+
+
+def legacy_read_sql_df(sql, conn, params=None):
+    """舊版 read_sql_df，加上各頁事後做的 DECIMAL → float 修正。"""
+    params = params or []
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute(sql, tuple(params))
+        rows = cur.fetchall()
+    df = pd.DataFrame(rows)
+    for col in DECIMAL_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0).astype(float)
+    return df
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = FakeConnection(make_rows(args.rows))
+    sql = "SELECT * FROM orders"
+
+    old = best_of(lambda: legacy_read_sql_df(sql, conn), args.repeat)
+    new = best_of(lambda: read_sql_df(sql, conn), args.repeat)
+
+    df = read_sql_df(sql, conn)
+    print(f"rows={args.rows:,}  repeat={args.repeat}（取最快一次）")
+    print(f"  舊：dict rows + to_numeric  {old * 1000:8.1f} ms")
+    print(f"  新：fetchmany + 逐欄解碼     {new * 1000:8.1f} ms   ({old / new:.1f}x)")
+    print("  新版欄位型別：" + ", ".join(f"{c}={t}" for c, t in df.dtypes.astype(str).items()))
+
+
+if __name__ == "__main__":
+    main()
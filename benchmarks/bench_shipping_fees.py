@@ -0,0 +1,77 @@
+# 可出貨統整的運費彙總：舊的逐列 apply 和 shipping_fees 向量化版本比較（不需要資料庫）。
+#
+#     python -m benchmarks.bench_shipping_fees --packages 50000
+import argparse
+import math
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.seed import PURCHASE_PLATFORMS
+from shipping_fees import DEFAULT_RATES, customer_fee_summary
+
+
+def make_packages(n, seed_value=20240601):
+    """n 筆待出貨包裹：約 n/8 位客戶、40% 集運，重量 0.05~5 kg（少數 0 kg）。"""
+    rnd = random.Random(seed_value)
+    n_customers = max(20, n // 8)
+    rows = []
+    for i in range(n):
+        platform = "集運" if rnd.random() < 0.4 else rnd.choice(PURCHASE_PLATFORMS)
+        weight = 0.0 if rnd.random() < 0.02 else round(rnd.uniform(0.05, 5), 2)
+        rows.append((i + 1, f"客戶{int(n_customers * rnd.random() ** 2):06d}", platform, weight))
+    return pd.DataFrame(rows, columns=["order_id", "customer_name", "platform", "weight_kg"])
+
+
+def legacy_summary(df):
+    """改版前 summarize_shippable 的算法（逐列 apply）。"""
+    def billed_weight(w, pf):
+        base = 1.0 if pf == "集運" else 0.5
+        return max(base, math.ceil(float(w) / 0.5) * 0.5)
+
+    df_nonzero = df[pd.to_numeric(df["weight_kg"], errors="coerce").fillna(0) > 0].copy()
+    grp = (
+        df_nonzero.groupby(["customer_name", "platform"], as_index=False)
+                  .agg(total_w=("weight_kg", "sum"), pkg_cnt=("order_id", "count"))
+    )
+    grp["billed_w"] = grp.apply(lambda r: billed_weight(r["total_w"], r["platform"]), axis=1)
+    grp["price_per_kg"] = grp["platform"].apply(lambda pf: 90.0 if pf == "集運" else 70.0)
+    grp["fee"] = grp["billed_w"] * grp["price_per_kg"]
+    return (
+        grp.groupby("customer_name", as_index=False)
+           .agg(包裹總數=("pkg_cnt", "sum"), 總公斤數=("total_w", "sum"), 總國際運費=("fee", "sum"))
+    )
+
+
+def best_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return min(times), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="運費彙總：逐列 apply vs 向量化")
+    parser.add_argument("--packages", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    df = make_packages(args.packages)
+    legacy_ms, legacy = best_ms(lambda: legacy_summary(df), args.repeat)
+    new_ms, new = best_ms(lambda: customer_fee_summary(df, DEFAULT_RATES), args.repeat)
+
+    merged = legacy.merge(new, on="customer_name", suffixes=("_old", "_new"))
+    same = len(merged) == len(legacy) == len(new) and np.allclose(merged["總國際運費_old"], merged["總國際運費_new"])
+
+    print(f"{args.packages:,} 筆包裹，{len(new):,} 位客戶")
+    print(f"  逐列 apply  {legacy_ms:>9.1f} ms")
+    print(f"  向量化      {new_ms:>9.1f} ms   ({legacy_ms / new_ms:.1f}x)")
+    print(f"  運費結果{'一致' if same else '不一致！'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# 運回申請處理的實機檢查：在量測資料庫建幾筆互相重疊的申請，跑 return_requests.process_requests，
+# 再逐筆核對訂單旗標與回報的筆數；任何一項對不上就以 exit code 1 結束。
+#
+#     python -m benchmarks.seed --scale 10k
+#     python -m benchmarks.check_return_requests
+#
+# process_requests 會 commit（改的是量測資料庫），重跑前請重新 seed。
+import argparse
+import sys
+
+from benchmarks.db import add_db_args, bench_connect
+from return_requests import process_requests
+
+# 一位客戶挑四張「到貨、未運回、不在任何申請裡」的訂單 a b c d，建四筆申請：
+#   1: a b（pending）  2: b c（pending）  3: c d（cancelled）  4: a（pending）
+# b 同時在 1、2，c 同時在 2、3，a 同時在 1、4 → 只能算給、記到編號最小的 pending 申請；d 不動。
+LAYOUT = [("pending", "ab"), ("pending", "bc"), ("cancelled", "cd"), ("pending", "a")]
+
+
+def pick_customers(conn):
+    """挑兩位客戶：一位還有未到貨的單（會提前運回）、一位沒有；各帶四張可用的訂單。"""
+    picked = []
+    for has_pending in (True, False):
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT o.customer_name
+                FROM orders o
+                JOIN customer_shipping_state s ON s.customer_name = o.customer_name
+                LEFT JOIN customer_return_request_items i ON i.order_id = o.order_id
+                WHERE o.is_arrived = 1 AND o.is_returned = 0 AND i.order_id IS NULL
+                  AND s.pending_count {'>' if has_pending else '='} 0
+                GROUP BY o.customer_name
+                HAVING COUNT(*) >= 4
+                LIMIT 1
+            """)
+            row = cur.fetchone()
+            if row is None:
+                continue
+            cur.execute("""
+                SELECT o.order_id
+                FROM orders o
+                LEFT JOIN customer_return_request_items i ON i.order_id = o.order_id
+                WHERE o.customer_name = %s AND o.is_arrived = 1 AND o.is_returned = 0
+                  AND i.order_id IS NULL
+                ORDER BY o.order_id
+                LIMIT 4
+            """, (row[0],))
+            picked.append((row[0], [r[0] for r in cur.fetchall()]))
+    return picked
+
+
+def create_requests(conn, customer, order_ids):
+    """依 LAYOUT 建申請；回傳 [(request_id, 狀態, [order_id, ...])]。"""
+    by_letter = dict(zip("abcd", order_ids))
+    created = []
+    with conn.cursor() as cur:
+        for status, letters in LAYOUT:
+            cur.execute("""
+                INSERT INTO customer_return_requests
+                (customer_name, selected_shipping_batch, total_count, status)
+                VALUES (%s, %s, %s, %s)
+            """, (customer, "檢查用船班", len(letters), status))
+            request_id = cur.lastrowid
+            ids = [by_letter[c] for c in letters]
+            cur.executemany(
+                "INSERT INTO customer_return_request_items (request_id, order_id) VALUES (%s, %s)",
+                [(request_id, oid) for oid in ids],
+            )
+            created.append((request_id, status, ids))
+    conn.commit()
+    return created
+
+
+def order_flags(conn, order_ids):
+    placeholders = ",".join(["%s"] * len(order_ids))
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT order_id, is_returned, is_early_returned, return_request_id, return_batch
+            FROM orders WHERE order_id IN ({placeholders})
+        """, order_ids)
+        return {r[0]: r[1:] for r in cur.fetchall()}
+
+
+def _flags(row):
+    returned, early_flag, request_id, batch = row
+    return int(returned), int(early_flag), request_id, batch
+
+
+def pending_count(conn, customer):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pending_count FROM customer_shipping_state WHERE customer_name = %s", (customer,))
+        row = cur.fetchone()
+    return int(row[0]) if row else 0
+
+
+def expected(requests, before, early):
+    """每張訂單的預期結果與每筆申請的預期筆數（只看 pending 申請，編號最小的擁有訂單）。"""
+    owner = {}
+    for request_id, status, ids in sorted(requests):
+        if status == "pending":
+            for oid in ids:
+                owner.setdefault(oid, request_id)
+    orders, counts = {}, {request_id: (0, 0) for request_id, _, _ in requests}
+    for oid, (returned, early_flag, request_id, batch) in before.items():
+        if oid in owner and not returned:
+            orders[oid] = (1, 1 if early else early_flag, owner[oid], "檢查用船班")
+            n, e = counts[owner[oid]]
+            counts[owner[oid]] = (n + 1, e + (1 if early else 0))
+        else:
+            orders[oid] = (returned, early_flag, request_id, batch)
+    return orders, counts
+
+
+def check(conn, customer, order_ids):
+    requests = create_requests(conn, customer, order_ids)
+    all_ids = sorted({oid for _, _, ids in requests for oid in ids})
+    before = order_flags(conn, all_ids)
+    early = pending_count(conn, customer) > 0
+    want_orders, want_counts = expected(requests, before, early)
+
+    result = process_requests(conn, [r[0] for r in requests]).set_index("request_id")
+    after = order_flags(conn, all_ids)
+
+    failures = []
+    for oid in all_ids:
+        got = _flags(after[oid])
+        ok = got == _flags(want_orders[oid])
+        print(f"  {'✔' if ok else '✘'} 訂單 {oid:<10}預期 {want_orders[oid]}  實際 {got}")
+        if not ok:
+            failures.append(f"{customer} 訂單 {oid}")
+    for request_id, status, _ in requests:
+        row = result.loc[request_id]
+        got = (int(row["to_return"]), int(row["early_count"]))
+        ok = got == want_counts[request_id] and bool(row["processed"]) == (status == "pending")
+        print(f"  {'✔' if ok else '✘'} 申請 {request_id:<10}({status}) 預期 運回/提前 {want_counts[request_id]}  "
+              f"實際 {got}，processed={bool(row['processed'])}")
+        if not ok:
+            failures.append(f"{customer} 申請 {request_id}")
+    total = int(result["to_return"].sum())
+    changed = sum(1 for oid in all_ids if after[oid][0] and not before[oid][0])
+    ok = total == changed
+    print(f"  {'✔' if ok else '✘'} 運回筆數加總 {total}，實際新運回訂單 {changed}")
+    if not ok:
+        failures.append(f"{customer} 加總")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="運回申請處理（process_requests）實機檢查")
+    add_db_args(parser)
+    args = parser.parse_args(argv)
+
+    conn = bench_connect(args)
+    try:
+        customers = pick_customers(conn)
+        if not customers:
+            print("找不到有四張以上可用訂單的客戶，請先執行 benchmarks.seed")
+            sys.exit(1)
+        failures = []
+        for customer, order_ids in customers:
+            print(f"客戶 {customer}：")
+            failures += check(conn, customer, order_ids)
+    finally:
+        conn.close()
+
+    if failures:
+        print(f"\n不符：{', '.join(failures)}")
+        sys.exit(1)
+    print("\n訂單旗標與回報筆數都正確。")
+
+
+if __name__ == "__main__":
+    main()
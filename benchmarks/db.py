@@ -0,0 +1,32 @@
+# 量測用的資料庫連線設定。
+#
+# 刻意不讀 .streamlit/secrets.toml：seed 會清空資料表，一定要明確指定量測用的資料庫。
+# 可以用參數或環境變數 BENCH_MYSQL_HOST / _PORT / _USER / _PASSWORD / _DATABASE。
+import os
+
+from db_pool import connect
+
+
+def add_db_args(parser):
+    env = os.environ.get
+    parser.add_argument("--host", default=env("BENCH_MYSQL_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(env("BENCH_MYSQL_PORT", "3306")))
+    parser.add_argument("--user", default=env("BENCH_MYSQL_USER", "root"))
+    parser.add_argument("--password", default=env("BENCH_MYSQL_PASSWORD", ""))
+    parser.add_argument("--database", default=env("BENCH_MYSQL_DATABASE", "jumao_bench"))
+    return parser
+
+
+def db_config(args):
+    return {
+        "host": args.host,
+        "port": args.port,
+        "user": args.user,
+        "password": args.password,
+        "database": args.database,
+    }
+
+
+def bench_connect(args_or_cfg):
+    cfg = args_or_cfg if isinstance(args_or_cfg, dict) else db_config(args_or_cfg)
+    return connect(cfg)
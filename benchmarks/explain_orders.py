@@ -0,0 +1,101 @@
+# 檢查 orders 常用查詢的執行計畫：任何一句對 orders 全表掃描（type=ALL）就以 exit code 1 結束。
+#
+#     python -m benchmarks.seed --scale 1m
+#     python -m benchmarks.explain_orders
+#
+# 查詢本身直接取自 order_store / inbound_store，改了 SQL 這裡會跟著檢查到。
+import argparse
+import sys
+
+from benchmarks.db import add_db_args, bench_connect
+from inbound_store import STAGING_APPLY_SQL, STAGING_MAIN_ORDER_SQL, stage_inbound
+from order_store import (
+    BATCH_PAGE_SQL, MONTH_ORDERS_SQL, READY_STATS_SQL,
+    SHIPPABLE_GROUPS_SQL, SHIPPABLE_PAGE_SQL, SHIPPABLE_TOTALS_SQL,
+    customer_orders_sql, like_prefix, month_range, order_search_query,
+)
+
+
+def sample_values(conn):
+    """從資料庫挑實際存在的值當參數：訂單最多的客戶、一個單號、最近的下單日。"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT customer_name FROM orders
+            GROUP BY customer_name ORDER BY COUNT(*) DESC LIMIT 1
+        """)
+        name = cur.fetchone()[0]
+        cur.execute("SELECT tracking_number FROM orders WHERE tracking_number <> '' LIMIT 1")
+        tn = cur.fetchone()[0]
+        cur.execute("SELECT MAX(order_time) FROM orders")
+        day = cur.fetchone()[0]
+    return name, tn, day
+
+
+def checked_queries(name, tn, day):
+    """(名稱, SQL, 參數)；名稱對應頁面上的用途。"""
+    edit_by_name = order_search_query(name_text=name[:2])
+    edit_by_tail = order_search_query(tracking_text=tn[-4:])
+    edit_by_day = order_search_query(day=day, returned=False)
+    return [
+        ("customer_pending", customer_orders_sql(show_all=False), [name]),
+        ("customer_history", customer_orders_sql(show_all=True), [name]),
+        ("inbound_main_order", STAGING_MAIN_ORDER_SQL, []),
+        ("inbound_apply", STAGING_APPLY_SQL, []),
+        ("dashboard_month", MONTH_ORDERS_SQL, list(month_range())),
+        ("dashboard_ready", READY_STATS_SQL, []),
+        ("shippable_page", SHIPPABLE_PAGE_SQL, [0, 101]),
+        ("shippable_totals", SHIPPABLE_TOTALS_SQL, []),
+        ("shippable_groups", SHIPPABLE_GROUPS_SQL, []),
+        ("batch_page", BATCH_PAGE_SQL, [like_prefix(name), 0, 101]),
+        ("edit_search_name", edit_by_name[0], edit_by_name[1]),
+        ("edit_search_tracking_tail", edit_by_tail[0], edit_by_tail[1]),
+        ("edit_search_day", edit_by_day[0], edit_by_day[1]),
+    ]
+
+
+def explain(conn, sql, params):
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute("EXPLAIN " + sql, tuple(params))
+        return cur.fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="orders 常用查詢的 EXPLAIN 檢查")
+    add_db_args(parser)
+    args = parser.parse_args(argv)
+
+    conn = bench_connect(args)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM orders")
+            total = cur.fetchone()[0]
+        print(f"orders：{total:,} 筆")
+
+        samples = sample_values(conn)
+        # 入庫的 UPDATE 要 JOIN 連線自己的暫存表：先放一筆（最後 rollback）
+        stage_inbound(conn, [(samples[1], 0.35, "")])
+
+        failures = []
+        for label, sql, params in checked_queries(*samples):
+            for row in explain(conn, sql, params):
+                if row.get("table") != "orders":
+                    continue
+                full_scan = row.get("type") == "ALL"
+                print(
+                    f"  {'✘' if full_scan else '✔'} {label:<28}type={row.get('type')!s:<12}"
+                    f"key={row.get('key')!s:<26}rows={row.get('rows')!s:<10}{row.get('Extra') or ''}"
+                )
+                if full_scan:
+                    failures.append(label)
+    finally:
+        conn.rollback()
+        conn.close()
+
+    if failures:
+        print(f"\n全表掃描：{', '.join(failures)}")
+        sys.exit(1)
+    print("\n全部查詢都有用到索引。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+# 產生假資料並灌進一個「本機」MySQL / MariaDB（不要指向正式機）。
+#
+#     python -m benchmarks.seed --scale 100k --database jumao_bench
+#
+# 會先跑 migrations 建表，再清空所有業務資料表重灌。資料用固定亂數種子產生，
+# 同一個 --scale 每次灌出來的內容都一樣（日期以當天往回推一年），量測結果才能互相比較。
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks.db import add_db_args, bench_connect
+from migrations import migrate
+from shipping_state import rebuild_all
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+INSERT_CHUNK = 5000
+
+PURCHASE_PLATFORMS = ["淘寶", "拼多多", "閒魚", "1688", "微店", "小紅書", "抖音", "京東", "得物"]
+
+SEEDED_TABLES = [
+    "customer_return_request_items",
+    "customer_return_requests",
+    "customer_forwarding_registers",
+    "customer_shipping_state",
+    "failed_orders",
+    "inbound_retry_runs",
+    "feedbacks",
+    "members",
+    "orders",
+]
+
+
+def parse_scale(text):
+    key = str(text).lower()
+    if key in SCALES:
+        return SCALES[key]
+    return int(key.replace("_", ""))
+
+
+def customer_name(i):
+    return f"客戶{i:06d}"
+
+
+def tracking_number(rnd):
+    if rnd.random() < 0.5:
+        return f"SF{rnd.randrange(10**13):013d}"
+    return f"{rnd.randrange(10**13, 10**14)}"
+
+
+def fake_flags(rnd, arrived):
+    """回傳 (延後, 已通知, 備註)：少數訂單帶旗標；到貨的有些留著自動入庫的文字，大部分沒有備註。"""
+    r = rnd.random()
+    delayed = r < 0.05 or 0.10 <= r < 0.12
+    notified = 0.05 <= r < 0.12
+    remarks = None
+    if arrived and rnd.random() < 0.3:
+        remarks = f"｜自動入庫({datetime(2025, 1, 1):%Y-%m-%d %H:%M:%S}) 主筆={rnd.uniform(0.1, 3):.2f}kg"
+    elif rnd.random() >= 0.7:
+        remarks = ""
+    return int(delayed), int(notified), remarks
+
+
+def generate_orders(n, rnd, today=None):
+    """回傳 orders 的列（不含 order_id，由 AUTO_INCREMENT 依序編號 1..n）。
+
+    約 40% 是集運、60% 是代購；約 3% 的單號和前面某筆重複（同一包裹拆多筆訂單）。
+    """
+    today = today or date.today()
+    n_customers = max(20, n // 8)
+    rows = []
+    issued = []
+    for _ in range(n):
+        cust = customer_name(int(n_customers * rnd.random() ** 2))  # 少數熟客下很多單
+        is_forwarding = rnd.random() < 0.4
+        platform = "集運" if is_forwarding else rnd.choice(PURCHASE_PLATFORMS)
+
+        if issued and rnd.random() < 0.03:
+            tn = rnd.choice(issued[-500:])
+        elif rnd.random() < 0.05:
+            tn = ""  # 賣家尚未寄出
+        else:
+            tn = tracking_number(rnd)
+            issued.append(tn)
+
+        arrived = bool(tn) and rnd.random() < 0.6
+        returned = arrived and rnd.random() < 0.35
+        early = arrived and not returned and rnd.random() < 0.03
+        amount = 0.0 if is_forwarding else round(rnd.uniform(5, 2000), 2)
+        fee = 0.0 if is_forwarding else float(30 if amount < 500 else int(amount // 500) * 50)
+
+        rows.append((
+            today - timedelta(days=rnd.randrange(365)),
+            cust,
+            platform,
+            tn,
+            amount,
+            round(rnd.uniform(0.05, 5), 2) if arrived else 0.0,
+            int(arrived),
+            int(returned),
+            int(early),
+            int(early),
+            fee,
+            *fake_flags(rnd, arrived),
+        ))
+    return rows
+
+
+def insert_many(conn, sql, rows):
+    with conn.cursor() as cur:
+        for start in range(0, len(rows), INSERT_CHUNK):
+            cur.executemany(sql, rows[start:start + INSERT_CHUNK])
+            conn.commit()
+
+
+def seed(conn, n_orders, seed_value=20240601):
+    """清空並重灌所有業務資料表；回傳各表列數。"""
+    rnd = random.Random(seed_value)
+    migrate(conn)
+
+    with conn.cursor() as cur:
+        cur.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for table in SEEDED_TABLES:
+            cur.execute(f"TRUNCATE TABLE {table}")
+        cur.execute("SET FOREIGN_KEY_CHECKS = 1")
+        cur.execute(
+            "DELETE FROM site_settings WHERE setting_key <> 'current_exchange_rate'"
+        )
+    conn.commit()
+
+    orders = generate_orders(n_orders, rnd)
+    insert_many(conn, """
+        INSERT INTO orders
+        (order_time, customer_name, platform, tracking_number, amount_rmb, weight_kg,
+         is_arrived, is_returned, is_early_returned, early_return, service_fee,
+         is_delayed, is_notified, remarks)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, orders)
+    rebuild_all(conn)  # 直接灌進 orders 的資料不會經過 refresh_customers
+    conn.commit()
+
+    names = sorted({r[1] for r in orders})
+    members = [
+        (name, rnd.choice(["一般會員", "一般會員", "VIP1", "VIP2", "VIP3"]),
+         f"U{rnd.randrange(16**12):012x}" if rnd.random() < 0.4 else None)
+        for name in names
+    ]
+    insert_many(conn, """
+        INSERT INTO members (customer_name, member_level, line_user_id)
+        VALUES (%s, %s, %s)
+    """, members)
+
+    # 入庫失敗佇列：一半對得到既有訂單（重試會成功），一半是不存在的單號
+    n_failed = max(50, n_orders // 100)
+    known = [r[3] for r in orders if r[3] and not r[6]]
+    failed = {}
+    while len(failed) < n_failed:
+        tn = rnd.choice(known) if known and rnd.random() < 0.5 else tracking_number(rnd)
+        w = round(rnd.uniform(0.05, 5), 2)
+        failed[tn] = (tn, w, f"順豐快遞{tn}，入庫重量 {w} KG", rnd.randrange(1, 6), "找不到對應訂單")
+    insert_many(conn, """
+        INSERT INTO failed_orders (tracking_number, weight_kg, raw_message, retry_count, last_error)
+        VALUES (%s, %s, %s, %s, %s)
+    """, list(failed.values()))
+
+    # 前台運回申請：從「到貨、未運回」的訂單挑 1~5 筆
+    ready_by_customer = {}
+    for order_id, r in enumerate(orders, start=1):
+        if r[6] and not r[7]:
+            ready_by_customer.setdefault(r[1], []).append((order_id, r))
+    n_requests = min(len(ready_by_customer), max(10, n_orders // 200))
+    request_rows, item_rows = [], []
+    for request_id, cust in enumerate(rnd.sample(sorted(ready_by_customer), n_requests), start=1):
+        picked = rnd.sample(ready_by_customer[cust], min(len(ready_by_customer[cust]), rnd.randint(1, 5)))
+        total_w = round(sum(r[5] for _, r in picked), 3)
+        method = rnd.choice(["面交/自取", "宅配", "賣貨便"])
+        request_rows.append((
+            cust, method if method == "面交/自取" else f"{date.today():%m/%d} 出貨船班", method,
+            len(picked), total_w, round(total_w * 90),
+            rnd.choice(["pending", "pending", "processed", "cancelled"]),
+        ))
+        item_rows.extend((request_id, oid, r[3], r[2], r[5]) for oid, r in picked)
+    insert_many(conn, """
+        INSERT INTO customer_return_requests
+        (customer_name, selected_shipping_batch, delivery_method, total_count,
+         total_weight, estimated_fee, status)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, request_rows)
+    insert_many(conn, """
+        INSERT INTO customer_return_request_items
+        (request_id, order_id, tracking_number, platform, weight_kg)
+        VALUES (%s, %s, %s, %s, %s)
+    """, item_rows)
+
+    registers = {}
+    for _ in range(max(20, n_orders // 50)):
+        tn = tracking_number(rnd)
+        registers[tn] = (
+            customer_name(rnd.randrange(len(names))), tn, rnd.choice(["衣服", "鞋子", "文具", "零食"]),
+            rnd.randint(1, 5), round(rnd.uniform(5, 500), 2), None,
+            rnd.choice(["pending", "processed", "cancelled"]),
+        )
+    insert_many(conn, """
+        INSERT INTO customer_forwarding_registers
+        (customer_name, tracking_number, item_name, quantity, unit_price_rmb, remarks, status)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, list(registers.values()))
+
+    feedbacks = [
+        (f"匿名回饋 #{i}", rnd.choice(["未處理", "已讀", "已回覆", "忽略"]))
+        for i in range(max(10, n_orders // 100))
+    ]
+    insert_many(conn, "INSERT INTO feedbacks (content, status) VALUES (%s, %s)", feedbacks)
+
+    return {
+        "orders": len(orders),
+        "members": len(members),
+        "failed_orders": len(failed),
+        "customer_return_requests": len(request_rows),
+        "customer_return_request_items": len(item_rows),
+        "customer_forwarding_registers": len(registers),
+        "feedbacks": len(feedbacks),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="產生效能量測用的假資料")
+    parser.add_argument("--scale", default="10k", help="10k / 100k / 1m 或直接給訂單筆數")
+    parser.add_argument("--seed", type=int, default=20240601)
+    add_db_args(parser)
+    args = parser.parse_args(argv)
+
+    conn = bench_connect(args)
+    try:
+        t0 = time.perf_counter()
+        counts = seed(conn, parse_scale(args.scale), args.seed)
+        print(f"灌資料完成（{time.perf_counter() - t0:.1f} 秒）")
+        for table, n in counts.items():
+            print(f"  {table:<32}{n:>10,}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# bulk_ops.py —— 依 ID 清單批次更新 / 刪除（訂單、運回申請、回饋、入庫失敗佇列）
+#
+# 以前每個批次按鈕自己組一句 WHERE id IN (%s, %s, ...)，勾幾筆就有幾個參數，
+# 一整季幾千筆就是一句超長 SQL；有些還直接用全域 cursor、失敗時沒有 rollback。
+# 現在固定每 BULK_CHUNK 筆一句（SQL 形狀固定），全部包在 bulk_transaction 的同一個交易裡：
+# 全部成功才 commit，版本號只 bump 一次；任何一句失敗整批 rollback。
+from contextlib import contextmanager
+
+from data_versions import bump_versions
+
+BULK_CHUNK = 1000
+
+
+def chunked(ids, size=BULK_CHUNK):
+    """去重、保留順序後每 size 筆切一段。"""
+    unique = list(dict.fromkeys(ids))
+    return [unique[start:start + size] for start in range(0, len(unique), size)]
+
+
+def bulk_update(conn, table, key, ids, set_sql, set_params=(), where="", where_params=(), chunk=BULK_CHUNK):
+    """UPDATE table SET set_sql WHERE key IN (...) [AND where]，分段執行；回傳異動筆數。
+
+    不 commit，請在 bulk_transaction 裡呼叫（或由呼叫端自己 commit）。
+    """
+    extra = f" AND {where}" if where else ""
+    total = 0
+    with conn.cursor() as cur:
+        for part in chunked(ids, chunk):
+            placeholders = ",".join(["%s"] * len(part))
+            cur.execute(
+                f"UPDATE {table} SET {set_sql} WHERE {key} IN ({placeholders}){extra}",
+                list(set_params) + list(part) + list(where_params),
+            )
+            total += max(cur.rowcount, 0)
+    return total
+
+
+def bulk_delete(conn, table, key, ids, chunk=BULK_CHUNK):
+    """DELETE FROM table WHERE key IN (...)，分段執行；回傳刪除筆數。不 commit。"""
+    total = 0
+    with conn.cursor() as cur:
+        for part in chunked(ids, chunk):
+            placeholders = ",".join(["%s"] * len(part))
+            cur.execute(f"DELETE FROM {table} WHERE {key} IN ({placeholders})", list(part))
+            total += max(cur.rowcount, 0)
+    return total
+
+
+@contextmanager
+def bulk_transaction(conn, *tables):
+    """一次批次操作 = 一個交易；離開時 bump 這些表的版本並 commit，例外時 rollback。"""
+    try:
+        yield
+        bump_versions(conn, *tables)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
@@ -1,48 +1,45 @@
 import streamlit as st
 import pandas as pd
-import mysql.connector
 from mysql.connector import Error
 import streamlit.components.v1 as components
 
 # 🔸 匿名回饋（MySQL 小表）
-from feedback_store import init_db, insert_feedback
+from feedback_store import insert_feedback
+from db_pool import get_connection  # 訂單查詢與回饋共用同一個連線池
+from migrations import ensure_schema
+from query_cache import cached_query
+from shipping_state import customer_state
+from sql_trace import start_rerun, finish_rerun, trace_enabled_by_env
+from table_format import mark_columns
 
 st.set_page_config(page_title=" 橘貓代購｜訂單查詢 & 匿名回饋", page_icon="🧡", layout="centered")
 
-# 初始化回饋表（不存在就建立）
-init_db()
-
-# ===== 你的 MySQL（訂單）連線 =====
-db_cfg = st.secrets["mysql"]
-def get_connection():
-    return mysql.connector.connect(
-        host=st.secrets["mysql"]["host"],
-        port=int(st.secrets["mysql"]["port"]),
-        user=st.secrets["mysql"]["user"],
-        password=st.secrets["mysql"]["password"],
-        database=st.secrets["mysql"]["database"],
-        charset="utf8mb4",
-        connection_timeout=10,
-    )
+# SQL 耗時追蹤：只在環境變數 JUMAO_TRACE=1 時開啟，結果寫進 JSONL（sql_trace.py）
+start_rerun("customer_app", enabled=trace_enabled_by_env())
+
+# 資料表版本檢查（含回饋表）：每個程序只做一次，不再每次 rerun 跑 CREATE TABLE
+ensure_schema()
 
 #時間更新
-def get_orders_last_update_time():
-    try:
-        conn = get_connection()
-        sql = """
-            SELECT setting_value
-            FROM site_settings
-            WHERE setting_key = 'orders_last_update_time'
-            LIMIT 1
-        """
+@cached_query("site_settings")  # 後台更新時間後，data_versions 版本號變了才重查
+def _orders_last_update_setting():
+    sql = """
+        SELECT setting_value
+        FROM site_settings
+        WHERE setting_key = 'orders_last_update_time'
+        LIMIT 1
+    """
+    with get_connection() as conn:
         df = pd.read_sql(sql, conn)
-        conn.close()
 
-        if df.empty or pd.isna(df.loc[0, "setting_value"]):
-            return "尚未更新"
+    if df.empty or pd.isna(df.loc[0, "setting_value"]):
+        return None
+    return str(df.loc[0, "setting_value"])
 
-        return str(df.loc[0, "setting_value"])
 
+def get_orders_last_update_time():
+    try:
+        return _orders_last_update_setting() or "尚未更新"
     except Exception:
         return "讀取失敗"
 
@@ -117,13 +114,15 @@ def page_orders():
         if not name.strip():
             st.warning("請先輸入姓名")
         else:
+            conn = None
             try:
                 conn = get_connection()
 
-                wheres = ["LOWER(TRIM(customer_name)) = LOWER(%s)"]
+                # 欄位定序不分大小寫、姓名入庫前已去空白，直接等號比對才用得到索引
+                wheres = ["customer_name = %s"]
                 params = [name.strip()]
                 if only_incomplete:
-                    wheres.append("(is_returned = 0 OR is_returned IS NULL)")
+                    wheres.append("is_returned = 0")
                 where_sql = " WHERE " + " AND ".join(wheres)
 
                 sql = f"""
@@ -142,32 +141,25 @@ def page_orders():
                 """
                 df = pd.read_sql(sql, conn, params=params)
 
-                stat_sql = """
-                    SELECT
-                      COUNT(*) AS cnt,
-                      COALESCE(SUM(weight_kg), 0) AS total_weight
-                    FROM orders
-                    WHERE LOWER(TRIM(customer_name)) = LOWER(%s)
-                      AND is_arrived = 1
-                      AND (is_returned = 0 OR is_returned IS NULL)
-                """
-                stat = pd.read_sql(stat_sql, conn, params=[name.strip()]).iloc[0]
-                conn.close()
+                # 已到倉未運回的件數 / 重量：讀 customer_shipping_state 一列（shipping_state.py 維護）
+                stat = customer_state(conn, name)
 
                 st.subheader("📦 已到倉包裹總計")
                 m1, m2 = st.columns(2)
-                m1.metric("包裹數量", int(stat["cnt"]))
-                m2.metric("重量總重（kg）", f"{float(stat['total_weight']):.2f}")
+                m1.metric("包裹數量", stat["arrived_count"])
+                m2.metric("重量總重（kg）", f"{stat['arrived_weight']:.2f}")
 
                 if df.empty:
                     st.info("查無符合條件的訂單。")
                 else:
-                    df["是否到貨"] = df["是否到貨"].fillna(0).apply(lambda x: "✔️" if x else "❌")
-                    df["是否運回"] = df["是否運回"].fillna(0).apply(lambda x: "✔️" if x else "❌")
+                    mark_columns(df, ["是否到貨", "是否運回"], "✔️", "❌")
                     st.dataframe(df, use_container_width=True)
 
             except Error as e:
                 st.error(f"資料庫錯誤：{e}")
+            finally:
+                if conn is not None:
+                    conn.close()
 
 # ===== 匿名回饋頁（無聯絡方式/驗證/頻率限制）=====
 def page_feedback():
@@ -232,4 +224,4 @@ A：以【包裹實重】為準；若多件包裹會合併計算。實際費用
 A：可以，我們會在同一批次盡量合併；如需分批或加急請先告知橘貓。
 """)
 
-
+finish_rerun(page)
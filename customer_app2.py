@@ -1,8 +1,18 @@
 import streamlit as st
 import pandas as pd
-import mysql.connector
 from datetime import datetime
 
+from db_pool import get_connection
+from migrations import ensure_schema
+from order_store import customer_orders
+from query_cache import cached_query
+from shipping_fees import (
+    FORWARDING, PURCHASE, load_rates, shipping_fees, delivery_fee, estimate_return_fee, rate_description,
+)
+from data_versions import bump_versions
+from sql_trace import start_rerun, finish_rerun, trace_enabled_by_env
+from table_format import arrival_status, check_marks
+
 # =============================
 # 基本設定
 # =============================
@@ -15,106 +25,61 @@ st.set_page_config(
 # =============================
 # 資料庫連線
 # =============================
-def get_connection():
-    conn = mysql.connector.connect(
-        host=st.secrets["mysql"]["host"],
-        port=int(st.secrets["mysql"]["port"]),
-        user=st.secrets["mysql"]["user"],
-        password=st.secrets["mysql"]["password"],
-        database=st.secrets["mysql"]["database"],
-        charset="utf8mb4",
-        connection_timeout=10,
-    )
-    cur = conn.cursor()
-    cur.execute("SET time_zone = '+08:00'")
-    cur.close()
-    return conn
-
-def get_current_exchange_rate():
-    conn = get_connection()
-    try:
+# 共用連線池（db_pool.py）：時區在建立實體連線時已設定，
+# get_connection() 借出的連線 close() 時會歸還到池子。
+
+# 熱門讀取走 query_cache：快取命中時連池子都不用借；
+# 後台改了設定 / 船班，data_versions 版本號一變就會重查。
+@cached_query("site_settings")
+def _exchange_rate_setting():
+    with get_connection() as conn:
         df = pd.read_sql("""
             SELECT setting_value
             FROM site_settings
             WHERE setting_key = 'current_exchange_rate'
             LIMIT 1
         """, conn)
+    return None if df.empty else str(df.iloc[0]["setting_value"])
+
 
-        if df.empty:
-            return "4.78"
-        return str(df.iloc[0]["setting_value"])
+def get_current_exchange_rate():
+    try:
+        return _exchange_rate_setting() or "4.78"
     except:
         return "4.78"
-    finally:
-        conn.close()
 
 
-def get_recent_shipping_batches(delivery_method=None):
-    conn = get_connection()
-    try:
-        sql = """
-            SELECT batch_text
-            FROM shipping_batches
-            WHERE is_active = 1
-        """
-        params = []
+@cached_query("shipping_batches")
+def _shipping_batches(delivery_method):
+    sql = """
+        SELECT batch_text
+        FROM shipping_batches
+        WHERE is_active = 1
+    """
+    params = []
 
-        if delivery_method == "宅配":
-            sql += " AND delivery_type = %s"
-            params.append("home_delivery")
-        elif delivery_method == "賣貨便":
-            sql += " AND delivery_type = %s"
-            params.append("shop_delivery")
+    if delivery_method == "宅配":
+        sql += " AND delivery_type = %s"
+        params.append("home_delivery")
+    elif delivery_method == "賣貨便":
+        sql += " AND delivery_type = %s"
+        params.append("shop_delivery")
 
-        sql += " ORDER BY sort_order ASC, batch_id DESC"
+    sql += " ORDER BY sort_order ASC, batch_id DESC"
 
+    with get_connection() as conn:
         df = pd.read_sql(sql, conn, params=params)
 
-        if df.empty:
-            return []
-        return df["batch_text"].tolist()
-    except Exception:
+    if df.empty:
         return []
-    finally:
-        conn.close()
-
-def ensure_return_request_tables(conn):
-    ddl1 = """
-    CREATE TABLE IF NOT EXISTS customer_return_requests (
-      request_id INT AUTO_INCREMENT PRIMARY KEY,
-      customer_name VARCHAR(255) NOT NULL,
-      selected_shipping_batch VARCHAR(255) NOT NULL,
-      delivery_method VARCHAR(50) NOT NULL DEFAULT '面交/自取',
-      total_count INT NOT NULL DEFAULT 0,
-      total_weight DECIMAL(10,3) NOT NULL DEFAULT 0,
-      estimated_fee DECIMAL(10,2) NOT NULL DEFAULT 0,
-      status ENUM('pending','processed','cancelled') NOT NULL DEFAULT 'pending',
-      created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-      updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-    ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
-    """
-
-    ddl2 = """
-    CREATE TABLE IF NOT EXISTS customer_return_request_items (
-      id INT AUTO_INCREMENT PRIMARY KEY,
-      request_id INT NOT NULL,
-      order_id INT NOT NULL,
-      tracking_number VARCHAR(255) NULL,
-      platform VARCHAR(50) NULL,
-      weight_kg DECIMAL(10,3) NULL,
-      created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-      UNIQUE KEY uk_request_order (request_id, order_id),
-      CONSTRAINT fk_return_req_items_request
-        FOREIGN KEY (request_id) REFERENCES customer_return_requests(request_id)
-        ON DELETE CASCADE
-    ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
-    """
+    return df["batch_text"].tolist()
 
-    with conn.cursor() as cur:
-        cur.execute(ddl1)
-        cur.execute(ddl2)
-    conn.commit()
 
+def get_recent_shipping_batches(delivery_method=None):
+    try:
+        return _shipping_batches(delivery_method)
+    except Exception:
+        return []
 
 def save_return_request(
     customer_name,
@@ -127,8 +92,6 @@ def save_return_request(
 ):
     conn = get_connection()
     try:
-        ensure_return_request_tables(conn)
-
         with conn.cursor() as cur:
             cur.execute(
                 """
@@ -179,6 +142,7 @@ def save_return_request(
                     )
                 )
 
+        bump_versions(conn, "customer_return_requests")
         conn.commit()
         return True, request_id, None
 
@@ -190,44 +154,9 @@ def save_return_request(
         conn.close()
 
 
-def ensure_forwarding_register_table(conn):
-    ddl = """
-    CREATE TABLE IF NOT EXISTS customer_forwarding_registers (
-      register_id INT AUTO_INCREMENT PRIMARY KEY,
-      customer_name VARCHAR(255) NOT NULL,
-      tracking_number VARCHAR(255) NOT NULL,
-      item_name VARCHAR(255) NOT NULL,
-      quantity INT NOT NULL DEFAULT 1,
-      unit_price_rmb DECIMAL(10,2) NOT NULL DEFAULT 0,
-      remarks TEXT NULL,
-      status ENUM('pending','processed','cancelled') NOT NULL DEFAULT 'pending',
-      created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-      updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-      UNIQUE KEY uk_tracking_number (tracking_number)
-    ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
-    """
-    with conn.cursor() as cur:
-        cur.execute(ddl)
-
-        # 舊表補欄位
-        try:
-            cur.execute("ALTER TABLE customer_forwarding_registers ADD COLUMN quantity INT NOT NULL DEFAULT 1")
-        except Exception:
-            pass
-
-        try:
-            cur.execute("ALTER TABLE customer_forwarding_registers ADD COLUMN unit_price_rmb DECIMAL(10,2) NOT NULL DEFAULT 0")
-        except Exception:
-            pass
-
-    conn.commit()
-
-
 def save_forwarding_register(customer_name, tracking_number, item_name, quantity, unit_price_rmb, remarks):
     conn = get_connection()
     try:
-        ensure_forwarding_register_table(conn)
-
         check_sql = """
         SELECT register_id, status
         FROM customer_forwarding_registers
@@ -267,6 +196,7 @@ def save_forwarding_register(customer_name, tracking_number, item_name, quantity
             )
             register_id = cur.lastrowid
 
+        bump_versions(conn, "customer_forwarding_registers")
         conn.commit()
         return True, register_id, None
 
@@ -523,41 +453,13 @@ def page_order_query():
     st.title("📦 查詢訂單")
     st.caption("輸入名稱後查詢訂單，並可選取欲提前運回的訂單與船班。")
 
-    def round_up_half_kg(weight):
-        if weight <= 0:
-            return 0.0
-        return ((weight * 2 + 0.999999) // 1) / 2
+    rates = load_rates()
 
     def calc_estimated_shipping_fee(selected_df, delivery_method):
         if selected_df.empty:
             return 0, 0.0, 0.0, 0.0
-
-        df_calc = selected_df.copy()
-        df_calc["platform"] = df_calc["platform"].astype(str).str.strip()
-        df_calc["weight_kg"] = pd.to_numeric(df_calc["weight_kg"], errors="coerce").fillna(0.0)
-
-        forwarding_weight = float(df_calc[df_calc["platform"] == "集運"]["weight_kg"].sum())
-        other_weight = float(df_calc[df_calc["platform"] != "集運"]["weight_kg"].sum())
-
-        forwarding_billable = 0.0
-        other_billable = 0.0
-        shipping_fee = 0.0
-
-        if forwarding_weight > 0:
-            forwarding_billable = max(1.0, round_up_half_kg(forwarding_weight))
-            shipping_fee += forwarding_billable * 90
-
-        if other_weight > 0:
-            other_billable = round_up_half_kg(other_weight)
-            shipping_fee += other_billable * 70
-
-        if delivery_method == "宅配":
-            shipping_fee += 100
-        elif delivery_method == "賣貨便":
-            shipping_fee += 38
-
-        total_billable = forwarding_billable + other_billable
-        return round(shipping_fee), total_billable, forwarding_billable, other_billable
+        # 集運、代購各自合併計費再加台灣端運費（shipping_fees.py，費率在 shipping_rates 表）
+        return estimate_return_fee(selected_df["weight_kg"], selected_df["platform"], delivery_method, rates)
 
     st.markdown("### 🔍 查詢條件")
     with st.form("order_query_form"):
@@ -585,60 +487,7 @@ def page_order_query():
 
         try:
             conn = get_connection()
-
-            if show_all_history:
-                sql = """
-                SELECT
-                    order_id,
-                    order_time,
-                    customer_name,
-                    platform,
-                    tracking_number,
-                    amount_rmb,
-                    weight_kg,
-                    is_arrived,
-                    is_returned,
-                    remarks,
-                    service_fee,
-                    early_return,
-                    is_early_returned
-                FROM orders
-                WHERE customer_name = %s
-                ORDER BY order_time DESC, order_id DESC
-                """
-                df = pd.read_sql(sql, conn, params=[customer_name_input])
-            else:
-                sql = """
-                SELECT
-                    order_id,
-                    order_time,
-                    customer_name,
-                    platform,
-                    tracking_number,
-                    amount_rmb,
-                    weight_kg,
-                    is_arrived,
-                    is_returned,
-                    remarks,
-                    service_fee,
-                    early_return,
-                    is_early_returned
-                FROM orders
-                WHERE customer_name = %s
-                  AND is_returned = 0
-                ORDER BY order_time DESC, order_id DESC
-                """
-                df = pd.read_sql(sql, conn, params=[customer_name_input])
-
-            for col in ["is_arrived", "is_returned", "is_early_returned", "early_return"]:
-                if col in df.columns:
-                    df[col] = df[col].fillna(0).astype(int)
-
-            if "weight_kg" in df.columns:
-                df["weight_kg"] = pd.to_numeric(df["weight_kg"], errors="coerce").fillna(0.0)
-
-            if "amount_rmb" in df.columns:
-                df["amount_rmb"] = pd.to_numeric(df["amount_rmb"], errors="coerce").fillna(0.0)
+            df = customer_orders(conn, customer_name_input, show_all=show_all_history)
 
             st.session_state["client_query_df"] = df
             st.session_state["return_request_sent"] = False
@@ -665,15 +514,9 @@ def page_order_query():
         
     st.success(f"查詢成功，共找到 {len(df)} 筆訂單。")
 
-    def get_arrived_status(row):
-        tracking = "" if pd.isna(row["tracking_number"]) else str(row["tracking_number"]).strip()
-        if int(row["is_arrived"]) == 1:
-            return "已到倉"
-        return "運送中" if tracking else "賣家尚未寄出"
-
     df_display = df.copy()
-    df_display["到倉狀態"] = df_display.apply(get_arrived_status, axis=1)
-    df_display["運回狀態"] = df_display["is_returned"].apply(lambda x: "已運回" if int(x) == 1 else "未運回")
+    df_display["到倉狀態"] = arrival_status(df_display["is_arrived"], df_display["tracking_number"])
+    df_display["運回狀態"] = check_marks(df_display["is_returned"], "已運回", "未運回")
 
     if "order_time" in df_display.columns:
         df_display["order_time"] = df_display["order_time"].astype(str)
@@ -797,18 +640,17 @@ def page_order_query():
 
             detail_parts = []
             if forwarding_billable > 0:
-                detail_parts.append(f"純集運計費重量 {forwarding_billable:.2f} kg × 90")
+                detail_parts.append(f"純集運計費重量 {forwarding_billable:.2f} kg × {rates['weight'][FORWARDING]['per_kg']:g}")
             if other_billable > 0:
-                detail_parts.append(f"代購商品計費重量 {other_billable:.2f} kg × 70")
-            if delivery_method == "宅配":
-                detail_parts.append("宅配 +100")
-            elif delivery_method == "賣貨便":
-                detail_parts.append("賣貨便 +38")
+                detail_parts.append(f"代購商品計費重量 {other_billable:.2f} kg × {rates['weight'][PURCHASE]['per_kg']:g}")
+            extra_fee = rates["delivery"].get(delivery_method, 0)
+            if extra_fee:
+                detail_parts.append(f"{delivery_method} +{extra_fee:g}")
 
             if detail_parts:
                 st.caption("＋".join(detail_parts))
 
-            st.caption("純集運：每公斤 90 元，最低 1 公斤起算，並以 0.5 公斤為單位計費；代購商品：每公斤 70 元，以 0.5 公斤為單位計費；宅配加 100 元，賣貨便加 38 元。")
+            st.caption(rate_description(rates))
 
             selected_table = selected_df[["order_id", "order_time", "platform", "tracking_number", "weight_kg"]].copy()
             selected_table = selected_table.rename(columns={
@@ -1076,11 +918,6 @@ def page_quote():
     st.title("🧮 費用試算")
     st.caption("可先估算商品費用、國際運費與台灣運費，實際金額仍以橘貓最終通知為準。")
 
-    def round_up_half_kg(weight):
-        if weight <= 0:
-            return 0.0
-        return ((weight * 2 + 0.999999) // 1) / 2
-
     def calc_service_fee(rmb):
         rmb = float(rmb)
 
@@ -1130,12 +967,14 @@ def page_quote():
         service_fee = apply_vip_discount(base_service_fee, vip_level)
         product_fee = round(amount_rmb * current_rate + service_fee)
 
-        # 國際運費
-        billable_weight = round_up_half_kg(weight_kg)
-        international_fee = round(billable_weight * 70)  # 0.5kg 35元 = 1kg 70元
+        # 國際運費：試算一律用代購費率；台灣運費依寄送方式（shipping_fees.py）
+        rates = load_rates()
+        billed, fee = shipping_fees([weight_kg], [PURCHASE], rates=rates)
+        billable_weight = float(billed[0])
+        international_fee = round(float(fee[0]))
 
         # 台灣運費
-        taiwan_fee = 100 if delivery_method == "宅配" else 38
+        taiwan_fee = round(float(delivery_fee([delivery_method], rates)[0]))
 
         total_fee = product_fee + international_fee + taiwan_fee
 
@@ -1283,6 +1122,8 @@ def sidebar_navigation():
 # 主程式
 # =============================
 def main():
+    start_rerun("customer_app2", enabled=trace_enabled_by_env())  # JUMAO_TRACE=1 才記錄 SQL 耗時
+    ensure_schema()  # 每個程序只檢查一次資料表版本
     inject_custom_css()
     sidebar_navigation()
 
@@ -1311,6 +1152,8 @@ def main():
     st.markdown("---")
     st.caption("橘貓代購 © 2026｜此版本為客戶端網站功能骨架")
 
+    finish_rerun(page)
+
 
 if __name__ == "__main__":
     main()
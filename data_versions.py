@@ -0,0 +1,48 @@
+# data_versions.py —— 每張表一個遞增版本號，用來快速判斷「資料變了沒」
+#
+# 寫入的地方在 commit 前呼叫 bump_versions(conn, "orders", ...)，版本號跟著同一個交易生效；
+# 讀取端只要查一列 data_versions 就知道要不要重抓，不必掃原始資料表。
+# 版本列是熱點，請盡量在交易最後（commit 前）才 bump，縮短持有列鎖的時間。
+import time
+
+_last_local_bump = float("-inf")  # 本程序最近一次 bump 的時間（time.monotonic）
+
+
+def bump_versions(conn, *tables):
+    """在呼叫端目前的交易裡把這些表的版本 +1。"""
+    global _last_local_bump
+    tables = sorted(set(tables))  # 固定順序上鎖，避免兩個交易互相等待
+    if not tables:
+        return
+    values = ", ".join(["(%s, 1)"] * len(tables))
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            INSERT INTO data_versions (table_name, version)
+            VALUES {values}
+            ON DUPLICATE KEY UPDATE version = version + 1
+        """, tables)
+    _last_local_bump = time.monotonic()
+
+
+def get_version(conn, table):
+    """單表版本號（查一列）；還沒有人寫過就是 0。
+
+    注意 REPEATABLE READ：同一個交易裡重查會看到同一個快照，輪詢請用剛借出的連線。
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM data_versions WHERE table_name = %s", (table,))
+        row = cur.fetchone()
+    return int(row[0]) if row else 0
+
+
+def load_versions(conn):
+    """全部表的版本號 {表名: 版本}；表很小，一次讀完。"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT table_name, version FROM data_versions")
+        rows = cur.fetchall()
+    return {name: int(version) for name, version in rows}
+
+
+def last_local_bump():
+    """本程序最近一次 bump 的時間；讀取端據此提早重抓版本，不必等輪詢。"""
+    return _last_local_bump
@@ -0,0 +1,203 @@
+# db_pool.py —— 全站共用 MySQL 連線池（app / customer_app / customer_app2 / feedback_store）
+import contextvars
+import threading
+import time
+
+import mysql.connector
+import streamlit as st
+
+from sql_trace import traced
+
+SESSION_TIME_ZONE = "+08:00"
+DEFAULT_POOL_SIZE = 8        # 單一程序最多同時開幾條實體連線
+DEFAULT_BORROW_TIMEOUT = 10  # 池子滿了最多等幾秒
+IDLE_CHECK_SECONDS = 30      # 閒置超過這個秒數，借出前先 ping 一次
+
+
+class PoolExhausted(mysql.connector.Error):
+    """等太久仍借不到連線。"""
+
+
+def connect(cfg, **overrides):
+    """建立一條實體連線；時區只在建立時設定一次。"""
+    params = dict(
+        host=cfg["host"],
+        port=int(cfg.get("port", 3306)),
+        user=cfg["user"],
+        password=cfg["password"],
+        database=cfg["database"],
+        charset="utf8mb4",
+        autocommit=False,
+        connection_timeout=10,
+    )
+    if "use_pure" in cfg:
+        params["use_pure"] = bool(cfg["use_pure"])
+    params.update(overrides)
+
+    conn = mysql.connector.connect(**params)
+    cur = conn.cursor()
+    cur.execute(f"SET time_zone = '{SESSION_TIME_ZONE}'")
+    cur.close()
+    return conn
+
+
+class PooledConnection:
+    """從池子借出的連線；close() 是歸還，不是斷線。其餘屬性直接轉給原連線。"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise mysql.connector.errors.OperationalError("連線已歸還到連線池")
+        return getattr(conn, name)
+
+    def close(self, broken=False):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._release(conn, broken)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 連線層的錯誤（被 KILL、斷線）代表這條連線壞了：不放回池子，直接丟掉並計入 broken
+        broken = exc_type is not None and issubclass(
+            exc_type, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+        )
+        if exc_type is not None and not broken and self._conn is not None:
+            try:
+                self._conn.rollback()
+            except Exception:
+                broken = True
+        self.close(broken)
+
+
+class ConnectionPool:
+    """有上限的連線池：借出時檢查連線、歸還時收掉未提交的交易，並記錄使用次數。"""
+
+    def __init__(self, cfg, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_BORROW_TIMEOUT,
+                 idle_check=IDLE_CHECK_SECONDS):
+        self._cfg = dict(cfg)
+        self.size = int(size)
+        self.timeout = float(timeout)
+        self.idle_check = float(idle_check)
+
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._idle = []  # [(conn, 上次歸還時間)]，後進先出，讓熱連線優先被重用
+        self._in_use = 0
+        self._counters = {"borrowed": 0, "waited": 0, "created": 0, "broken": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._counters[key] += n
+
+    def get_connection(self):
+        if not self._slots.acquire(blocking=False):
+            self._count("waited")
+            if not self._slots.acquire(timeout=self.timeout):
+                raise PoolExhausted(f"連線池已滿（{self.size} 條），等待 {self.timeout:.0f} 秒仍無空閒連線")
+
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._counters["borrowed"] += 1
+            self._in_use += 1
+        return PooledConnection(self, conn)
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                item = self._idle.pop() if self._idle else None
+
+            if item is None:
+                conn = connect(self._cfg)
+                self._count("created")
+                return conn
+
+            conn, released_at = item
+            # 剛用過的連線直接借出，不多一趟來回；閒置夠久才 ping（伺服器 wait_timeout、主從切換）。
+            # 閒置期間被砍掉的連線，借用者用到時出錯，歸還時（with 區塊）會被丟掉並計入 broken
+            if time.monotonic() - released_at < self.idle_check:
+                return conn
+            try:
+                conn.ping(reconnect=False)
+                return conn
+            except Exception:
+                self._count("broken")
+                self._discard(conn)
+
+    def _release(self, conn, broken=False):
+        try:
+            if broken:
+                raise mysql.connector.errors.OperationalError("借用期間連線中斷")
+            # 沒有 commit 的交易不帶回池子，也避免下一位借用者看到舊的快照
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            self._count("broken")
+            self._discard(conn)
+        else:
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, size=self.size, in_use=self._in_use, idle=len(self._idle))
+
+
+@st.cache_resource
+def get_pool():
+    """每個 Streamlit 程序共用一個連線池。"""
+    cfg = st.secrets["mysql"]
+    return ConnectionPool(cfg, size=int(cfg.get("pool_size", DEFAULT_POOL_SIZE)))
+
+
+def get_connection():
+    """借一條連線；用完呼叫 close()（或用 with）歸還。開啟 SQL 追蹤時會包一層記錄用的代理。"""
+    return traced(get_pool().get_connection())
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+_rerun_conn = contextvars.ContextVar("db_rerun_conn", default=None)
+
+
+def rerun_connection():
+    """後台用：每次 rerun 從連線池借一條連線；腳本本體包在 try/finally，finally 呼叫 release_rerun_connection()。
+
+    連線數因此受 pool_size 限制，不會隨 session 數增加。
+    借出的連線記在 contextvar 而不是 st.session_state：st.stop() 之後再碰 session_state 會再丟一次 StopException。
+    """
+    release_rerun_connection()
+    conn = get_pool().get_connection()
+    _rerun_conn.set(conn)
+    return traced(conn)
+
+
+def release_rerun_connection():
+    """歸還這一輪借的連線（沒借過就什麼都不做）。"""
+    conn = _rerun_conn.get()
+    if conn is not None:
+        _rerun_conn.set(None)
+        conn.close()
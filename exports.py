@@ -0,0 +1,158 @@
+# exports.py —— 按下才產生的匯出檔（Excel / CSV / Parquet）
+#
+# 以前每次 rerun 都先把整份表 to_excel 進 BytesIO，就算沒人按下載；勾一個勾也要重做好幾份。
+# 現在頁面上先放「產生」按鈕，按下才組檔；檔案依（匯出名稱、格式、查詢參數、資料表版本）快取，
+# 同樣的條件、資料沒變時直接回傳上次的內容。Excel 用 openpyxl write-only 逐列寫出，記憶體不隨列數放大。
+import io
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from openpyxl import Workbook
+
+from query_cache import snapshot_versions, table_versions
+from sql_trace import trace_span
+
+FORMATS = {
+    "xlsx": ("Excel", ".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("CSV", ".csv", "text/csv"),
+    "parquet": ("Parquet", ".parquet", "application/vnd.apache.parquet"),
+}
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+XLSX_CHUNK = 5000
+
+_lock = threading.Lock()
+_files = OrderedDict()  # 快取鍵 → bytes（最近用到的放最後）
+_cached_bytes = 0
+
+
+# ===== 寫檔 =====
+
+def _cell(v):
+    # write-only 模式只收 Python 原生型別；NaN / NaT 寫成空白
+    if v is None or v is pd.NaT:
+        return None
+    if isinstance(v, float) and v != v:
+        return None
+    if isinstance(v, np.generic):
+        v = v.item()
+        if isinstance(v, float) and v != v:
+            return None
+    if isinstance(v, pd.Timestamp):
+        return v.to_pydatetime()
+    if isinstance(v, (str, int, float, bool, date, datetime)):
+        return v
+    return str(v)
+
+
+def write_xlsx(df):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append([str(c) for c in df.columns])
+    for start in range(0, len(df), XLSX_CHUNK):
+        chunk = df.iloc[start:start + XLSX_CHUNK]
+        for row in chunk.itertuples(index=False, name=None):
+            ws.append([_cell(v) for v in row])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def write_csv(df):
+    return df.to_csv(index=False).encode("utf-8-sig")  # 帶 BOM，Excel 直接開不會亂碼
+
+
+def write_parquet(df):
+    out = df.copy()
+    for col in out.columns:
+        if out[col].dtype == object:
+            out[col] = out[col].map(lambda v: None if v is None or v is pd.NaT or (isinstance(v, float) and v != v) else str(v))
+    buf = io.BytesIO()
+    out.to_parquet(buf, index=False)
+    return buf.getvalue()
+
+
+WRITERS = {"xlsx": write_xlsx, "csv": write_csv, "parquet": write_parquet}
+
+
+# ===== 快取 =====
+
+def _remember(key, data):
+    global _cached_bytes
+    with _lock:
+        if key in _files:
+            _cached_bytes -= len(_files.pop(key))
+        _files[key] = data
+        _cached_bytes += len(data)
+        while _cached_bytes > MAX_CACHE_BYTES and len(_files) > 1:
+            _, old = _files.popitem(last=False)
+            _cached_bytes -= len(old)
+
+
+def _lookup(key):
+    with _lock:
+        data = _files.get(key)
+        if data is not None:
+            _files.move_to_end(key)
+        return data
+
+
+def build_file(name, fmt, build_df, params=(), tables=("orders",), conn=None):
+    """取得匯出檔 bytes：快取有就直接回傳，沒有才呼叫 build_df() 組表並寫檔。
+
+    conn：build_df 讀資料用的連線。給了就在這條連線上重讀版本號當快取鍵（跟資料同一個快照），
+    連線停在舊快照時，組出的舊檔不會記在新版本底下。
+    """
+    key = (name, fmt, params, tables, table_versions(tables))
+    data = _lookup(key)
+    if data is None:
+        if conn is not None:
+            key = key[:-1] + (snapshot_versions(conn, tables),)
+        with trace_span(f"export {name}.{fmt}"):
+            data = WRITERS[fmt](build_df())
+        _remember(key, data)
+    return key, data
+
+
+def clear():
+    global _cached_bytes
+    with _lock:
+        _files.clear()
+        _cached_bytes = 0
+
+
+# ===== 頁面元件 =====
+
+def format_picker(key="export_format", label="匯出格式"):
+    """頁面上選一次匯出格式，給同頁的 export_button 共用。"""
+    return st.radio(
+        label, list(FORMATS), key=key, horizontal=True,
+        format_func=lambda f: FORMATS[f][0],
+    )
+
+
+def export_button(label, name, build_df, file_stem, fmt="xlsx", params=(), tables=("orders",),
+                  disabled=False, use_container_width=False, conn=None):
+    """先顯示「產生」按鈕，按下才組檔；同條件、資料沒變時直接顯示下載按鈕。
+
+    params 要能 hash（例如勾選的訂單編號 tuple）；條件一變就要重新產生。
+    conn 是 build_df 讀資料用的連線（見 build_file）。
+    """
+    _, ext, mime = FORMATS[fmt]
+    state_key = f"_export_{name}"
+    wanted = (name, fmt, params, tables, table_versions(tables))
+
+    ready = st.session_state.get(state_key)
+    if ready is None or ready[0] != wanted:
+        if not st.button(f"⚙️ 產生{label}", key=f"build_{name}", disabled=disabled,
+                         use_container_width=use_container_width):
+            return
+        st.session_state[state_key] = ready = build_file(name, fmt, build_df, params, tables, conn)
+
+    st.download_button(
+        label, data=ready[1], file_name=f"{file_stem}{ext}", mime=mime,
+        key=f"download_{name}", disabled=disabled, use_container_width=use_container_width,
+    )
@@ -1,51 +1,27 @@
 # feedback_store.py —— 簡化版（只存 content）
-import mysql.connector
-from mysql.connector import Error
 from contextlib import contextmanager
-import streamlit as st
 
-# 共用 MySQL 連線設定（沿用你現有的 st.secrets["mysql"]）
-db_cfg = st.secrets["mysql"]
+from db_pool import get_connection
+from data_versions import bump_versions
+from bulk_ops import bulk_update, bulk_transaction
 
 @contextmanager
 def _conn():
-    conn = mysql.connector.connect(
-        host=db_cfg["host"],
-        port=int(db_cfg.get("port", 3306)),
-        user=db_cfg["user"],
-        password=db_cfg["password"],
-        database=db_cfg["database"],
-        autocommit=False,
-        charset="utf8mb4",
-        connection_timeout=10,
-    )
+    conn = get_connection()
     try:
         yield conn
         conn.commit()
     finally:
         conn.close()
 
-def init_db():
-    """建立 feedbacks 表（若不存在）"""
-    sql = """
-    CREATE TABLE IF NOT EXISTS feedbacks (
-      id INT AUTO_INCREMENT PRIMARY KEY,
-      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-      content TEXT NOT NULL,
-      status ENUM('未處理','已讀','已回覆','忽略') DEFAULT '未處理',
-      staff_note VARCHAR(255)
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-    """
-    with _conn() as con:
-        with con.cursor() as cur:
-            cur.execute(sql)
-
 def insert_feedback(content: str, contact: str | None = None, user_agent: str | None = None, session_hash: str | None = None):
     """為了相容舊呼叫簽名，保留多餘參數，但實際只存 content。回傳 row id。"""
     with _conn() as con:
         with con.cursor() as cur:
             cur.execute("INSERT INTO feedbacks (content) VALUES (%s)", (content,))
-            return cur.lastrowid
+            row_id = cur.lastrowid
+        bump_versions(con, "feedbacks")  # 和 INSERT 同一個交易（_conn 離開時 commit）
+    return row_id
 
 def read_feedbacks(keyword: str = "", status: str = "全部"):
     """讀取回饋清單，回傳 list[dict]"""
@@ -68,17 +44,13 @@ def read_feedbacks(keyword: str = "", status: str = "全部"):
             return [dict(zip(cols, row)) for row in cur.fetchall()]
 
 def update_status(ids: list[int], status: str, note: str | None = None):
-    """更新狀態／備註"""
+    """更新狀態／備註；依 bulk_ops 分段、同一個交易，回傳異動筆數"""
     if not ids:
-        return
-    ph = ",".join(["%s"] * len(ids))
-    params = [status]
-    set_note = ""
+        return 0
+    set_sql, params = "status = %s", [status]
     if note is not None:
-        set_note = ", staff_note = %s"
+        set_sql += ", staff_note = %s"
         params.append(note)
-    sql = f"UPDATE feedbacks SET status = %s{set_note} WHERE id IN ({ph})"
-    params += ids
     with _conn() as con:
-        with con.cursor() as cur:
-            cur.execute(sql, params)
+        with bulk_transaction(con, "feedbacks"):
+            return bulk_update(con, "feedbacks", "id", [int(i) for i in ids], set_sql, params)
@@ -0,0 +1,315 @@
+# inbound_files.py —— 倉庫匯出檔入庫（📥 貼上入庫訊息 → 上傳檔案 / 監看資料夾）
+#
+# 以前只能把訊息貼進文字框，倉庫一次匯出幾千行就得整段複製貼上。
+# 現在可以上傳 CSV / XLSX / TXT，或把檔案丟進監看資料夾（INBOUND_WATCH_DIR）由 retry_worker 撿走。
+# 檔案一律串流讀取（TXT / CSV 逐行、XLSX 用 openpyxl read_only 逐列），每 INGEST_CHUNK_LINES 行
+# 交給同一套 parse_inbound + apply_inbound，一段一個交易；記憶體只跟一段的大小有關，跟檔案多大無關。
+import csv
+import io
+import os
+import shutil
+import time
+from datetime import datetime
+from itertools import islice
+
+import streamlit as st
+from openpyxl import load_workbook
+
+from inbound_parser import parse_inbound
+from inbound_store import apply_inbound
+
+INGEST_CHUNK_LINES = 5000
+MISSING_SAMPLES = 200     # 每個檔案最多留幾筆對不到訂單的單號給畫面看（全部都已進失敗佇列）
+FILE_TYPES = ("csv", "xlsx", "txt")
+SETTLE_SECONDS = 10       # 監看資料夾：修改時間在這之內的檔案可能還在寫，下一輪再處理
+WATCH_DIR_ENV = "INBOUND_WATCH_DIR"
+PROCESSED_FILE = ".processed"  # 監看資料夾裡：已匯入但搬不走的檔案（檔名、大小、修改時間、要搬去哪）
+
+# 表格檔的表頭：認得出單號欄和重量欄，就把每列組成「單號：xxx 重量：y」交給 parser
+TRACKING_HEADERS = ("單號", "单号", "tracking")
+WEIGHT_HEADERS = ("重量", "weight")
+
+
+def configured_watch_dir():
+    """監看資料夾：環境變數 INBOUND_WATCH_DIR，或 secrets 的 [inbound] watch_dir；都沒設回傳 None。"""
+    path = os.environ.get(WATCH_DIR_ENV)
+    if not path:
+        try:
+            path = st.secrets.get("inbound", {}).get("watch_dir")
+        except Exception:
+            path = None
+    return path or None
+
+
+# ===== 串流讀檔 =====
+
+def _size(binary):
+    pos = binary.tell()
+    end = binary.seek(0, io.SEEK_END)
+    binary.seek(pos)
+    return end
+
+
+def _text_stream(binary):
+    """二進位檔 → 文字串流；開頭 64 KB 不是 UTF-8 就當成 GB18030（簡體倉庫的 Excel 匯出常見）。"""
+    sample = binary.read(65536)
+    binary.seek(0)
+    encoding = "utf-8-sig"
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start < len(sample) - 3:  # 只是切在多位元組字元中間不算
+            encoding = "gb18030"
+    return io.TextIOWrapper(binary, encoding=encoding, errors="replace", newline="")
+
+
+def _header_columns(cells):
+    """表頭 → (單號欄, 重量欄)；認不出來回傳 None。"""
+    lowered = [c.lower() for c in cells]
+    tn = next((i for i, c in enumerate(lowered) if any(h in c for h in TRACKING_HEADERS)), None)
+    w = next((i for i, c in enumerate(lowered) if any(h in c for h in WEIGHT_HEADERS)), None)
+    return None if tn is None or w is None or tn == w else (tn, w)
+
+
+def _row_lines(rows):
+    """表格列 → 文字行。第一列是認得的表頭就只取單號、重量兩欄；否則整列用空白接起來。"""
+    columns = None
+    first = True
+    for row in rows:
+        cells = ["" if c is None else str(c).replace("\n", " ").strip() for c in row]
+        if not any(cells):
+            continue
+        if first:
+            first = False
+            columns = _header_columns(cells)
+            if columns:
+                continue
+        if columns:
+            tn_col, w_col = columns
+            tn = cells[tn_col] if tn_col < len(cells) else ""
+            w = cells[w_col] if w_col < len(cells) else ""
+            yield f"單號：{tn} 重量：{w}"
+        else:
+            yield " ".join(c for c in cells if c)
+
+
+def open_lines(binary, name):
+    """依副檔名串流讀檔；回傳 (文字行 iterator, 進度函式)。進度函式回傳 0～1，算不出來時回傳 None。"""
+    ext = os.path.splitext(name)[1].lower().lstrip(".")
+    if ext == "xlsx":
+        wb = load_workbook(binary, read_only=True, data_only=True)
+        ws = wb.active
+        total = ws.max_row
+        read = [0]
+
+        def rows():
+            try:
+                for row in ws.iter_rows(values_only=True):
+                    read[0] += 1
+                    yield row
+            finally:
+                wb.close()
+
+        return _row_lines(rows()), lambda: read[0] / total if total else None
+
+    if ext not in ("csv", "txt"):
+        raise ValueError(f"不支援的檔案類型：{name}（只收 {' / '.join(FILE_TYPES)}）")
+    size = _size(binary)
+
+    def text_lines():
+        text = _text_stream(binary)
+        try:
+            if ext == "csv":
+                yield from _row_lines(csv.reader(text))
+            else:
+                for line in text:
+                    yield line.rstrip("\r\n")
+        finally:
+            text.detach()  # 不要連呼叫端的檔案一起關掉
+
+    def progress():
+        return binary.tell() / size if size else None
+
+    return text_lines(), progress
+
+
+def iter_parsed_chunks(binary, name, chunk_lines=INGEST_CHUNK_LINES):
+    """每 chunk_lines 行解析一次：產生 (這段的行數, 這段的 InboundLine 清單, 進度)。"""
+    lines, progress = open_lines(binary, name)
+    while True:
+        chunk = list(islice(lines, chunk_lines))
+        if not chunk:
+            break
+        yield len(chunk), parse_inbound("\n".join(chunk)), progress()
+
+
+# ===== 入庫 =====
+
+def ingest(conn, binary, name, progress=None, chunk_lines=INGEST_CHUNK_LINES):
+    """一個檔案 → 解析並寫回訂單（每段一個交易）；回傳摘要 dict。
+
+    progress(比例或 None, 摘要)：每段處理完呼叫一次（畫面更新進度條用）。
+    中途失敗時，已處理的段落已經提交；同一個檔案再匯入一次，那些單號會再登記一次（重量、到貨狀態不變，備註多一筆）。
+    """
+    summary = {"file": name, "lines": 0, "parsed": 0, "updated": 0, "missing": 0, "rejected": 0,
+               "missing_samples": []}
+    for n_lines, parsed, fraction in iter_parsed_chunks(binary, name, chunk_lines):
+        summary["lines"] += n_lines
+        summary["parsed"] += len(parsed)
+        if parsed:
+            updated, missing, _, fail_rows = apply_inbound(
+                conn, [(r.tracking_number, r.weight_kg, r.source_line) for r in parsed]
+            )
+            summary["updated"] += updated
+            summary["missing"] += len(missing)
+            summary["rejected"] += len(fail_rows) - len(missing)  # 單號過長：沒登記也沒進佇列
+            room = MISSING_SAMPLES - len(summary["missing_samples"])
+            summary["missing_samples"] += missing[:max(room, 0)]
+        if progress:
+            progress(fraction, summary)
+    return summary
+
+
+# ===== 監看資料夾 =====
+
+def _file_key(path):
+    """同一個檔案的判斷：檔名、大小、修改時間都沒變。"""
+    stat = os.stat(path)
+    return os.path.basename(path), stat.st_size, stat.st_mtime_ns
+
+
+def load_processed(folder):
+    """已匯入但還沒搬走的檔案：{(檔名, 大小, 修改時間 ns): 要搬去的子資料夾}。"""
+    records = {}
+    try:
+        with open(os.path.join(folder, PROCESSED_FILE), encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) == 4:
+                    name, size, mtime_ns, sub = parts
+                    records[(name, int(size), int(mtime_ns))] = sub
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def _save_processed(folder, records):
+    """整份重寫（先寫暫存檔再換名，寫到一半當掉也不會留下殘缺的紀錄）；沒有紀錄就刪掉檔案。"""
+    path = os.path.join(folder, PROCESSED_FILE)
+    if not records:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for (name, size, mtime_ns), sub in sorted(records.items()):
+            f.write(f"{name}\t{size}\t{mtime_ns}\t{sub}\n")
+    os.replace(tmp, path)
+
+
+def pending_files(folder, processed=None):
+    """資料夾裡待處理的檔案（舊到新）；剛寫入、可能還沒寫完的先跳過，已匯入只是搬不走的也跳過。"""
+    if processed is None:
+        processed = load_processed(folder)
+    now = time.time()
+    found = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            if os.path.splitext(entry.name)[1].lower().lstrip(".") not in FILE_TYPES:
+                continue
+            if _file_key(entry.path) in processed:
+                continue
+            mtime = entry.stat().st_mtime
+            if now - mtime >= SETTLE_SECONDS:
+                found.append((mtime, entry.path))
+    return [path for _, path in sorted(found)]
+
+
+def _move(path, folder, sub):
+    """處理完的檔案搬到 done/ 或 error/，檔名前面加時間；同一秒同名時再加序號，不覆蓋舊檔。"""
+    dest = os.path.join(folder, sub)
+    os.makedirs(dest, exist_ok=True)
+    stem = f"{datetime.now():%Y%m%d-%H%M%S}_{os.path.basename(path)}"
+    target = os.path.join(dest, stem)
+    n = 1
+    while os.path.exists(target):
+        target = os.path.join(dest, f"{n}_{stem}")
+        n += 1
+    shutil.move(path, target)
+    return target
+
+
+def _retry_moves(folder, processed):
+    """先前已匯入、搬檔失敗的檔案：這輪只再搬一次，不重新匯入。回傳搬成功的摘要。"""
+    results = []
+    for key, sub in list(processed.items()):
+        path = os.path.join(folder, key[0])
+        try:
+            if _file_key(path) != key:
+                del processed[key]  # 檔案被換掉或拿走了：內容不同，當成新檔案處理
+                continue
+            moved_to = _move(path, folder, sub)
+        except FileNotFoundError:
+            del processed[key]
+            continue
+        except OSError:
+            continue  # 還是搬不走，留著紀錄下一輪再試
+        del processed[key]
+        results.append({"file": key[0], "moved_to": moved_to, "move_only": True})
+    return results
+
+
+def ingest_folder(conn, folder, progress=None):
+    """處理監看資料夾裡的新檔案；成功搬到 done/、失敗搬到 error/。回傳每個檔案的摘要。
+
+    搬檔失敗（檔案被鎖住、沒有權限…）記在摘要的 move_error，不中斷其他檔案；
+    檔案留在原地，但記進 PROCESSED_FILE，之後每輪只重試搬檔、不再匯入（避免同一批單號一直多一筆備註）。
+    連紀錄都寫不進去時，摘要帶 record_error，呼叫端應停止監看這個資料夾。
+    """
+    processed = load_processed(folder)
+    before = dict(processed)
+    results = _retry_moves(folder, processed)
+    for path in pending_files(folder, processed):
+        name = os.path.basename(path)
+        key = _file_key(path)
+        try:
+            with open(path, "rb") as f:
+                summary = ingest(conn, f, name, progress)
+            sub = "done"
+        except Exception as e:
+            summary = {"file": name, "error": str(e)}
+            sub = "error"
+        try:
+            summary["moved_to"] = _move(path, folder, sub)
+        except OSError as e:
+            summary["move_error"] = f"搬到 {sub}/ 失敗：{e}"
+            processed[key] = sub
+        results.append(summary)
+    if processed != before:
+        try:
+            _save_processed(folder, processed)
+        except OSError as e:
+            for r in results:
+                if "move_error" in r:
+                    r["record_error"] = f"無法寫入 {PROCESSED_FILE}：{e}"
+    return results
+
+
+def folder_status(folder, recent=5):
+    """頁面用：待處理檔案數、已匯入但搬不走的檔案數，以及 error/ 裡最近的幾個檔名（新到舊）。"""
+    processed = load_processed(folder)
+    errors = []
+    error_dir = os.path.join(folder, "error")
+    if os.path.isdir(error_dir):
+        with os.scandir(error_dir) as entries:
+            errors = sorted(
+                ((e.stat().st_mtime, e.name) for e in entries if e.is_file()), reverse=True
+            )
+    return {
+        "pending": len(pending_files(folder, processed)),
+        "unmoved": len(processed),
+        "errors": len(errors),
+        "recent_errors": [name for _, name in errors[:recent]],
+    }
@@ -0,0 +1,100 @@
+# inbound_parser.py —— 入庫訊息解析（📥 貼上入庫訊息）
+#
+# 以前逐行 strip，再對每行輪流 re.search 三個沒編譯的樣式，5 萬行就是十幾萬次 Python 呼叫。
+# 現在所有倉庫格式合成一個多行 regex，只編譯一次，整段貼上的文字用 finditer 掃一遍：
+# 每行從行首開始，依註冊順序試各格式，第一個對上的格式勝出（跟舊的逐行迴圈同樣結果）。
+# 新倉庫的訊息格式用 register_format 註冊一個具名樣式即可，不用改解析迴圈。
+import math
+import re
+from collections import namedtuple
+
+# 一筆解析結果；前三欄的順序對應 apply_inbound 的 (單號, 重量, 原始訊息)
+InboundLine = namedtuple(
+    "InboundLine", ["tracking_number", "weight_kg", "source_line", "raw_weight", "format"]
+)
+
+# 格式名稱 → 樣式；依註冊順序比對
+FORMATS = {}
+
+_compiled = None  # (合併後的 regex, {外層群組編號: (格式名稱, 單號群組, 重量群組)})
+
+
+def round_weight(w):
+    if w < 0.1:
+        return 0.1
+    # math.ceil(x) * 0.05 會往上進位到最近的 0.05
+    return round(math.ceil(w / 0.05) * 0.05, 2)
+
+
+# ===== 格式註冊 =====
+
+def register_format(name, pattern):
+    """註冊（或取代）一種入庫訊息格式。
+
+    pattern 的第 1 組是單號、第 2 組是重量（公斤），不可用具名群組；
+    整段文字一起掃，樣式不能跨行：「任意字元」請寫成 [^0-9\\n]*、空白寫成 [^\\S\\n]*。
+    同名格式會換掉原本的樣式，比對順序不變。
+    """
+    compiled = re.compile(pattern, re.IGNORECASE)
+    if compiled.groups < 2:
+        raise ValueError(f"格式 {name} 至少要有兩個群組（單號、重量）")
+    if compiled.groupindex:
+        raise ValueError(f"格式 {name} 不可使用具名群組")
+    global _compiled
+    FORMATS[name] = pattern
+    _compiled = None
+
+
+def _combined():
+    """把 FORMATS 合成一個 regex（只在格式有變時重編）。"""
+    global _compiled
+    if _compiled is None:
+        parts, groups, index = [], {}, 1
+        for name, pattern in FORMATS.items():
+            # 每個格式外面包一層群組，記下它自己的第 1、2 組在合併後的編號
+            parts.append(f"[^\\n]*?({pattern})")
+            groups[index] = (name, index + 1, index + 2)
+            index += 1 + re.compile(pattern).groups
+        # 結尾的 [^\n]* 吃到行尾，group(0) 就是整行（外層群組仍是最後關閉的群組）
+        regex = re.compile("^(?:" + "|".join(parts) + ")[^\n]*", re.IGNORECASE | re.MULTILINE)
+        _compiled = (regex, groups)
+    return _compiled
+
+
+# 內建格式（沿用原本的三種）
+register_format("letter_prefix", r"([A-Z]{1,3}\d{8,})[^0-9\n]*入庫重量[^\S\n]*([0-9.]+)[^\S\n]*KG")      # SF3280813696247 入庫重量 0.14 KG
+register_format("digits", r"(\d{9,})[^0-9\n]*入庫重量[^\S\n]*([0-9.]+)[^\S\n]*KG")                        # 78935908059095 入庫重量 0.27 KG
+register_format("labelled", r"單號[:：]?[^\S\n]*([A-Z0-9]{8,})[^0-9\n]*重量[:：]?[^\S\n]*([0-9.]+)")       # 備用：單號xxx 重量x.xx
+
+
+# ===== 解析 =====
+
+def parse_inbound(text):
+    """整段入庫訊息 → [InboundLine, ...]（依出現順序；同一行只取第一個對上的格式）。
+
+    重量不是合法數字（例如 0.1.2）的行略過。
+    """
+    if not text:
+        return []
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    regex, groups = _combined()
+    found = []
+    weights = {}  # 重量字串 → (原始重量, 進位後重量)；貼上的重量重複很多，每種只換算一次
+    for m in regex.finditer(text):
+        # 外層群組最後關閉，lastindex 就是對上的那個格式
+        name, tn_group, w_group = groups[m.lastindex]
+        tracking_number, w_text = m.group(tn_group, w_group)
+        w = weights.get(w_text)
+        if w is None:
+            try:
+                raw_w = float(w_text)
+            except ValueError:
+                w = weights[w_text] = False
+            else:
+                w = weights[w_text] = (raw_w, round_weight(raw_w))
+        if not w:
+            continue
+        found.append(InboundLine(tracking_number, w[1], m.group(0).strip(), w[0], name))
+    return found
+
@@ -0,0 +1,334 @@
+# inbound_store.py —— 入庫：把解析出的「單號＋重量」寫回訂單，失敗的進重試佇列
+from datetime import datetime
+
+from bulk_ops import BULK_CHUNK, bulk_delete, bulk_transaction, chunked
+from data_versions import bump_versions
+from shipping_state import refresh_customers
+from sql_frames import read_sql_df
+
+
+# ===== 入庫失敗佇列（failed_orders） =====
+#
+# 對不到訂單的單號進佇列，由背景的 retry_worker 分批重試（不再是進頁時同步重試整個佇列）。
+# 每失敗一次，下次重試時間往後延：RETRY_BASE_MINUTES × 2^(失敗次數-1)，最長 RETRY_MAX_MINUTES。
+
+RETRY_BASE_MINUTES = 5
+RETRY_MAX_MINUTES = 12 * 60
+
+
+def next_retry_sql(retry_count):
+    """下次重試時間的 SQL 運算式；retry_count 是「已失敗次數」的欄位或運算式。"""
+    return (
+        f"NOW() + INTERVAL LEAST({RETRY_BASE_MINUTES} << LEAST(GREATEST({retry_count} - 1, 0), 10), "
+        f"{RETRY_MAX_MINUTES}) MINUTE"
+    )
+
+
+# 📨 未成功單號佇列：篩選、排序都在 SQL 做，每頁只讀 page_size 筆
+FAILED_COLUMNS = "id, tracking_number, weight_kg, raw_message, retry_count, last_error, created_at, next_retry_at"
+
+# 錯誤類型：last_error 冒號前的部分（例如「查詢失敗: ...」→「查詢失敗」）
+ERROR_TYPE_SQL = "SUBSTRING_INDEX(COALESCE(last_error, ''), ':', 1)"
+
+# 等待時間篩選：進佇列超過幾小時
+FAILED_AGES = {"全部": None, "超過 1 小時": 1, "超過 1 天": 24, "超過 3 天": 72, "超過 7 天": 168}
+
+FAILED_SORTS = {
+    "最近更新": "updated_at DESC, id DESC",
+    "等最久": "created_at ASC, id ASC",
+    "重試次數多": "retry_count DESC, id ASC",
+    "下次重試時間": "next_retry_at ASC, id ASC",
+    "單號": "tracking_number ASC, id ASC",
+}
+
+
+def failed_filter(min_age_hours=None, min_retries=0, error_type=None):
+    """篩選條件 → (WHERE 子句, 參數)。min_age_hours：進佇列超過幾小時；error_type：ERROR_TYPE_SQL 的值。"""
+    cond, params = ["1 = 1"], []
+    if min_age_hours:
+        cond.append("created_at <= NOW() - INTERVAL %s HOUR")
+        params.append(int(min_age_hours))
+    if min_retries:
+        cond.append("retry_count >= %s")
+        params.append(int(min_retries))
+    if error_type is not None:
+        cond.append(f"{ERROR_TYPE_SQL} = %s")
+        params.append(error_type)
+    return " AND ".join(cond), params
+
+
+def failed_page(conn, where, params, sort, offset, limit):
+    """一頁佇列資料（依 FAILED_SORTS[sort] 排序，OFFSET 分頁）。"""
+    return read_sql_df(
+        f"SELECT {FAILED_COLUMNS} FROM failed_orders WHERE {where} "
+        f"ORDER BY {FAILED_SORTS[sort]} LIMIT %s OFFSET %s",
+        conn, params=[*params, int(limit), int(offset)],
+    )
+
+
+def failed_totals(conn, where, params):
+    """符合條件的筆數。"""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM failed_orders WHERE {where}", params)
+        return int(cur.fetchone()[0])
+
+
+def failed_error_types(conn):
+    """[(錯誤類型, 筆數), ...]，筆數多的在前（篩選選單用）。"""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT {ERROR_TYPE_SQL} AS error_type, COUNT(*) AS n
+            FROM failed_orders
+            GROUP BY error_type
+            ORDER BY n DESC, error_type
+        """)
+        return [(r[0], int(r[1])) for r in cur.fetchall()]
+
+
+def clear_failed(conn):
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE TABLE failed_orders")
+    bump_versions(conn, "failed_orders")
+    conn.commit()
+
+
+def delete_failed(conn, ids):
+    """刪除勾選的佇列資料；回傳刪除筆數。"""
+    with bulk_transaction(conn, "failed_orders"):
+        return bulk_delete(conn, "failed_orders", "id", [int(i) for i in ids])
+
+
+# ===== 入庫：暫存表 + 整批 JOIN 更新 =====
+#
+# 以前每個單號查一次客戶、全部歸 0 一次、再 LIMIT 1 設主筆一次，2,000 件包裹就是 6,000 句。
+# 現在整批先寫進連線自己的暫存表（TEMPORARY TABLE，別的連線看不到），
+# 用幾句 JOIN 一次更新：同單號最小 order_id 的那筆當主筆記重量，其餘歸 0；
+# 對得到 / 對不到訂單的清單也直接從暫存表查。全部在同一個交易裡。
+
+# failed_orders.tracking_number 是 VARCHAR(64)：更長的單號進不了佇列，暫存前就擋下來回報
+TRACKING_MAX_LEN = 64
+TOO_LONG_NOTE = f"單號超過 {TRACKING_MAX_LEN} 字元，未登記"
+
+# tracking_number 欄直接從 orders 複製（SELECT ... WHERE 1 = 0）：型別、定序都跟 orders 一樣，
+# JOIN 時不會因為伺服器預設定序不同而出現 Illegal mix of collations
+STAGING_DDL = """
+    CREATE TEMPORARY TABLE IF NOT EXISTS inbound_staging (
+      seq INT NOT NULL PRIMARY KEY,
+      weight_kg DECIMAL(10,3) NULL,
+      weight_text VARCHAR(32) NOT NULL,
+      raw_message TEXT NULL,
+      main_order_id INT NULL,
+      KEY idx_staging_tracking (tracking_number)
+    ) CHARACTER SET utf8mb4
+    SELECT tracking_number FROM orders WHERE 1 = 0
+"""
+
+_STAGE_INSERT_SQL = """
+    INSERT INTO inbound_staging (seq, tracking_number, weight_kg, weight_text, raw_message)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+# 每個單號的主筆：同單號最小的 order_id（走 idx_orders_tracking；對不到訂單就是 NULL）
+STAGING_MAIN_ORDER_SQL = """
+    UPDATE inbound_staging s
+    SET s.main_order_id = (
+        SELECT MIN(orders.order_id) FROM orders WHERE orders.tracking_number = s.tracking_number
+    )
+"""
+
+# 同單號全部已到貨；主筆記這次的重量，其餘歸 0（備註和以前逐筆更新時一樣）
+STAGING_APPLY_SQL = """
+    UPDATE orders
+    JOIN inbound_staging s ON s.tracking_number = orders.tracking_number
+    SET orders.is_arrived = 1,
+        orders.weight_kg = IF(orders.order_id = s.main_order_id, s.weight_kg, 0),
+        orders.remarks = CONCAT(
+            COALESCE(orders.remarks, ''), '｜自動入庫(', NOW(), ') 同單號=0kg',
+            IF(orders.order_id = s.main_order_id,
+               CONCAT('｜自動入庫(', NOW(), ') 主筆=', s.weight_text, 'kg'), '')
+        )
+"""
+
+_STAGING_MATCHED_SQL = """
+    SELECT s.tracking_number,
+           COALESCE(NULLIF(TRIM(orders.customer_name), ''), '（未填姓名）') AS customer_name
+    FROM inbound_staging s
+    JOIN orders ON orders.order_id = s.main_order_id
+    ORDER BY s.seq
+"""
+
+_STAGING_MISSING_SQL = """
+    SELECT tracking_number
+    FROM inbound_staging
+    WHERE main_order_id IS NULL
+    ORDER BY seq
+"""
+
+# 對不到訂單的整批進失敗佇列；已在佇列裡的失敗次數 +1，下次重試時間跟著往後延
+# （ON DUPLICATE KEY UPDATE 由左到右套用，next_retry_at 用的是 +1 之後的 retry_count）。
+# 新值從別名 new 取：VALUES(欄位) 在 MySQL 8.0.20 起已棄用
+_STAGING_ENQUEUE_SQL = """
+    INSERT INTO failed_orders (tracking_number, weight_kg, raw_message, retry_count, last_error, next_retry_at)
+    SELECT * FROM (
+        SELECT tracking_number, weight_kg, raw_message, 1 AS retry_count,
+               '找不到對應訂單' AS last_error, {first_retry} AS next_retry_at
+        FROM inbound_staging
+        WHERE main_order_id IS NULL
+    ) AS new
+    ON DUPLICATE KEY UPDATE
+      weight_kg = IFNULL(new.weight_kg, failed_orders.weight_kg),
+      raw_message = IFNULL(new.raw_message, failed_orders.raw_message),
+      last_error = new.last_error,
+      retry_count = failed_orders.retry_count + 1,
+      next_retry_at = {next_retry},
+      updated_at = CURRENT_TIMESTAMP
+""".format(first_retry=next_retry_sql(1), next_retry=next_retry_sql("failed_orders.retry_count"))
+
+_STAGING_CUSTOMERS_SQL = """
+    SELECT DISTINCT orders.customer_name
+    FROM inbound_staging s
+    JOIN orders ON orders.tracking_number = s.tracking_number
+"""
+
+
+def stage_inbound(conn, found):
+    """found = [(單號, 重量, 原始訊息), ...] → 暫存表（同單號以最後一筆為準）。
+
+    回傳 ({大寫單號: 重量}, [(過長的單號, 重量), ...])；過長的單號不暫存。不 commit。
+    暫存表跟著連線，每次先清空。
+    """
+    staged, too_long = {}, {}
+    for tn, w, raw_line in found:
+        tn = str(tn).strip()
+        if len(tn) > TRACKING_MAX_LEN:
+            too_long[tn.upper()] = (tn, w)
+        elif tn:
+            # 單號比對不分大小寫（跟 orders.tracking_number 的 _ci 定序一致），sf123 / SF123 算同一件
+            staged[tn.upper()] = (tn, w, raw_line)
+    rows = [
+        (seq, tn, None if w is None else float(w), "" if w is None else str(w), raw_line)
+        for seq, (tn, w, raw_line) in enumerate(staged.values(), start=1)
+    ]
+    with conn.cursor() as cur:
+        cur.execute(STAGING_DDL)
+        cur.execute("DELETE FROM inbound_staging")
+        for start in range(0, len(rows), BULK_CHUNK):
+            cur.executemany(_STAGE_INSERT_SQL, rows[start:start + BULK_CHUNK])
+        cur.execute(STAGING_MAIN_ORDER_SQL)
+    return {key: w for key, (_, w, _) in staged.items()}, list(too_long.values())
+
+
+def _apply_staged(conn, found):
+    """暫存 + 寫回訂單 + 佇列進出（不 commit）。
+
+    回傳 (成功列, 失敗單號, {大寫單號: 重量}, [(過長的單號, 重量), ...])。
+    """
+    weights, too_long = stage_inbound(conn, found)
+    with conn.cursor() as cur:
+        cur.execute(STAGING_APPLY_SQL)
+        cur.execute(_STAGING_MATCHED_SQL)
+        matched = cur.fetchall()
+        cur.execute(_STAGING_MISSING_SQL)
+        unmatched = [r[0] for r in cur.fetchall()]
+        if unmatched:
+            cur.execute(_STAGING_ENQUEUE_SQL)
+        cur.execute(_STAGING_CUSTOMERS_SQL)
+        customers = [r[0] for r in cur.fetchall()]
+    if matched:
+        # 這次對上訂單的單號從佇列移除（貼上時剛好補進來的、或背景重試成功的）；
+        # 用參數比對，不和 failed_orders 的定序綁在一起
+        bulk_delete(conn, "failed_orders", "tracking_number", [tn for tn, _ in matched])
+    refresh_customers(conn, customers)
+    return matched, unmatched, weights, too_long
+
+
+def apply_inbound(conn, found):
+    """found = [(單號, 重量, 原始訊息), ...]；回傳 (成功筆數, 失敗單號, 成功列, 失敗列)。
+
+    同單號只計一次：全部歸 0，再以最小 order_id 那筆當主筆。
+    對不到訂單的進失敗佇列，對上的從佇列移除。整批一個交易，任何一句失敗全部 rollback。
+    單號超過 TRACKING_MAX_LEN 的不登記也不進佇列，只列在失敗列（note = TOO_LONG_NOTE）。
+    """
+    today = datetime.today().date()
+    with bulk_transaction(conn, "orders", "failed_orders"):
+        matched, unmatched, weights, too_long = _apply_staged(conn, found)
+
+    ok_rows = [
+        {"tracking_number": tn, "customer_name": name, "weight_kg": weights[tn.upper()], "inbound_date": today}
+        for tn, name in matched
+    ]
+    fail_rows = [
+        {"tracking_number": tn, "customer_name": "", "weight_kg": weights[tn.upper()],
+         "inbound_date": today, "note": "找不到對應訂單"}
+        for tn in unmatched
+    ] + [
+        {"tracking_number": tn, "customer_name": "", "weight_kg": w, "inbound_date": today, "note": TOO_LONG_NOTE}
+        for tn, w in too_long
+    ]
+    return len(ok_rows), unmatched, ok_rows, fail_rows
+
+
+# ===== 佇列批次操作（📨 未成功單號佇列勾選後） =====
+
+# 指派：佇列裡還沒有任何訂單的單號，替指定客戶各新增一筆集運訂單（跟 📮 集運登記管理 相同的欄位）
+_REASSIGN_INSERT_SQL = """
+    INSERT INTO orders
+      (order_time, customer_name, platform, tracking_number,
+       amount_rmb, weight_kg, is_arrived, is_returned, service_fee, remarks)
+    VALUES (CURDATE(), %s, '集運', %s, 0, 0, 0, 0, 0, %s)
+"""
+
+
+def _existing_tracking(conn, tracking_numbers):
+    """已經有訂單的單號（大寫）。單號以參數帶入，和 orders 欄位比對時用欄位本身的定序。"""
+    existing = set()
+    with conn.cursor() as cur:
+        for part in chunked(list(tracking_numbers)):
+            placeholders = ",".join(["%s"] * len(part))
+            cur.execute(f"SELECT tracking_number FROM orders WHERE tracking_number IN ({placeholders})", part)
+            existing.update(str(r[0]).upper() for r in cur.fetchall())
+    return existing
+
+
+def _queued_rows(conn, ids):
+    """勾選的佇列資料 → apply_inbound 的 [(單號, 重量, 原始訊息), ...]。"""
+    found = []
+    with conn.cursor() as cur:
+        for part in chunked([int(i) for i in ids]):
+            placeholders = ",".join(["%s"] * len(part))
+            cur.execute(
+                f"SELECT tracking_number, weight_kg, raw_message FROM failed_orders WHERE id IN ({placeholders})",
+                part,
+            )
+            found += [(tn, None if w is None else float(w), raw) for tn, w, raw in cur.fetchall()]
+    return found
+
+
+def retry_failed(conn, ids):
+    """立即重試勾選的佇列資料（不管下次重試時間）；回傳 (成功筆數, 仍失敗筆數)。"""
+    with bulk_transaction(conn, "orders", "failed_orders"):
+        matched, unmatched, _, _ = _apply_staged(conn, _queued_rows(conn, ids))
+    return len(matched), len(unmatched)
+
+
+def reassign_failed(conn, ids, customer_name):
+    """勾選的單號指派給客戶：沒有訂單的先新增集運訂單，再照入庫流程登記到貨、移出佇列。
+
+    已經有訂單的單號（例如客戶後來補登）不改客戶，直接登記到原訂單。
+    回傳 (新增訂單數, 登記到貨筆數)。
+    """
+    customer_name = str(customer_name or "").strip()
+    if not customer_name:
+        raise ValueError("請輸入要指派的客戶姓名")
+    with bulk_transaction(conn, "orders", "failed_orders"):
+        found = _queued_rows(conn, ids)
+        existing = _existing_tracking(conn, {tn for tn, _, _ in found})
+        new_rows = {}
+        for tn, _, raw in found:
+            if tn.upper() not in existing:
+                new_rows.setdefault(tn.upper(), (customer_name, tn, f"入庫佇列指派｜{raw or ''}"))
+        with conn.cursor() as cur:
+            for part in chunked(list(new_rows.values())):
+                cur.executemany(_REASSIGN_INSERT_SQL, part)
+        matched, _, _, _ = _apply_staged(conn, found)
+    return len(new_rows), len(matched)
@@ -0,0 +1,406 @@
+# migrations.py —— 資料表版本管理：每段 DDL 在每個資料庫只執行一次
+#
+# 新增結構變更時，在 MIGRATIONS 最後面加一筆 (版本號, 說明, [步驟...])。
+# 步驟可以是 SQL 字串，或接收 cursor 的函式（需要先查 information_schema 的情況）。
+# 已經發佈的版本不要再修改內容。
+import streamlit as st
+
+from db_pool import connect, get_connection
+
+MIGRATION_LOCK = "jumao_schema_migrations"
+
+
+def add_column(table, column, definition):
+    """舊表補欄位：欄位已存在就略過（取代以前每次 ALTER 失敗再 except: pass）。"""
+    def step(cur):
+        cur.execute("""
+            SELECT COUNT(*)
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+              AND TABLE_NAME = %s
+              AND COLUMN_NAME = %s
+        """, (table, column))
+        if cur.fetchone()[0] == 0:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+def add_index(table, name, columns):
+    """補索引：同名索引已存在就略過。"""
+    def step(cur):
+        cur.execute("""
+            SELECT COUNT(*)
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE()
+              AND TABLE_NAME = %s
+              AND INDEX_NAME = %s
+        """, (table, name))
+        if cur.fetchone()[0] == 0:
+            cur.execute(f"ALTER TABLE {table} ADD INDEX {name} ({columns})")
+    return step
+
+
+MIGRATIONS = [
+    (1, "orders 基本表（新資料庫用；既有資料庫不會動到）", [
+        """
+        CREATE TABLE IF NOT EXISTS orders (
+          order_id INT AUTO_INCREMENT PRIMARY KEY,
+          order_time DATE NULL,
+          customer_name VARCHAR(255) NULL,
+          platform VARCHAR(50) NULL,
+          tracking_number VARCHAR(255) NULL,
+          amount_rmb DECIMAL(10,2) NULL DEFAULT 0,
+          weight_kg DECIMAL(10,2) NULL DEFAULT 0,
+          is_arrived TINYINT(1) NULL DEFAULT 0,
+          is_returned TINYINT(1) NULL DEFAULT 0,
+          is_early_returned TINYINT(1) NULL DEFAULT 0,
+          early_return TINYINT(1) NULL DEFAULT 0,
+          service_fee DECIMAL(10,2) NULL DEFAULT 0,
+          remarks TEXT NULL
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        """,
+    ]),
+    (2, "members 會員表", [
+        """
+        CREATE TABLE IF NOT EXISTS members (
+          member_id INT AUTO_INCREMENT PRIMARY KEY,
+          customer_name VARCHAR(255) NOT NULL,
+          member_level VARCHAR(50) NOT NULL DEFAULT '一般會員',
+          note TEXT NULL,
+          created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+          line_user_id VARCHAR(100) NULL,
+          line_name VARCHAR(100) NULL,
+          UNIQUE KEY uk_customer_name (customer_name)
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        """,
+        add_column("members", "member_level", "VARCHAR(50) NOT NULL DEFAULT '一般會員'"),
+        add_column("members", "note", "TEXT NULL"),
+        add_column("members", "created_at", "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP"),
+        add_column("members", "updated_at", "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"),
+        add_column("members", "line_user_id", "VARCHAR(100) NULL"),
+        add_column("members", "line_name", "VARCHAR(100) NULL"),
+    ]),
+    (3, "failed_orders 入庫失敗佇列", [
+        """
+        CREATE TABLE IF NOT EXISTS failed_orders (
+          id INT AUTO_INCREMENT PRIMARY KEY,
+          tracking_number VARCHAR(64) NOT NULL,
+          weight_kg DECIMAL(10,3) NULL,
+          raw_message TEXT NULL,
+          retry_count INT NOT NULL DEFAULT 0,
+          last_error VARCHAR(255) NULL,
+          created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+          UNIQUE KEY uk_tracking (tracking_number)
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        """,
+    ]),
+    (4, "前台欲運回申請", [
+        """
+        CREATE TABLE IF NOT EXISTS customer_return_requests (
+          request_id INT AUTO_INCREMENT PRIMARY KEY,
+          customer_name VARCHAR(255) NOT NULL,
+          selected_shipping_batch VARCHAR(255) NOT NULL,
+          delivery_method VARCHAR(50) NOT NULL DEFAULT '面交/自取',
+          total_count INT NOT NULL DEFAULT 0,
+          total_weight DECIMAL(10,3) NOT NULL DEFAULT 0,
+          estimated_fee DECIMAL(10,2) NOT NULL DEFAULT 0,
+          status ENUM('pending','processed','cancelled') NOT NULL DEFAULT 'pending',
+          created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS customer_return_request_items (
+          id INT AUTO_INCREMENT PRIMARY KEY,
+          request_id INT NOT NULL,
+          order_id INT NOT NULL,
+          tracking_number VARCHAR(255) NULL,
+          platform VARCHAR(50) NULL,
+          weight_kg DECIMAL(10,3) NULL,
+          created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          UNIQUE KEY uk_request_order (request_id, order_id),
+          CONSTRAINT fk_return_req_items_request
+            FOREIGN KEY (request_id) REFERENCES customer_return_requests(request_id)
+            ON DELETE CASCADE
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        """,
+    ]),
+    (5, "前台集運登記", [
+        """
+        CREATE TABLE IF NOT EXISTS customer_forwarding_registers (
+          register_id INT AUTO_INCREMENT PRIMARY KEY,
+          customer_name VARCHAR(255) NOT NULL,
+          tracking_number VARCHAR(255) NOT NULL,
+          item_name VARCHAR(255) NOT NULL,
+          quantity INT NOT NULL DEFAULT 1,
+          unit_price_rmb DECIMAL(10,2) NOT NULL DEFAULT 0,
+          remarks TEXT NULL,
+          status ENUM('pending','processed','cancelled') NOT NULL DEFAULT 'pending',
+          created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+          UNIQUE KEY uk_tracking_number (tracking_number)
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        """,
+        add_column("customer_forwarding_registers", "quantity", "INT NOT NULL DEFAULT 1"),
+        add_column("customer_forwarding_registers", "unit_price_rmb", "DECIMAL(10,2) NOT NULL DEFAULT 0"),
+    ]),
+    (6, "前台設定：site_settings / shipping_batches", [
+        """
+        CREATE TABLE IF NOT EXISTS site_settings (
+          setting_key VARCHAR(100) PRIMARY KEY,
+          setting_value TEXT NULL,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS shipping_batches (
+          batch_id INT AUTO_INCREMENT PRIMARY KEY,
+          batch_text VARCHAR(255) NOT NULL,
+          delivery_type VARCHAR(30) NOT NULL DEFAULT 'home_delivery',
+          sort_order INT NOT NULL DEFAULT 0,
+          is_active TINYINT(1) NOT NULL DEFAULT 1,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+          created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        """,
+        add_column("shipping_batches", "delivery_type", "VARCHAR(30) NOT NULL DEFAULT 'home_delivery'"),
+        """
+        INSERT IGNORE INTO site_settings (setting_key, setting_value)
+        VALUES ('current_exchange_rate', '4.78')
+        """,
+    ]),
+    (7, "feedbacks 匿名回饋", [
+        """
+        CREATE TABLE IF NOT EXISTS feedbacks (
+          id INT AUTO_INCREMENT PRIMARY KEY,
+          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          content TEXT NOT NULL,
+          status ENUM('未處理','已讀','已回覆','忽略') DEFAULT '未處理',
+          staff_note VARCHAR(255)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    (8, "data_versions 資料表版本號", [
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+          table_name VARCHAR(64) PRIMARY KEY,
+          version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+          updated_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3)
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        """,
+        """
+        INSERT IGNORE INTO data_versions (table_name, version)
+        VALUES ('orders', 0), ('members', 0), ('failed_orders', 0),
+               ('customer_return_requests', 0), ('customer_forwarding_registers', 0),
+               ('site_settings', 0), ('shipping_batches', 0), ('feedbacks', 0)
+        """,
+    ]),
+    (9, "orders 常用查詢的索引；旗標改 NOT NULL、姓名 / 單號去頭尾空白", [
+        # 旗標沒有 NULL 之後，查詢可以直接寫 is_returned = 0，不必再 OR IS NULL
+        "UPDATE orders SET is_arrived = 0 WHERE is_arrived IS NULL",
+        "UPDATE orders SET is_returned = 0 WHERE is_returned IS NULL",
+        "UPDATE orders SET is_early_returned = 0 WHERE is_early_returned IS NULL",
+        "UPDATE orders SET early_return = 0 WHERE early_return IS NULL",
+        """
+        ALTER TABLE orders
+          MODIFY is_arrived TINYINT(1) NOT NULL DEFAULT 0,
+          MODIFY is_returned TINYINT(1) NOT NULL DEFAULT 0,
+          MODIFY is_early_returned TINYINT(1) NOT NULL DEFAULT 0,
+          MODIFY early_return TINYINT(1) NOT NULL DEFAULT 0
+        """,
+        # 寫入時都有 strip()，這裡補洗舊資料；之後前台查姓名不必再 LOWER(TRIM(...))
+        "UPDATE orders SET customer_name = TRIM(customer_name) WHERE customer_name <> TRIM(customer_name)",
+        "UPDATE orders SET tracking_number = TRIM(tracking_number) WHERE tracking_number <> TRIM(tracking_number)",
+        # 反轉的單號：只記得末幾碼時用前綴比對這一欄（INVISIBLE，SELECT * 不會帶出來）
+        add_column("orders", "tracking_number_rev",
+                   "VARCHAR(255) AS (REVERSE(tracking_number)) VIRTUAL INVISIBLE"),
+        add_index("orders", "idx_orders_customer", "customer_name, is_returned, order_time"),
+        add_index("orders", "idx_orders_tracking", "tracking_number"),
+        add_index("orders", "idx_orders_tracking_rev", "tracking_number_rev"),
+        add_index("orders", "idx_orders_ready", "is_arrived, is_returned, weight_kg"),
+        add_index("orders", "idx_orders_time", "order_time, platform"),
+    ]),
+    (10, "orders 可出貨名單反查未到貨客戶的索引", [
+        add_index("orders", "idx_orders_customer_arrived", "customer_name, is_arrived"),
+    ]),
+    (11, "customer_shipping_state 每位客戶的出貨狀態", [
+        """
+        CREATE TABLE IF NOT EXISTS customer_shipping_state (
+          customer_name VARCHAR(255) PRIMARY KEY,
+          pending_count INT NOT NULL DEFAULT 0,
+          arrived_count INT NOT NULL DEFAULT 0,
+          arrived_weight DECIMAL(12,3) NOT NULL DEFAULT 0,
+          early_return_count INT NOT NULL DEFAULT 0,
+          delayed_count INT NOT NULL DEFAULT 0,
+          notified_count INT NOT NULL DEFAULT 0,
+          last_change_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3),
+          KEY idx_state_ready (pending_count, arrived_count),
+          KEY idx_state_early (early_return_count)
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        """,
+        # 第一次建表時整張算一次；之後由 shipping_state.refresh_customers 逐客戶更新
+        """
+        INSERT IGNORE INTO customer_shipping_state
+        (customer_name, pending_count, arrived_count, arrived_weight,
+         early_return_count, delayed_count, notified_count)
+        SELECT
+            customer_name,
+            SUM(is_arrived = 0),
+            SUM(is_arrived = 1 AND is_returned = 0),
+            COALESCE(SUM(CASE WHEN is_arrived = 1 AND is_returned = 0 THEN weight_kg END), 0),
+            SUM(is_arrived = 1 AND is_returned = 0 AND is_early_returned = 1),
+            SUM(is_arrived = 1 AND is_returned = 0 AND remarks LIKE '%[延後]%'),
+            SUM(is_arrived = 1 AND is_returned = 0 AND remarks LIKE '%[已通知]%')
+        FROM orders
+        WHERE customer_name IS NOT NULL AND customer_name <> ''
+        GROUP BY customer_name
+        HAVING SUM(is_arrived = 0) > 0 OR SUM(is_arrived = 1 AND is_returned = 0) > 0
+        """,
+    ]),
+    (12, "orders 延後 / 已通知改成獨立旗標欄位（取代 remarks 裡的 tag）", [
+        add_column("orders", "is_delayed", "TINYINT(1) NOT NULL DEFAULT 0"),
+        add_column("orders", "delayed_at", "DATETIME NULL"),
+        add_column("orders", "delayed_by", "VARCHAR(100) NULL"),
+        add_column("orders", "is_notified", "TINYINT(1) NOT NULL DEFAULT 0"),
+        add_column("orders", "notified_at", "DATETIME NULL"),
+        add_column("orders", "notified_by", "VARCHAR(100) NULL"),
+        # 舊資料：remarks 裡有 tag 的轉成旗標（設定時間不可考，留 NULL），再把 tag 從 remarks 拿掉
+        "UPDATE orders SET is_delayed = 1, delayed_by = 'remarks 轉換' WHERE remarks LIKE '%[延後]%'",
+        "UPDATE orders SET is_notified = 1, notified_by = 'remarks 轉換' WHERE remarks LIKE '%[已通知]%'",
+        """
+        UPDATE orders
+        SET remarks = TRIM(REPLACE(REPLACE(remarks, '[延後]', ''), '[已通知]', ''))
+        WHERE remarks LIKE '%[延後]%' OR remarks LIKE '%[已通知]%'
+        """,
+        add_index("orders", "idx_orders_delayed", "is_delayed, customer_name"),
+        add_index("orders", "idx_orders_notified", "is_notified, customer_name"),
+    ]),
+    (13, "shipping_rates 運費費率", [
+        """
+        CREATE TABLE IF NOT EXISTS shipping_rates (
+          rate_code VARCHAR(50) PRIMARY KEY,
+          kind ENUM('weight','delivery') NOT NULL,
+          label VARCHAR(50) NOT NULL,
+          per_kg DECIMAL(10,2) NOT NULL DEFAULT 0,
+          min_kg DECIMAL(10,3) NOT NULL DEFAULT 0,
+          step_kg DECIMAL(10,3) NOT NULL DEFAULT 0.5,
+          flat_fee DECIMAL(10,2) NOT NULL DEFAULT 0,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+          UNIQUE KEY uk_kind_label (kind, label)
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        """,
+        """
+        INSERT IGNORE INTO shipping_rates (rate_code, kind, label, per_kg, min_kg, step_kg, flat_fee)
+        VALUES ('forwarding', 'weight', '集運', 90, 1.0, 0.5, 0),
+               ('purchase', 'weight', '代購', 70, 0.5, 0.5, 0),
+               ('pickup', 'delivery', '面交/自取', 0, 0, 0, 0),
+               ('home_delivery', 'delivery', '宅配', 0, 0, 0, 100),
+               ('shop_delivery', 'delivery', '賣貨便', 0, 0, 0, 38)
+        """,
+        "INSERT IGNORE INTO data_versions (table_name, version) VALUES ('shipping_rates', 0)",
+    ]),
+    (14, "前台運回申請一次處理：訂單記下運回申請 / 船班 / 時間", [
+        add_column("orders", "return_request_id", "INT NULL"),
+        add_column("orders", "return_batch", "VARCHAR(255) NULL"),
+        add_column("orders", "returned_at", "DATETIME NULL"),
+        add_column("customer_return_requests", "processed_at", "DATETIME NULL"),
+        add_index("orders", "idx_orders_return_request", "return_request_id"),
+        add_index("customer_return_requests", "idx_return_requests_status", "status, request_id"),
+        add_index("customer_return_requests", "idx_return_requests_updated", "updated_at"),
+    ]),
+    (15, "入庫失敗佇列背景重試：下次重試時間（指數退避）與執行紀錄", [
+        add_column("failed_orders", "next_retry_at", "DATETIME NULL"),
+        add_index("failed_orders", "idx_failed_next_retry", "next_retry_at"),
+        """
+        CREATE TABLE IF NOT EXISTS inbound_retry_runs (
+          run_id INT AUTO_INCREMENT PRIMARY KEY,
+          run_by VARCHAR(20) NOT NULL,
+          started_at DATETIME NOT NULL,
+          finished_at DATETIME NOT NULL,
+          due_count INT NOT NULL DEFAULT 0,
+          succeeded INT NOT NULL DEFAULT 0,
+          still_failed INT NOT NULL DEFAULT 0,
+          error VARCHAR(255) NULL
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+        """,
+    ]),
+]
+
+LATEST_VERSION = max(v for v, _, _ in MIGRATIONS)
+
+
+def current_version(conn):
+    """目前資料庫已套用到第幾版；schema_migrations 還不存在就是 0。"""
+    with conn.cursor() as cur:
+        try:
+            cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        except Exception:
+            return 0
+        version = int(cur.fetchone()[0])
+    if conn.in_transaction:
+        conn.rollback()
+    return version
+
+
+def migrate(conn):
+    """套用尚未執行的版本，回傳這次套用的版本號清單。已是最新版時只花一個 SELECT。"""
+    if current_version(conn) >= LATEST_VERSION:
+        return []
+
+    applied_now = []
+    with conn.cursor() as cur:
+        # 多個程序同時啟動時，只讓一個人跑 DDL
+        cur.execute("SELECT GET_LOCK(%s, 60)", (MIGRATION_LOCK,))
+        if cur.fetchone()[0] != 1:
+            raise RuntimeError("等待資料表升級鎖逾時，請稍後再試")
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                  version INT PRIMARY KEY,
+                  name VARCHAR(255) NOT NULL,
+                  applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+            """)
+            cur.execute("SELECT version FROM schema_migrations")
+            done = {int(r[0]) for r in cur.fetchall()}
+
+            for version, name, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+                if version in done:
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(cur)
+                    else:
+                        cur.execute(step)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (version, name),
+                )
+                conn.commit()
+                applied_now.append(version)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cur.fetchall()
+    return applied_now
+
+
+@st.cache_resource
+def ensure_schema():
+    """每個程序啟動時檢查一次版本；失敗不會被快取，下次 rerun 會再試。"""
+    with get_connection() as conn:
+        return migrate(conn)
+
+
+if __name__ == "__main__":
+    # 部署時也可以手動執行：python migrations.py
+    conn = connect(st.secrets["mysql"])
+    try:
+        applied = migrate(conn)
+        print(f"已套用版本：{applied}" if applied else f"資料表已是最新版（v{LATEST_VERSION}）")
+    finally:
+        conn.close()
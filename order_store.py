@@ -0,0 +1,527 @@
+# order_store.py —— 後台各頁的訂單資料處理（不含畫面，可在 Streamlit 以外呼叫）
+from datetime import date, timedelta
+
+import pandas as pd
+
+from bulk_ops import bulk_update
+from shipping_fees import group_fee_summary
+from sql_frames import read_sql_df
+from table_format import ratio_labels
+
+
+# ===== 延後 / 已通知旗標（orders.is_delayed / is_notified，migrations 第 12 版） =====
+# 以前是 remarks 裡的 [延後] / [已通知] 字串；現在是獨立欄位，*_at / *_by 記最後一次變更的時間與來源。
+
+FLAG_COLUMNS = {
+    "delayed": ("is_delayed", "delayed_at", "delayed_by"),
+    "notified": ("is_notified", "notified_at", "notified_by"),
+}
+
+
+def set_flag(conn, flag, order_ids, value, by=None):
+    """設定 / 取消旗標；已經是目標值的訂單不動（保留原本的時間與來源）。回傳異動筆數。"""
+    col, at_col, by_col = FLAG_COLUMNS[flag]
+    value = int(bool(value))
+    return bulk_update(
+        conn, "orders", "order_id", [int(i) for i in order_ids],
+        f"{col} = %s, {at_col} = NOW(), {by_col} = %s", [value, by],
+        where=f"{col} <> %s", where_params=[value],
+    )
+
+
+# ===== 運回標記 =====
+
+def mark_returned(conn, order_ids, column="is_returned"):
+    """標記已運回（column="is_early_returned" 為提前運回）；回傳異動筆數。"""
+    if column not in ("is_returned", "is_early_returned"):
+        raise ValueError(f"不支援的欄位：{column}")
+    set_sql = "is_returned = 1, returned_at = NOW()" if column == "is_returned" else f"{column} = 1"
+    return bulk_update(
+        conn, "orders", "order_id", [int(i) for i in order_ids],
+        set_sql, where=f"{column} <> 1",
+    )
+
+
+# ===== 查詢條件（都寫成用得到索引的形式） =====
+# orders 的索引見 migrations 第 9 版。原則：欄位外面不包函式、LIKE 只做前綴、
+# 日期用範圍、旗標已是 NOT NULL（不必 OR IS NULL）。
+
+def like_prefix(text):
+    """前綴比對的 LIKE 參數；使用者輸入的 % _ \\ 當一般字元。"""
+    s = str(text).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return s + "%"
+
+
+def tracking_condition(text):
+    """單號搜尋：開頭相符或結尾相符（常只記得末幾碼），兩種都走索引。"""
+    text = str(text).strip()
+    return (
+        "(tracking_number LIKE %s OR tracking_number_rev LIKE %s)",
+        [like_prefix(text), like_prefix(text[::-1])],
+    )
+
+
+def day_range(day):
+    """某一天 → [當天, 隔天)，取代 DATE(order_time) = %s。"""
+    return day, day + timedelta(days=1)
+
+
+def month_range(today=None):
+    """本月 → [本月 1 日, 下月 1 日)，取代 YEAR() / MONTH()。"""
+    first = (today or date.today()).replace(day=1)
+    return first, (first + timedelta(days=32)).replace(day=1)
+
+
+def order_search_query(id_text="", name_text="", amount_text="", tracking_text="",
+                       day=None, returned=None):
+    """✏️ 編輯訂單的搜尋；回傳 (sql, params, 輸入錯誤訊息)。returned：None 全部 / True / False。"""
+    query = """
+        SELECT
+            order_id,
+            order_time,
+            customer_name,
+            platform,
+            tracking_number,
+            amount_rmb,
+            service_fee,
+            weight_kg,
+            is_arrived,
+            is_returned,
+            is_early_returned,
+            remarks
+        FROM orders
+        WHERE 1=1
+    """
+    params = []
+    input_error = None
+
+    if id_text.strip():
+        try:
+            query += " AND order_id = %s"
+            params.append(int(id_text.strip()))
+        except ValueError:
+            input_error = "訂單編號只能輸入整數。"
+
+    if name_text.strip():
+        query += " AND customer_name LIKE %s"
+        params.append(like_prefix(name_text.strip()))
+
+    if amount_text.strip():
+        try:
+            query += " AND amount_rmb = %s"
+            params.append(float(amount_text.strip()))
+        except ValueError:
+            input_error = "訂單金額只能輸入數字。"
+
+    if tracking_text.strip():
+        cond, cond_params = tracking_condition(tracking_text)
+        query += " AND " + cond
+        params += cond_params
+
+    if day:
+        query += " AND order_time >= %s AND order_time < %s"
+        params += list(day_range(day))
+
+    if returned is not None:
+        query += " AND is_returned = %s"
+        params.append(int(bool(returned)))
+
+    query += " ORDER BY order_id DESC LIMIT 100"
+    return query, params, input_error
+
+
+# ===== 後台首頁儀表板 =====
+
+MONTH_ORDERS_SQL = """
+    SELECT COUNT(*) AS month_orders
+    FROM orders
+    WHERE order_time >= %s
+      AND order_time < %s
+      AND platform <> '集運'
+"""
+
+# 到貨未運回的件數 / 公斤數：直接加總 customer_shipping_state（shipping_state.py 維護）
+READY_STATS_SQL = """
+    SELECT
+        COALESCE(SUM(arrived_count), 0) AS ready_count,
+        COALESCE(SUM(arrived_weight), 0) AS ready_weight
+    FROM customer_shipping_state
+"""
+
+def load_dashboard_stats(conn):
+    """讀取後台首頁營運儀表板統計資料。"""
+    stats = {
+        "total_members": 0,
+        "line_bound": 0,
+        "binding_rate": 0.0,
+        "month_orders": 0,
+        "ready_count": 0,
+        "ready_weight": 0.0,
+    }
+
+    try:
+        df = read_sql_df("""
+            SELECT
+                COUNT(*) AS total_members,
+                SUM(
+                    CASE
+                        WHEN line_user_id IS NOT NULL AND TRIM(line_user_id) <> ''
+                        THEN 1 ELSE 0
+                    END
+                ) AS line_bound
+            FROM members
+        """, conn)
+
+        if not df.empty:
+            stats["total_members"] = int(df.loc[0, "total_members"] or 0)
+            stats["line_bound"] = int(df.loc[0, "line_bound"] or 0)
+            if stats["total_members"] > 0:
+                stats["binding_rate"] = stats["line_bound"] / stats["total_members"] * 100
+    except Exception:
+        pass
+
+    try:
+        df = read_sql_df(MONTH_ORDERS_SQL, conn, params=month_range())
+
+        if not df.empty:
+            stats["month_orders"] = int(df.loc[0, "month_orders"] or 0)
+    except Exception:
+        pass
+
+    try:
+        df = read_sql_df(READY_STATS_SQL, conn)
+
+        if not df.empty:
+            stats["ready_count"] = int(df.loc[0, "ready_count"] or 0)
+            stats["ready_weight"] = float(df.loc[0, "ready_weight"] or 0)
+    except Exception:
+        pass
+
+    return stats
+
+
+# ===== 可出貨名單 =====
+
+SHIPPABLE_COLUMNS = """
+    o.order_id, o.order_time, o.customer_name, o.platform, o.tracking_number,
+    o.amount_rmb, o.weight_kg, o.is_arrived, o.is_returned, o.is_early_returned,
+    o.is_delayed, o.is_notified, o.service_fee, o.remarks
+"""
+
+# 同一客戶全部到貨、或單筆到貨且提前運回，並且還沒運回的訂單。
+# 先從 customer_shipping_state（shipping_state.py 維護）挑出可出貨的客戶，
+# 再用 (customer_name, is_arrived) 索引取這些客戶到貨未運回的單；讀取量只跟可出貨的客戶有關。
+SHIPPABLE_FROM = """
+    FROM customer_shipping_state s
+    JOIN orders o
+      ON o.customer_name = s.customer_name
+     AND o.is_arrived = 1
+    WHERE ((s.pending_count = 0 AND s.arrived_count > 0) OR s.early_return_count > 0)
+      AND o.is_returned = 0
+      AND (s.pending_count = 0 OR o.is_early_returned = 1)
+"""
+
+SHIPPABLE_SQL = f"""
+    SELECT {SHIPPABLE_COLUMNS}
+    {SHIPPABLE_FROM}
+    ORDER BY o.order_id
+"""
+
+# 分頁：以 order_id 為游標（keyset），每頁只讀 limit 筆，不用 OFFSET
+SHIPPABLE_PAGE_SQL = f"""
+    SELECT {SHIPPABLE_COLUMNS}
+    {SHIPPABLE_FROM}
+      AND o.order_id > %s
+    ORDER BY o.order_id
+    LIMIT %s
+"""
+
+SHIPPABLE_TOTALS_SQL = f"""
+    SELECT COUNT(*) AS order_count,
+           COALESCE(SUM(o.weight_kg), 0) AS total_weight,
+           COALESCE(SUM(o.is_delayed), 0) AS delayed_count,
+           COALESCE(SUM(o.is_notified), 0) AS notified_count
+    {SHIPPABLE_FROM}
+"""
+
+# 可出貨統整：客戶 × 平台的小計在 SQL 算好，pandas 只處理（客戶數 × 平台數）列
+SHIPPABLE_GROUPS_SQL = f"""
+    SELECT o.customer_name, o.platform,
+           COUNT(*) AS order_count,
+           SUM(o.weight_kg > 0) AS pkg_cnt,
+           COALESCE(SUM(CASE WHEN o.weight_kg > 0 THEN o.weight_kg END), 0) AS total_w,
+           SUM(o.is_delayed) AS delayed_count,
+           SUM(o.is_notified) AS notified_count
+    {SHIPPABLE_FROM}
+    GROUP BY o.customer_name, o.platform
+"""
+
+
+def _in_clause(column, values):
+    values = list(values)
+    if not values:
+        return " AND 1 = 0", []
+    return f" AND {column} IN ({','.join(['%s'] * len(values))})", values
+
+
+def _read_shippable(conn, cond="", params=()):
+    return read_sql_df(
+        f"SELECT {SHIPPABLE_COLUMNS} {SHIPPABLE_FROM}{cond} ORDER BY o.order_id", conn, params=list(params)
+    )
+
+
+def load_shippable_orders(conn):
+    """可出貨名單（全部）：只在匯出全部時才用，畫面上改用分頁讀取。"""
+    return read_sql_df(SHIPPABLE_SQL, conn)
+
+
+def shippable_page(conn, after_id, limit):
+    """order_id 大於 after_id 的下一頁（最多 limit 筆）。"""
+    return read_sql_df(SHIPPABLE_PAGE_SQL, conn, params=[int(after_id), int(limit)])
+
+
+def shippable_totals(conn):
+    """可出貨名單的筆數、總重量、延後 / 已通知筆數（dict）。"""
+    df = read_sql_df(SHIPPABLE_TOTALS_SQL, conn)
+    row = df.iloc[0] if not df.empty else {}
+    return {
+        "order_count": int(row.get("order_count", 0) or 0),
+        "total_weight": float(row.get("total_weight", 0) or 0),
+        "delayed_count": int(row.get("delayed_count", 0) or 0),
+        "notified_count": int(row.get("notified_count", 0) or 0),
+    }
+
+
+def shippable_by_ids(conn, order_ids):
+    """勾選的訂單裡，目前仍在可出貨名單上的那些。"""
+    return _read_shippable(conn, *_in_clause("o.order_id", [int(i) for i in order_ids]))
+
+
+def _customers_clause(names, exclude_delayed=False, exclude_notified=False):
+    cond, params = _in_clause("o.customer_name", [str(n) for n in names])
+    if exclude_delayed:
+        cond += " AND o.is_delayed = 0"
+    if exclude_notified:
+        cond += " AND o.is_notified = 0"
+    return cond, params
+
+
+def shippable_by_customers(conn, names, exclude_delayed=False, exclude_notified=False):
+    """這些客戶在可出貨名單上的訂單；可排除延後 / 已通知。"""
+    return _read_shippable(conn, *_customers_clause(names, exclude_delayed, exclude_notified))
+
+
+def has_shippable_of_customers(conn, names, exclude_delayed=False, exclude_notified=False):
+    """這些客戶（同樣的篩選）在可出貨名單上是否還有訂單；只查一筆，給按鈕判斷能不能按。"""
+    cond, params = _customers_clause(names, exclude_delayed, exclude_notified)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT 1 {SHIPPABLE_FROM}{cond} LIMIT 1", params)
+        return cur.fetchone() is not None
+
+
+def shippable_ids_of_customers(conn, names):
+    """這些客戶在可出貨名單上的訂單編號（統整表的批次操作用）。"""
+    cond, params = _in_clause("o.customer_name", [str(n) for n in names])
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT o.order_id {SHIPPABLE_FROM}{cond} ORDER BY o.order_id", params)
+        return [int(r[0]) for r in cur.fetchall()]
+
+
+def group_shippable(df_calc):
+    """由逐筆可出貨訂單算出客戶 × 平台小計（和 SHIPPABLE_GROUPS_SQL 同樣的欄位）。"""
+    w = pd.to_numeric(df_calc["weight_kg"], errors="coerce").fillna(0.0)
+    return (
+        df_calc.assign(_w=w, _pkg=(w > 0).astype(int), _nz=w.where(w > 0, 0.0))
+               .groupby(["customer_name", "platform"], as_index=False, sort=False)
+               .agg(
+                   order_count=("order_id", "count"),
+                   pkg_cnt=("_pkg", "sum"),
+                   total_w=("_nz", "sum"),
+                   delayed_count=("is_delayed", "sum"),
+                   notified_count=("is_notified", "sum"),
+               )
+    )
+
+
+def summarize_groups(groups, rates=None):
+    """可出貨統整：每位客戶的包裹數、公斤數、國際運費與延後 / 已通知統計。
+
+    groups 是客戶 × 平台小計（SHIPPABLE_GROUPS_SQL 或 group_shippable）；
+    運費依 shipping_fees 的費率（rates 不給就讀資料庫）。只有 0 kg 包裹的客戶不列出。
+    """
+    per_customer_flags = (
+        groups.groupby("customer_name", as_index=False)
+              .agg(
+                  延後數=("delayed_count", "sum"),
+                  已通知數=("notified_count", "sum"),
+                  本次清單總筆數=("order_count", "sum")
+              )
+    )
+
+    summary_fee = group_fee_summary(groups, rates)
+
+    summary = summary_fee.merge(per_customer_flags, on="customer_name", how="left").fillna(0)
+    for col in ["延後數", "已通知數", "本次清單總筆數"]:
+        summary[col] = summary[col].astype(int)
+
+    total = summary["本次清單總筆數"]
+    summary["標記"] = ratio_labels(summary["延後數"], total, "⛔ 全部延後", "⚠️ 部分延後")
+    summary["通知"] = ratio_labels(summary["已通知數"], total, "✅ 已全通知", "🟡 部分通知")
+
+    return summary.sort_values(["總國際運費", "總公斤數"], ascending=[False, False])
+
+
+def summarize_shippable(df_calc, rates=None):
+    """同 summarize_groups，輸入是逐筆可出貨訂單。"""
+    return summarize_groups(group_shippable(df_calc), rates)
+
+
+def load_shippable_summary(conn, rates=None):
+    """可出貨統整直接從 SQL 小計算出，不必先讀全部可出貨訂單。"""
+    groups = read_sql_df(SHIPPABLE_GROUPS_SQL, conn)
+    for col in ["order_count", "pkg_cnt", "delayed_count", "notified_count"]:
+        groups[col] = pd.to_numeric(groups[col], errors="coerce").fillna(0).astype(int)
+    return summarize_groups(groups, rates)
+
+
+# ===== 批次出貨 =====
+
+BATCH_PAGE_SQL = """
+    SELECT * FROM orders
+    WHERE customer_name LIKE %s AND order_id > %s
+    ORDER BY order_id
+    LIMIT %s
+"""
+
+BATCH_TOTALS_SQL = """
+    SELECT COUNT(*) AS order_count, COALESCE(SUM(weight_kg), 0) AS total_weight
+    FROM orders
+    WHERE customer_name LIKE %s
+"""
+
+
+def batch_page(conn, name_text, after_id, limit):
+    """🚚 批次出貨：姓名開頭符合的訂單，order_id 大於 after_id 的下一頁。"""
+    return read_sql_df(BATCH_PAGE_SQL, conn, params=[like_prefix(name_text.strip()), int(after_id), int(limit)])
+
+
+def batch_totals(conn, name_text):
+    df = read_sql_df(BATCH_TOTALS_SQL, conn, params=[like_prefix(name_text.strip())])
+    return int(df.loc[0, "order_count"] or 0), float(df.loc[0, "total_weight"] or 0)
+
+
+def order_totals(conn, order_ids):
+    """勾選訂單的筆數與總重量（SQL 加總，不必把勾選的訂單讀回來）。"""
+    cond, params = _in_clause("order_id", [int(i) for i in order_ids])
+    df = read_sql_df(
+        f"SELECT COUNT(*) AS order_count, COALESCE(SUM(weight_kg), 0) AS total_weight FROM orders WHERE 1 = 1{cond}",
+        conn, params=params,
+    )
+    return int(df.loc[0, "order_count"] or 0), float(df.loc[0, "total_weight"] or 0)
+
+
+# ===== 利潤報表 =====
+
+def profit_report(df, rmb_rate, payment_sell_rate, purchase_sell_rate):
+    """逐筆算出匯率價差利潤、手續費收入與總利潤；只保留有下單日期的訂單。"""
+    # 轉日期欄位
+    df["order_time"] = pd.to_datetime(df["order_time"], errors="coerce")
+
+    # 只保留有日期的資料（避免 min/max 出錯）
+    df_valid = df.dropna(subset=["order_time"]).copy()
+    if df_valid.empty:
+        return df_valid
+
+    # DECIMAL 在 read_sql_df 已解成 float64，這裡只需把 NULL 當 0
+    for col in ["amount_rmb", "service_fee"]:
+        if col not in df_valid.columns:
+            df_valid[col] = 0.0
+
+        df_valid[col] = df_valid[col].fillna(0.0)
+
+    if "customer_name" not in df_valid.columns:
+        df_valid["customer_name"] = ""
+
+    rmb_rate_float = float(rmb_rate or 0.0)
+    payment_sell_rate_float = float(payment_sell_rate or 0.0)
+    purchase_sell_rate_float = float(purchase_sell_rate or 0.0)
+
+    # 客戶姓名完全等於「代付」時，判斷為代付訂單
+    is_payment_order = (
+        df_valid["customer_name"]
+        .fillna("")
+        .astype(str)
+        .str.strip()
+        .eq("代付")
+    )
+
+    df_valid["訂單類型"] = "代購"
+    df_valid.loc[is_payment_order, "訂單類型"] = "代付"
+
+    # 每筆訂單依類型套用不同定價匯率
+    df_valid["適用定價匯率"] = purchase_sell_rate_float
+    df_valid.loc[is_payment_order, "適用定價匯率"] = payment_sell_rate_float
+
+    # 計算三個利潤欄位（即時計算，不存 DB）
+    df_valid["匯率價差利潤"] = (
+        df_valid["amount_rmb"]
+        * (df_valid["適用定價匯率"] - rmb_rate_float)
+    ).round(2)
+
+    df_valid["代購手續費收入"] = (
+        df_valid["service_fee"]
+    ).round(2)
+
+    df_valid["總利潤"] = (
+        df_valid["匯率價差利潤"]
+        + df_valid["代購手續費收入"]
+    ).round(2)
+
+    return df_valid
+
+
+# ===== 前台：客戶查詢訂單 =====
+
+CUSTOMER_ORDER_COLUMNS = """
+    order_id,
+    order_time,
+    customer_name,
+    platform,
+    tracking_number,
+    amount_rmb,
+    weight_kg,
+    is_arrived,
+    is_returned,
+    remarks,
+    service_fee,
+    early_return,
+    is_early_returned
+"""
+
+
+def customer_orders_sql(show_all=False):
+    sql = f"""
+    SELECT {CUSTOMER_ORDER_COLUMNS}
+    FROM orders
+    WHERE customer_name = %s
+    """
+    if not show_all:
+        sql += "  AND is_returned = 0\n"
+    return sql + "ORDER BY order_time DESC, order_id DESC"
+
+
+def customer_orders(conn, customer_name, show_all=False):
+    """前台「查詢訂單」：預設只列未運回的訂單，show_all 時列出全部歷史。"""
+    df = read_sql_df(customer_orders_sql(show_all), conn, params=[customer_name])
+
+    for col in ["is_arrived", "is_returned", "is_early_returned", "early_return"]:
+        if col in df.columns:
+            df[col] = df[col].fillna(0).astype(int)
+
+    if "weight_kg" in df.columns:
+        df["weight_kg"] = pd.to_numeric(df["weight_kg"], errors="coerce").fillna(0.0)
+
+    if "amount_rmb" in df.columns:
+        df["amount_rmb"] = pd.to_numeric(df["amount_rmb"], errors="coerce").fillna(0.0)
+
+    return df
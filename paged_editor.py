@@ -0,0 +1,140 @@
+# paged_editor.py —— 分頁勾選表（📦 可出貨名單、🚚 批次出貨、📨 未成功單號佇列）
+#
+# 以前 st.data_editor 一次收整份候選清單，每勾一格整份表來回傳一次、整頁重跑。
+# 現在每頁只讀 page_size 筆（預設以 order_id 為游標的 keyset 分頁，由呼叫端給 fetch_page），
+# 勾選結果存在 session_state 的集合裡，換頁不會遺失；批次操作與下載都針對這個集合。
+import math
+
+import pandas as pd
+import streamlit as st
+
+SELECT_COL = "✅ 選取"
+PAGE_SIZES = [50, 100, 200, 500]
+
+
+# ===== 勾選集合 =====
+
+def selection(key):
+    """目前勾選的 order_id 集合（跨頁保留）。"""
+    return st.session_state.setdefault(f"{key}_selected", set())
+
+
+def clear_selection(key):
+    st.session_state[f"{key}_selected"] = set()
+
+
+def _first_page(key):
+    st.session_state[f"{key}_cursors"] = [0]
+
+
+def _reset(key):
+    _first_page(key)
+    clear_selection(key)
+
+
+def reset_editor(key):
+    """回到第一頁並清空勾選（批次刪除等會讓列數變動的操作之後用）。"""
+    _reset(key)
+
+
+def _next_page(key, cursor):
+    st.session_state[f"{key}_cursors"].append(cursor)
+
+
+def _prev_page(key):
+    cursors = st.session_state[f"{key}_cursors"]
+    if len(cursors) > 1:
+        cursors.pop()
+
+
+def _select_ids(key, ids, checked):
+    sel = selection(key)
+    if checked:
+        sel.update(ids)
+    else:
+        sel.difference_update(ids)
+
+
+def _apply_edits(key, page_ids):
+    # data_editor 的 edited_rows 以本頁列號為索引：{列號: {欄名: 新值}}
+    edits = st.session_state.get(f"{key}_editor", {}).get("edited_rows", {})
+    sel = selection(key)
+    for row, changes in edits.items():
+        if SELECT_COL not in changes:
+            continue
+        oid = page_ids[int(row)]
+        if changes[SELECT_COL]:
+            sel.add(oid)
+        else:
+            sel.discard(oid)
+
+
+# ===== 畫面 =====
+
+def paged_editor(key, fetch_page, to_display, total, scope=None, height=420, help=None,
+                 id_col="order_id", next_cursor=None):
+    """顯示一頁勾選表，回傳本頁的原始資料。
+
+    fetch_page(cursor, limit)：讀游標之後的前 limit 筆；第一頁的游標是 0。
+      預設游標是上一頁最後一筆的 id_col（id_col > cursor，依 id_col 排序）。
+    to_display(df)：原始資料 → 顯示用表格（同樣列序，不含勾選欄）。
+    total：符合條件的總筆數（由 SQL COUNT 算好）。
+    scope：查詢條件；變了就回到第一頁並清空勾選。
+    id_col：勾選集合裡存的欄位。
+    next_cursor(page, cursor)：下一頁的游標；例如用 OFFSET 分頁時傳 lambda page, cursor: cursor + len(page)。
+    """
+    if st.session_state.get(f"{key}_scope") != scope or f"{key}_cursors" not in st.session_state:
+        st.session_state[f"{key}_scope"] = scope
+        _reset(key)
+
+    page_size = st.selectbox(
+        "每頁筆數", PAGE_SIZES, index=1, key=f"{key}_page_size",
+        on_change=_first_page, args=(key,),
+    )
+    cursors = st.session_state[f"{key}_cursors"]
+
+    # 多讀一筆判斷還有沒有下一頁
+    raw = fetch_page(cursors[-1], page_size + 1)
+    has_next = len(raw) > page_size
+    page = raw.iloc[:page_size].reset_index(drop=True)
+    page_ids = [int(i) for i in page[id_col]]
+
+    sel = selection(key)
+    ui = to_display(page.copy()).reset_index(drop=True)
+    ui.insert(0, SELECT_COL, pd.Series([i in sel for i in page_ids], dtype=bool))
+
+    st.data_editor(
+        ui,
+        key=f"{key}_editor",
+        hide_index=True,
+        disabled=[c for c in ui.columns if c != SELECT_COL],
+        use_container_width=True,
+        height=height,
+        column_config={SELECT_COL: st.column_config.CheckboxColumn(SELECT_COL, help=help)},
+        on_change=_apply_edits,
+        args=(key, page_ids),
+    )
+
+    n_pages = max(1, math.ceil(total / page_size))
+    b1, b2, b3, b4, b5, b6 = st.columns([1, 1, 1, 1, 1, 2])
+    b1.button("⏮ 第一頁", key=f"{key}_first", on_click=_first_page, args=(key,),
+              disabled=len(cursors) == 1, use_container_width=True)
+    b2.button("◀ 上一頁", key=f"{key}_prev", on_click=_prev_page, args=(key,),
+              disabled=len(cursors) == 1, use_container_width=True)
+    if next_cursor is None:
+        after = page_ids[-1] if page_ids else 0
+    else:
+        after = next_cursor(page, cursors[-1])
+    b3.button("下一頁 ▶", key=f"{key}_next", on_click=_next_page,
+              args=(key, after),
+              disabled=not has_next, use_container_width=True)
+    b4.button("☑️ 全選本頁", key=f"{key}_page_all", on_click=_select_ids, args=(key, page_ids, True),
+              disabled=not page_ids, use_container_width=True)
+    b5.button("⬜ 取消本頁", key=f"{key}_page_none", on_click=_select_ids, args=(key, page_ids, False),
+              disabled=not page_ids, use_container_width=True)
+    b6.caption(f"第 {len(cursors)} / {n_pages} 頁，共 {total:,} 筆；已勾選 {len(sel):,} 筆")
+
+    if sel:
+        st.button(f"🧹 清除全部勾選（{len(sel):,} 筆）", key=f"{key}_clear",
+                  on_click=clear_selection, args=(key,))
+    return page
@@ -0,0 +1,118 @@
+# query_cache.py —— 依「資料表版本」失效的查詢快取
+#
+# 讀取函式用 @cached_query("表名", ...) 宣告自己依賴哪些表；寫入的地方在 commit 前呼叫
+# data_versions.bump_versions(conn, "表名", ...)，只有相關的快取會失效。
+# 版本號來自 data_versions 表（每 VERSION_POLL_SECONDS 秒最多查一次，跨程序也看得到）；
+# 本程序自己寫過資料時下一次讀取會立刻重查。TTL 只是保險。
+# 沒命中時，存進快取的版本號改在「讀資料的那條連線」上重讀一次：呼叫端的連線可能還停在較舊的
+# REPEATABLE READ 快照，資料和版本號要出自同一個快照，舊資料才不會掛在新版本號底下。
+import functools
+import inspect
+import threading
+import time
+
+import pandas as pd
+
+from data_versions import last_local_bump, load_versions
+from db_pool import get_connection
+
+DEFAULT_TTL = 300          # 秒
+VERSION_POLL_SECONDS = 2   # 多久去 data_versions 看一次版本
+LOCAL_WRITE_GRACE = 1.0    # 本程序寫入後這段時間內每次都重抓（bump 在 commit 前，要等交易提交）
+MAX_ENTRIES = 512
+
+_lock = threading.Lock()
+_versions = {}  # 表名 → 版本號（最近一次從 data_versions 讀到的）
+_checked_at = float("-inf")
+_entries = {}   # key → (值, 到期時間, 依賴的表, 當時的版本)
+
+
+def _refresh_versions():
+    global _checked_at
+    now = time.monotonic()
+    with _lock:
+        recent_write = _checked_at < last_local_bump() + LOCAL_WRITE_GRACE
+        if not recent_write and now - _checked_at < VERSION_POLL_SECONDS:
+            return
+        _checked_at = now
+    try:
+        with get_connection() as conn:
+            versions = load_versions(conn)
+    except Exception:
+        return  # 讀不到版本就沿用舊的，靠 TTL 兜底
+    with _lock:
+        _versions.clear()
+        _versions.update(versions)
+
+
+def table_versions(tables):
+    _refresh_versions()
+    with _lock:
+        return tuple(_versions.get(t, 0) for t in tables)
+
+
+def snapshot_versions(conn, tables):
+    """在呼叫端連線目前的快照裡讀版本號，和接著在同一條連線讀到的資料一致。"""
+    versions = load_versions(conn)
+    return tuple(versions.get(t, 0) for t in tables)
+
+
+def _copy(value):
+    # 快取的值是共用的，回傳複本以免呼叫端改到
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, (list, dict, set)):
+        return value.copy()
+    return value
+
+
+def _prune(now):
+    stale = [
+        k for k, (_, expires, tables, versions) in _entries.items()
+        if expires <= now or tuple(_versions.get(t, 0) for t in tables) != versions
+    ]
+    for k in stale:
+        del _entries[k]
+    if len(_entries) >= MAX_ENTRIES:
+        for k in sorted(_entries, key=lambda k: _entries[k][1])[: MAX_ENTRIES // 2]:
+            del _entries[k]
+
+
+def cached_query(*tables, ttl=DEFAULT_TTL):
+    """快取讀取結果；參數中名為 conn 的連線不列入快取鍵。"""
+    def decorator(fn):
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key_args = tuple((k, v) for k, v in bound.arguments.items() if k != "conn")
+            versions = table_versions(tables)
+            key = (fn.__module__, fn.__qualname__, key_args, versions)
+
+            now = time.monotonic()
+            with _lock:
+                hit = _entries.get(key)
+            if hit is not None and hit[1] > now:
+                return _copy(hit[0])
+
+            conn = bound.arguments.get("conn")
+            if conn is not None:
+                versions = snapshot_versions(conn, tables)
+                key = key[:-1] + (versions,)
+            value = fn(*args, **kwargs)  # 例外不會被快取
+            with _lock:
+                if len(_entries) >= MAX_ENTRIES:
+                    _prune(now)
+                _entries[key] = (value, now + ttl, tables, versions)
+            return _copy(value)
+
+        wrapper.tables = tables
+        return wrapper
+    return decorator
+
+
+def clear():
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,218 @@
+# retry_worker.py —— 入庫失敗佇列的背景重試
+#
+# 以前進 📥 貼上入庫訊息 就同步重試整個 failed_orders：逐列 UPDATE + commit + DELETE + commit，
+# 佇列一長整頁卡住。現在由獨立程序（或排程）執行：
+#
+#     python retry_worker.py                        # 跑一輪（排程用，例如 cron 每 5 分鐘）
+#     python retry_worker.py --loop --interval 60   # 常駐，每 60 秒一輪
+#     python retry_worker.py --loop --watch D:/inbound   # 順便處理監看資料夾裡的倉庫檔案（inbound_files）
+#
+# 每輪只挑 next_retry_at 已到的單號，每 RETRY_BATCH 筆走一次 apply_inbound（暫存表 + JOIN 更新）：
+# 對上的寫回訂單並移出佇列，仍對不到的失敗次數 +1、下次重試時間往後延。
+# 每輪結果寫進 inbound_retry_runs，頁面只查 retry_status 一句就能顯示。
+# 頁面不自己重試：按「請背景立即執行」只在 site_settings 留一個請求（request_run），
+# 常駐的 worker 每 REQUEST_POLL_SECONDS 秒看一次，有請求就提早跑下一輪。
+import argparse
+import time
+from datetime import datetime
+
+import streamlit as st
+
+from db_pool import connect
+from inbound_files import configured_watch_dir, ingest_folder
+from inbound_store import apply_inbound
+
+RETRY_BATCH = 500
+STALE_AFTER_SECONDS = 15 * 60  # 超過這麼久沒有新的執行紀錄，頁面提示背景重試可能沒在跑
+REQUEST_POLL_SECONDS = 5       # 常駐時每隔幾秒看一次頁面有沒有請求立即執行
+RUN_REQUEST_KEY = "inbound_worker_run_requested"  # site_settings：頁面請求的時間，worker 接手時刪掉
+
+_DUE_SQL = """
+    SELECT id, tracking_number, weight_kg, raw_message
+    FROM failed_orders
+    WHERE id > %s{due}
+    ORDER BY id
+    LIMIT %s
+"""
+
+_RECORD_RUN_SQL = """
+    INSERT INTO inbound_retry_runs (run_by, started_at, finished_at, due_count, succeeded, still_failed, error)
+    VALUES (%s, %s, NOW(), %s, %s, %s, %s)
+"""
+
+# 佇列筆數、已到期筆數、最近一輪的結果（還沒跑過時 run_* 欄位為 NULL）、還沒被接手的頁面請求
+_STATUS_SQL = """
+    SELECT q.queued, q.due,
+           r.run_by, r.started_at, r.finished_at, r.due_count, r.succeeded, r.still_failed, r.error,
+           TIMESTAMPDIFF(SECOND, r.finished_at, NOW()) AS age_seconds,
+           rq.setting_value AS run_requested_at
+    FROM (
+        SELECT COUNT(*) AS queued,
+               COALESCE(SUM(next_retry_at IS NULL OR next_retry_at <= NOW()), 0) AS due
+        FROM failed_orders
+    ) q
+    LEFT JOIN (
+        SELECT * FROM inbound_retry_runs ORDER BY run_id DESC LIMIT 1
+    ) r ON TRUE
+    LEFT JOIN site_settings rq ON rq.setting_key = %s
+"""
+
+
+# ===== 重試一輪 =====
+
+def run_once(conn, run_by="worker", due_only=True, batch=RETRY_BATCH):
+    """重試佇列一輪並寫入執行紀錄；回傳 dict（due_count / succeeded / still_failed / error）。
+
+    due_only=False 時不管 next_retry_at，整個佇列都重試（維運用：python retry_worker.py --all）。
+    以 id 遞增分批，每批一個交易；某一批失敗就停在那裡，錯誤記在執行紀錄。
+    """
+    if conn.in_transaction:
+        conn.rollback()  # 長駐連線：丟掉上一輪的快照，讀最新的佇列
+    with conn.cursor() as cur:
+        cur.execute("SELECT NOW()")  # 時間一律用資料庫的（連線時區 +08:00），跟 age_seconds 對得上
+        started = cur.fetchone()[0]
+    due_sql = _DUE_SQL.format(due=" AND (next_retry_at IS NULL OR next_retry_at <= NOW())" if due_only else "")
+    due_count = succeeded = still_failed = 0
+    error = None
+    last_id = 0
+    try:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(due_sql, (last_id, batch))
+                rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            found = [(tn, None if w is None else float(w), raw) for _, tn, w, raw in rows]
+            updated, missing, _, _ = apply_inbound(conn, found)
+            due_count += len(rows)
+            succeeded += updated
+            still_failed += len(missing)
+            if len(rows) < batch:
+                break
+    except Exception as e:
+        conn.rollback()
+        error = str(e)[:250]
+
+    with conn.cursor() as cur:
+        cur.execute(_RECORD_RUN_SQL, (
+            run_by, started, due_count, succeeded, still_failed, error,
+        ))
+    conn.commit()
+    return {"due_count": due_count, "succeeded": succeeded, "still_failed": still_failed, "error": error}
+
+
+def retry_status(conn):
+    """頁面用：佇列筆數、已到期筆數、最近一輪的結果與待處理的立即執行請求（一句 SELECT）。"""
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute(_STATUS_SQL, (RUN_REQUEST_KEY,))
+        status = cur.fetchone()
+    status["queued"] = int(status["queued"])
+    status["due"] = int(status["due"])
+    status["stale"] = status["age_seconds"] is None or status["age_seconds"] > STALE_AFTER_SECONDS
+    return status
+
+
+# ===== 頁面請求立即執行 =====
+
+def request_run(conn):
+    """頁面用：請背景 worker 盡快跑一輪（已經有請求在等就不重複寫）。"""
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT IGNORE INTO site_settings (setting_key, setting_value) VALUES (%s, NOW())",
+            (RUN_REQUEST_KEY,),
+        )
+    conn.commit()
+
+
+def claim_run_request(conn):
+    """worker 接手頁面的請求（刪掉旗標）；有請求回傳 True。多個 worker 同時搶只會有一個拿到。"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM site_settings WHERE setting_key = %s", (RUN_REQUEST_KEY,))
+        claimed = cur.rowcount > 0
+    conn.commit()
+    return claimed
+
+
+def _wait_for_next_round(conn, seconds):
+    """等到下一輪；期間頁面請求立即執行就提早結束。"""
+    deadline = time.monotonic() + seconds
+    while True:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            return
+        time.sleep(min(REQUEST_POLL_SECONDS, left))
+        if conn is None:
+            continue
+        try:
+            if claim_run_request(conn):
+                return
+        except Exception:
+            return  # 連線有問題：直接進下一輪，由那邊重連
+
+
+# ===== 獨立執行 =====
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="入庫失敗佇列背景重試")
+    parser.add_argument("--loop", action="store_true", help="常駐執行，每 --interval 秒一輪")
+    parser.add_argument("--interval", type=int, default=60)
+    parser.add_argument("--batch", type=int, default=RETRY_BATCH)
+    parser.add_argument("--all", action="store_true", help="不管下次重試時間，整個佇列都重試（維運用）")
+    parser.add_argument("--watch", default=configured_watch_dir(),
+                        help="監看資料夾：每輪先匯入裡面的倉庫檔案（預設 INBOUND_WATCH_DIR）")
+    args = parser.parse_args(argv)
+
+    cfg = st.secrets["mysql"]
+    conn = None
+    while True:
+        try:
+            if conn is None:
+                conn = connect(cfg)
+            claim_run_request(conn)  # 這一輪就會處理，頁面在等的請求一併清掉
+            if args.watch:
+                results = ingest_folder(conn, args.watch)
+                for r in results:
+                    if r.get("move_only"):
+                        print(f"{datetime.now():%Y-%m-%d %H:%M:%S} 檔案 {r['file']}：先前已匯入，這次搬到 {r['moved_to']}",
+                              flush=True)
+                        continue
+                    print(
+                        f"{datetime.now():%Y-%m-%d %H:%M:%S} 檔案 {r['file']}："
+                        + (f"失敗：{r['error']}" if "error" in r else
+                           f"{r['lines']:,} 行，登記 {r['updated']:,} 筆、對不到 {r['missing']:,} 筆"
+                           + (f"、單號過長 {r['rejected']:,} 筆" if r["rejected"] else ""))
+                        + (f"；{r['move_error']}" if "move_error" in r else ""),
+                        flush=True,
+                    )
+                record_error = next((r["record_error"] for r in results if "record_error" in r), None)
+                if record_error:
+                    # 搬不走又記不住：再監看下去同一批檔案每輪都會重新匯入
+                    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {record_error}；停止監看 {args.watch}，"
+                          "請處理資料夾權限後重新啟動", flush=True)
+                    args.watch = None
+            result = run_once(conn, due_only=not args.all, batch=args.batch)
+            print(
+                f"{datetime.now():%Y-%m-%d %H:%M:%S} 到期 {result['due_count']} 筆，"
+                f"成功 {result['succeeded']}、仍失敗 {result['still_failed']}"
+                + (f"；錯誤：{result['error']}" if result["error"] else ""),
+                flush=True,
+            )
+        except Exception as e:
+            # 多半是連線斷了：丟掉這條連線，下一輪重連（重連時才會重設時區）
+            print(f"{datetime.now():%Y-%m-%d %H:%M:%S} 重試失敗：{e}", flush=True)
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+        if not args.loop:
+            break
+        _wait_for_next_round(conn, args.interval)
+    if conn is not None:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
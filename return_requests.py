@@ -0,0 +1,261 @@
+# return_requests.py —— 前台送出的運回申請（📦 可出貨名單 → 前台送出的運回申請）
+#
+# 以前先用 GROUP_CONCAT 彙總每筆申請的訂單（超過 group_concat_max_len 會被默默截斷），
+# 看明細時再逐筆 load_request_items。現在一句 SQL 把待處理申請、明細與對應訂單一起讀回來，
+# 拆成「申請」「明細」兩個以 request_id 對應的 DataFrame；清單字串在 pandas 組，不會截斷。
+# 讀過的結果放在 session_state：資料表版本沒變就不查；只有申請有變時，只讀 request_id 比上次大、
+# 或最近更新過（狀態改了）的申請；orders 有變才整批重讀（明細要顯示最新的到貨 / 運回狀態）。
+from datetime import timedelta
+
+import pandas as pd
+
+from bulk_ops import bulk_transaction, bulk_update, chunked
+from query_cache import table_versions
+from shipping_state import refresh_customers
+from sql_frames import read_sql_df
+
+# 交易提交順序不一定等於 request_id / updated_at 順序，增量讀取往回多看這段時間
+UPDATE_OVERLAP = timedelta(minutes=2)
+
+REQUEST_COLUMNS = [
+    "request_id", "customer_name", "selected_shipping_batch", "delivery_method",
+    "total_count", "total_weight", "estimated_fee", "status", "created_at", "updated_at",
+]
+
+ITEM_COLUMNS = [
+    "request_id", "order_id", "order_time", "customer_name", "platform", "tracking_number",
+    "amount_rmb", "weight_kg", "is_arrived", "is_returned", "remarks", "item_tracking_number",
+]
+
+# 一列 = 一筆明細（沒有明細的申請也有一列，明細欄位為 NULL）
+_REQUEST_ROWS_SQL = """
+    SELECT
+        r.request_id, r.customer_name, r.selected_shipping_batch, r.delivery_method,
+        r.total_count, r.total_weight, r.estimated_fee, r.status, r.created_at, r.updated_at,
+        i.order_id,
+        i.tracking_number AS item_tracking_number,
+        o.order_time,
+        o.customer_name AS order_customer_name,
+        o.platform,
+        o.tracking_number,
+        o.amount_rmb,
+        o.weight_kg,
+        o.is_arrived,
+        o.is_returned,
+        o.remarks
+    FROM customer_return_requests r
+    LEFT JOIN customer_return_request_items i ON i.request_id = r.request_id
+    LEFT JOIN orders o ON o.order_id = i.order_id
+    WHERE {where}
+    ORDER BY r.request_id, i.order_id
+"""
+
+
+# ===== 讀取 =====
+
+def split_rows(rows):
+    """查詢結果 → (申請, 明細)，兩者以 request_id 對應。"""
+    requests = rows[REQUEST_COLUMNS].drop_duplicates("request_id").reset_index(drop=True)
+    items = (
+        rows[rows["order_id"].notna()]
+        .drop(columns=["customer_name"])
+        .rename(columns={"order_customer_name": "customer_name"})
+    )
+    items = items[ITEM_COLUMNS].reset_index(drop=True)
+    items["order_id"] = items["order_id"].astype("int64")
+    return requests, items
+
+
+def fetch_pending(conn):
+    """全部待處理申請與明細（一句 SQL）。"""
+    return split_rows(read_sql_df(_REQUEST_ROWS_SQL.format(where="r.status = 'pending'"), conn))
+
+
+def fetch_changed(conn, after_id, updated_since):
+    """request_id > after_id，或 updated_since 之後更新過的申請（不論狀態，由呼叫端合併）。"""
+    rows = read_sql_df(
+        _REQUEST_ROWS_SQL.format(where="r.request_id > %s OR r.updated_at >= %s"),
+        conn, params=[int(after_id), updated_since],
+    )
+    return split_rows(rows)
+
+
+def merge_changed(cached, changed):
+    """把增量讀到的申請併回快取：改過的整筆換掉，不再是 pending 的拿掉。"""
+    (old_req, old_items), (new_req, new_items) = cached, changed
+    touched = set(new_req["request_id"])
+    keep_req = old_req[~old_req["request_id"].isin(touched)]
+    keep_items = old_items[~old_items["request_id"].isin(touched)]
+    pending = new_req["status"] == "pending"
+    requests = pd.concat([keep_req, new_req[pending]], ignore_index=True)
+    items = pd.concat(
+        [keep_items, new_items[new_items["request_id"].isin(new_req.loc[pending, "request_id"])]],
+        ignore_index=True,
+    )
+    return requests, items
+
+
+def _watermarks(requests, previous=(0, pd.NaT)):
+    """(最大 request_id, 最晚 updated_at)：下次增量讀取的起點。"""
+    last_id, updated = previous
+    if not requests.empty:
+        last_id = max(last_id, int(requests["request_id"].max()))
+        newest = requests["updated_at"].max()
+        if pd.isna(updated) or (not pd.isna(newest) and newest > updated):
+            updated = newest
+    return last_id, updated
+
+
+def load_pending_requests(conn, cache):
+    """待處理申請與明細；cache 是呼叫端保存的 dict（例如 st.session_state 裡的一格）。
+
+    回傳 (申請, 明細)：申請依申請時間新到舊，並附上 order_ids / tracking_numbers 清單字串。
+    """
+    versions = table_versions(("customer_return_requests", "orders"))
+    if cache.get("versions") == versions:
+        return cache["requests"], cache["items"]
+
+    if not cache or cache.get("versions", (None, None))[1] != versions[1]:
+        requests, items = fetch_pending(conn)
+        marks = _watermarks(requests)
+    else:
+        last_id, updated = cache["marks"]
+        since = (updated - UPDATE_OVERLAP).to_pydatetime() if not pd.isna(updated) else None
+        new_req, new_items = fetch_changed(conn, last_id, since)
+        requests, items = merge_changed((cache["requests"], cache["items"]), (new_req, new_items))
+        marks = _watermarks(new_req, cache["marks"])
+
+    requests = with_item_lists(requests, items)
+    cache.update(versions=versions, marks=marks, requests=requests, items=items)
+    return requests, items
+
+
+def with_item_lists(requests, items):
+    """申請表加上 order_ids / tracking_numbers（以 ', ' 連接，依 order_id 排序）。"""
+    requests = requests.drop(columns=["order_ids", "tracking_numbers"], errors="ignore")
+    ordered = items.sort_values(["request_id", "order_id"])
+    lists = ordered.groupby("request_id").agg(
+        order_ids=("order_id", lambda s: ", ".join(map(str, s))),
+        tracking_numbers=("item_tracking_number", lambda s: ", ".join(s.fillna("").astype(str))),
+    )
+    requests = requests.merge(lists, how="left", left_on="request_id", right_index=True)
+    requests[["order_ids", "tracking_numbers"]] = requests[["order_ids", "tracking_numbers"]].fillna("")
+    return requests.sort_values(["created_at", "request_id"], ascending=[False, False]).reset_index(drop=True)
+
+
+def request_items(items, request_id):
+    """某筆申請的明細（從 load_pending_requests 讀回的明細表篩，不再查資料庫）。"""
+    return items[items["request_id"] == request_id].drop(columns=["request_id", "item_tracking_number"])
+
+
+# ===== 寫入 =====
+
+def mark_requests(conn, request_ids, status):
+    """申請改成 processed / cancelled；回傳異動筆數。"""
+    if status not in ("processed", "cancelled"):
+        raise ValueError(f"不支援的狀態：{status}")
+    if not request_ids:
+        return 0
+    with bulk_transaction(conn, "customer_return_requests"):
+        return bulk_update(
+            conn, "customer_return_requests", "request_id", [int(i) for i in request_ids],
+            "status = %s", [status],
+        )
+
+
+# ===== 處理申請：一次把申請與訂單都改好 =====
+
+# 同一張訂單出現在這批好幾筆 pending 申請裡時，只算給、也只記到申請編號最小的那筆
+_ORDER_OWNER_SQL = """
+    SELECT oi.order_id, MIN(oi.request_id) AS request_id
+    FROM customer_return_request_items oi
+    JOIN customer_return_requests orq ON orq.request_id = oi.request_id
+    WHERE oi.request_id IN ({placeholders})
+      AND orq.status = 'pending'
+    GROUP BY oi.order_id
+"""
+
+# 申請對應的訂單：明細幾筆、這次會運回（且歸這筆申請）的、其中提前運回的各幾筆（處理前先算，回報用）
+_PROCESS_COUNTS_SQL = """
+    SELECT r.request_id, r.customer_name, r.status,
+           COUNT(o.order_id) AS item_count,
+           COALESCE(SUM(o.is_returned = 0 AND own.request_id = r.request_id), 0) AS to_return,
+           COALESCE(SUM(o.is_returned = 0 AND own.request_id = r.request_id
+                        AND COALESCE(s.pending_count, 0) > 0), 0) AS early_count
+    FROM customer_return_requests r
+    LEFT JOIN customer_return_request_items i ON i.request_id = r.request_id
+    LEFT JOIN orders o ON o.order_id = i.order_id
+    LEFT JOIN customer_shipping_state s ON s.customer_name = o.customer_name
+    LEFT JOIN ({owner}) own ON own.order_id = o.order_id
+    WHERE r.request_id IN ({placeholders})
+    GROUP BY r.request_id, r.customer_name, r.status
+"""
+
+# 申請裡還沒運回的訂單 → 已運回，記下申請編號、船班、時間（每張訂單只 JOIN 到一筆申請）；
+# 客戶還有未到貨的單（customer_shipping_state.pending_count > 0）就同時標記提前運回
+_PROCESS_ORDERS_SQL = """
+    UPDATE orders o
+    JOIN ({owner}) own ON own.order_id = o.order_id
+    JOIN customer_return_requests r ON r.request_id = own.request_id
+    LEFT JOIN customer_shipping_state s ON s.customer_name = o.customer_name
+    SET o.is_returned = 1,
+        o.is_early_returned = IF(COALESCE(s.pending_count, 0) > 0, 1, o.is_early_returned),
+        o.return_request_id = r.request_id,
+        o.return_batch = r.selected_shipping_batch,
+        o.returned_at = NOW()
+    WHERE o.is_returned = 0
+"""
+
+_REQUEST_CUSTOMERS_SQL = """
+    SELECT DISTINCT o.customer_name
+    FROM customer_return_request_items i
+    JOIN orders o ON o.order_id = i.order_id
+    WHERE i.request_id IN ({placeholders})
+"""
+
+_PROCESS_REQUESTS_SQL = """
+    UPDATE customer_return_requests
+    SET status = 'processed', processed_at = NOW()
+    WHERE request_id IN ({placeholders})
+      AND status = 'pending'
+"""
+
+
+def process_requests(conn, request_ids):
+    """處理前台運回申請：申請 → processed，申請裡的訂單 → 已運回（同一個交易）。
+
+    只動 pending 的申請，重按一次不會重複處理。回傳每筆申請的結果（DataFrame）：
+    request_id、customer_name、原本狀態、明細筆數、這次標記運回筆數、其中提前運回筆數、是否處理。
+    同一張訂單在好幾筆申請裡時只算在申請編號最小的那筆，各申請的運回筆數加總 = 實際更新的訂單數。
+    """
+    columns = ["request_id", "customer_name", "status_before", "item_count", "to_return", "early_count"]
+    ids = [int(i) for i in request_ids]
+    if not ids:
+        return pd.DataFrame(columns=columns + ["processed"])
+    results, customers = [], []
+    with bulk_transaction(conn, "customer_return_requests", "orders"):
+        with conn.cursor() as cur:
+            for part in chunked(ids):
+                placeholders = ",".join(["%s"] * len(part))
+                # 先鎖住這些申請：兩個人同時按處理時，後面那個會看到已是 processed
+                cur.execute(
+                    f"SELECT request_id FROM customer_return_requests WHERE request_id IN ({placeholders}) FOR UPDATE",
+                    part,
+                )
+                cur.fetchall()
+                owner = _ORDER_OWNER_SQL.format(placeholders=placeholders)
+                cur.execute(_PROCESS_COUNTS_SQL.format(owner=owner, placeholders=placeholders), part + part)
+                results += cur.fetchall()
+                cur.execute(_REQUEST_CUSTOMERS_SQL.format(placeholders=placeholders), part)
+                customers += [r[0] for r in cur.fetchall()]
+                cur.execute(_PROCESS_ORDERS_SQL.format(owner=owner), part)
+                cur.execute(_PROCESS_REQUESTS_SQL.format(placeholders=placeholders), part)
+        refresh_customers(conn, customers)
+
+    df = pd.DataFrame(results, columns=columns)
+    pending = df["status_before"] == "pending"
+    df["item_count"] = pd.to_numeric(df["item_count"]).fillna(0).astype(int)
+    for col in ["to_return", "early_count"]:
+        df[col] = pd.to_numeric(df[col]).fillna(0).astype(int).where(pending, 0)
+    df["processed"] = pending
+    return df.sort_values("request_id").reset_index(drop=True)
@@ -0,0 +1,167 @@
+# shipping_fees.py —— 運費計算（後台可出貨統整、前台運回預估、費用試算共用）
+#
+# 費率放在 shipping_rates 表（migrations 第 13 版），讀一次後由 query_cache 快取；
+# 讀不到時用 DEFAULT_RATES。計算函式一次吃整欄（重量、平台、寄送方式），回傳 NumPy 陣列。
+import numpy as np
+import pandas as pd
+
+from db_pool import get_connection
+from query_cache import cached_query
+from sql_frames import read_sql_df
+
+FORWARDING = "集運"   # 平台是「集運」的包裹走集運費率，其他平台一律是代購
+PURCHASE = "代購"
+WEIGHT_EPSILON = 1e-6  # 重量加總的浮點誤差（1.0000000001 kg 不該算成 1.5 kg）
+
+DEFAULT_RATES = {
+    "weight": {
+        FORWARDING: {"per_kg": 90.0, "min_kg": 1.0, "step_kg": 0.5},
+        PURCHASE: {"per_kg": 70.0, "min_kg": 0.5, "step_kg": 0.5},
+    },
+    "delivery": {"面交/自取": 0.0, "宅配": 100.0, "賣貨便": 38.0},
+}
+
+
+# ===== 費率 =====
+
+def read_rates(conn):
+    """從 shipping_rates 組出費率 dict；表裡沒有的項目沿用 DEFAULT_RATES。"""
+    df = read_sql_df("""
+        SELECT kind, label, per_kg, min_kg, step_kg, flat_fee
+        FROM shipping_rates
+    """, conn)
+    rates = {
+        "weight": {k: dict(v) for k, v in DEFAULT_RATES["weight"].items()},
+        "delivery": dict(DEFAULT_RATES["delivery"]),
+    }
+    for row in df.itertuples(index=False):
+        if row.kind == "weight":
+            rates["weight"][row.label] = {
+                "per_kg": float(row.per_kg),
+                "min_kg": float(row.min_kg),
+                "step_kg": float(row.step_kg),
+            }
+        elif row.kind == "delivery":
+            rates["delivery"][row.label] = float(row.flat_fee)
+    return rates
+
+
+@cached_query("shipping_rates")
+def _rates_setting():
+    with get_connection() as conn:
+        return read_rates(conn)
+
+
+def load_rates():
+    try:
+        return _rates_setting()
+    except Exception:
+        return DEFAULT_RATES
+
+
+# ===== 向量化計算 =====
+
+def rate_class(platforms):
+    """平台 → 費率類別（集運 / 代購）。"""
+    p = pd.Series(platforms, dtype=object).fillna("").astype(str).str.strip().to_numpy()
+    return np.where(p == FORWARDING, FORWARDING, PURCHASE)
+
+
+def _per_class(classes, rates, field):
+    out = np.zeros(len(classes), dtype=np.float64)
+    for name, rate in rates["weight"].items():
+        out[classes == name] = rate[field]
+    return out
+
+
+def billed_weight(weights, classes, rates=None):
+    """計費重量：以 step_kg 無條件進位、不足 min_kg 以 min_kg 計；0 kg 不計費。"""
+    rates = rates or load_rates()
+    classes = np.asarray(classes, dtype=object)
+    w = pd.to_numeric(pd.Series(weights), errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+    step = _per_class(classes, rates, "step_kg")
+    billed = np.ceil(w / step - WEIGHT_EPSILON) * step
+    billed = np.maximum(billed, _per_class(classes, rates, "min_kg"))
+    return np.where(w > 0, billed, 0.0)
+
+
+def weight_fee(billed, classes, rates=None):
+    rates = rates or load_rates()
+    return np.asarray(billed, dtype=np.float64) * _per_class(np.asarray(classes, dtype=object), rates, "per_kg")
+
+
+def delivery_fee(methods, rates=None):
+    """台灣端寄送方式 → 加收金額（不認得的方式不加收）。"""
+    rates = rates or load_rates()
+    m = pd.Series(methods, dtype=object).fillna("").astype(str).str.strip()
+    return m.map(rates["delivery"]).fillna(0.0).to_numpy(dtype=np.float64)
+
+
+def shipping_fees(weights, platforms, delivery_methods=None, rates=None):
+    """每一列各自計費：回傳 (計費重量, 運費)。delivery_methods 給了就逐列加上台灣端運費。"""
+    rates = rates or load_rates()
+    classes = rate_class(platforms)
+    billed = billed_weight(weights, classes, rates)
+    fee = weight_fee(billed, classes, rates)
+    if delivery_methods is not None:
+        fee = fee + delivery_fee(delivery_methods, rates)
+    return billed, fee
+
+
+# ===== 常用彙總 =====
+
+def customer_fee_summary(df, rates=None):
+    """後台可出貨統整：每位客戶 × 平台合併計費後再加總。
+
+    df 需有 customer_name / platform / weight_kg / order_id；0 kg 的訂單不計。
+    回傳 customer_name、包裹總數、總公斤數、總國際運費。
+    """
+    w = pd.to_numeric(df["weight_kg"], errors="coerce").fillna(0.0)
+    nonzero = df.loc[w > 0, ["customer_name", "platform", "order_id"]].assign(weight_kg=w[w > 0])
+    grp = (
+        nonzero.groupby(["customer_name", "platform"], as_index=False, sort=False)
+               .agg(total_w=("weight_kg", "sum"), pkg_cnt=("order_id", "count"))
+    )
+    return group_fee_summary(grp, rates)
+
+
+def group_fee_summary(grp, rates=None):
+    """同 customer_fee_summary，但輸入已經是客戶 × 平台的小計（可直接由 SQL GROUP BY 算好）。
+
+    grp 需有 customer_name / platform / total_w / pkg_cnt，只放重量大於 0 的包裹。
+    """
+    grp = grp[grp["pkg_cnt"] > 0].copy()
+    grp["total_w"] = pd.to_numeric(grp["total_w"], errors="coerce").fillna(0.0).astype(float)
+    _, grp["fee"] = shipping_fees(grp["total_w"], grp["platform"], rates=rates)
+    return (
+        grp.groupby("customer_name", as_index=False)
+           .agg(包裹總數=("pkg_cnt", "sum"),
+                總公斤數=("total_w", "sum"),
+                總國際運費=("fee", "sum"))
+    )
+
+
+def estimate_return_fee(weights, platforms, delivery_method, rates=None):
+    """前台運回預估：集運、代購各自合併計費，再加台灣端運費。
+
+    回傳 (運費四捨五入, 總計費重量, 集運計費重量, 代購計費重量)。
+    """
+    rates = rates or load_rates()
+    classes = rate_class(platforms)
+    w = pd.to_numeric(pd.Series(weights), errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+    totals = np.array([w[classes == FORWARDING].sum(), w[classes == PURCHASE].sum()])
+    billed = billed_weight(totals, np.array([FORWARDING, PURCHASE], dtype=object), rates)
+    fee = weight_fee(billed, np.array([FORWARDING, PURCHASE], dtype=object), rates).sum()
+    fee += delivery_fee([delivery_method], rates)[0]
+    return round(float(fee)), float(billed.sum()), float(billed[0]), float(billed[1])
+
+
+def rate_description(rates=None):
+    """費率說明文字（前台顯示用）。"""
+    rates = rates or load_rates()
+    fw, pu = rates["weight"][FORWARDING], rates["weight"][PURCHASE]
+    extras = "，".join(f"{k}加 {v:g} 元" for k, v in rates["delivery"].items() if v)
+    return (
+        f"純集運：每公斤 {fw['per_kg']:g} 元，最低 {fw['min_kg']:g} 公斤起算，並以 {fw['step_kg']:g} 公斤為單位計費；"
+        f"代購商品：每公斤 {pu['per_kg']:g} 元，以 {pu['step_kg']:g} 公斤為單位計費；{extras}。"
+    )
@@ -0,0 +1,150 @@
+# shipping_state.py —— 每位客戶的出貨狀態（customer_shipping_state），寫入時逐客戶更新
+#
+# 「哪些客戶可以出貨、幾包、幾公斤」以前每次都從 orders 整張重算。現在每次改到 orders
+# 的地方（入庫、重試、新增 / 編輯 / 刪除、標記運回 / 提前運回 / 延後 / 已通知、集運登記）
+# 在 commit 前呼叫 refresh_customers(conn, 客戶...)，只重算受影響的客戶，和原本的寫入同一個交易。
+# 資料不一致時（例如直接在資料庫改過）可以整張重建：python shipping_state.py
+import streamlit as st
+
+from db_pool import connect
+from sql_frames import read_sql_df
+
+REFRESH_CHUNK = 500
+
+# 只留還有「未到貨」或「到貨未運回」訂單的客戶；全部運回的客戶不佔列
+_STATE_SELECT = """
+    SELECT
+        customer_name,
+        SUM(is_arrived = 0),
+        SUM(is_arrived = 1 AND is_returned = 0),
+        COALESCE(SUM(CASE WHEN is_arrived = 1 AND is_returned = 0 THEN weight_kg END), 0),
+        SUM(is_arrived = 1 AND is_returned = 0 AND is_early_returned = 1),
+        SUM(is_arrived = 1 AND is_returned = 0 AND is_delayed = 1),
+        SUM(is_arrived = 1 AND is_returned = 0 AND is_notified = 1)
+    FROM orders
+    WHERE customer_name IS NOT NULL AND customer_name <> ''{where}
+    GROUP BY customer_name
+    HAVING SUM(is_arrived = 0) > 0 OR SUM(is_arrived = 1 AND is_returned = 0) > 0
+"""
+
+_STATE_INSERT = """
+    INSERT INTO customer_shipping_state
+    (customer_name, pending_count, arrived_count, arrived_weight,
+     early_return_count, delayed_count, notified_count)
+"""
+
+# ===== 寫入：逐客戶更新 / 整張重建 =====
+
+def _clean_names(names):
+    out = []
+    for n in names:
+        if n is None:
+            continue
+        s = str(n).strip()
+        if s and s not in out:
+            out.append(s)
+    return out
+
+
+def refresh_customers(conn, names):
+    """重算這些客戶的狀態（不 commit，由呼叫端和原本的寫入一起提交）。"""
+    names = _clean_names(names)
+    with conn.cursor() as cur:
+        for start in range(0, len(names), REFRESH_CHUNK):
+            chunk = names[start:start + REFRESH_CHUNK]
+            placeholders = ",".join(["%s"] * len(chunk))
+            cur.execute(
+                f"DELETE FROM customer_shipping_state WHERE customer_name IN ({placeholders})",
+                chunk,
+            )
+            cur.execute(
+                _STATE_INSERT + _STATE_SELECT.format(where=f" AND customer_name IN ({placeholders})"),
+                chunk,
+            )
+    return len(names)
+
+
+def customers_of_orders(conn, order_ids):
+    """訂單編號 → 客戶姓名（去重）。"""
+    ids = [int(i) for i in order_ids]
+    names = []
+    with conn.cursor() as cur:
+        for start in range(0, len(ids), REFRESH_CHUNK):
+            chunk = ids[start:start + REFRESH_CHUNK]
+            placeholders = ",".join(["%s"] * len(chunk))
+            cur.execute(
+                f"SELECT DISTINCT customer_name FROM orders WHERE order_id IN ({placeholders})",
+                chunk,
+            )
+            names += [r[0] for r in cur.fetchall()]
+    return _clean_names(names)
+
+
+def customers_of_tracking(conn, tracking_numbers):
+    """包裹單號 → 客戶姓名（去重；同單號可能分屬多筆訂單）。"""
+    tns = [str(t).strip() for t in tracking_numbers if str(t).strip()]
+    names = []
+    with conn.cursor() as cur:
+        for start in range(0, len(tns), REFRESH_CHUNK):
+            chunk = tns[start:start + REFRESH_CHUNK]
+            placeholders = ",".join(["%s"] * len(chunk))
+            cur.execute(
+                f"SELECT DISTINCT customer_name FROM orders WHERE tracking_number IN ({placeholders})",
+                chunk,
+            )
+            names += [r[0] for r in cur.fetchall()]
+    return _clean_names(names)
+
+
+def refresh_orders(conn, order_ids):
+    """依訂單編號找出客戶再重算；姓名沒變的寫入（標記、運回）用這個就好。"""
+    return refresh_customers(conn, customers_of_orders(conn, order_ids))
+
+
+def rebuild_all(conn):
+    """整張重建（不 commit）；回傳客戶數。"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM customer_shipping_state")
+        cur.execute(_STATE_INSERT + _STATE_SELECT.format(where=""))
+        cur.execute("SELECT COUNT(*) FROM customer_shipping_state")
+        return int(cur.fetchone()[0])
+
+
+# ===== 讀取 =====
+
+CUSTOMER_STATE_SQL = """
+    SELECT pending_count, arrived_count, arrived_weight, early_return_count,
+           delayed_count, notified_count, last_change_at
+    FROM customer_shipping_state
+    WHERE customer_name = %s
+"""
+
+
+def customer_state(conn, customer_name):
+    """單一客戶的狀態（dict）；沒有未完成訂單時各數字都是 0。"""
+    df = read_sql_df(CUSTOMER_STATE_SQL, conn, params=[str(customer_name).strip()])
+    if df.empty:
+        return {"pending_count": 0, "arrived_count": 0, "arrived_weight": 0.0,
+                "early_return_count": 0, "delayed_count": 0, "notified_count": 0,
+                "last_change_at": None}
+    row = df.iloc[0]
+    return {
+        "pending_count": int(row["pending_count"]),
+        "arrived_count": int(row["arrived_count"]),
+        "arrived_weight": float(row["arrived_weight"]),
+        "early_return_count": int(row["early_return_count"]),
+        "delayed_count": int(row["delayed_count"]),
+        "notified_count": int(row["notified_count"]),
+        "last_change_at": row["last_change_at"],
+    }
+
+
+if __name__ == "__main__":
+    # 修復用：python shipping_state.py
+    conn = connect(st.secrets["mysql"])
+    try:
+        n = rebuild_all(conn)
+        conn.commit()
+        print(f"已重建 customer_shipping_state：{n} 位客戶")
+    finally:
+        conn.close()
@@ -0,0 +1,208 @@
+# sql_frames.py —— 查詢結果直接解成有型別的 DataFrame
+#
+# 以前 read_sql_df 用 dictionary cursor，每列一個 dict，DECIMAL 進來是 decimal.Decimal，
+# 各頁再自己 pd.to_numeric(...).astype(float)。這裡改成 fetchmany 取 tuple，
+# 逐欄轉成 NumPy 陣列：DECIMAL → float64、TINYINT(1) 旗標 → bool、DATETIME → datetime64。
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from mysql.connector.constants import FieldType
+
+FETCH_CHUNK = 5000
+
+_NAN = float("nan")
+_NAT = np.iinfo(np.int64).min           # datetime64 的 NaT 就是 int64 最小值
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_US_PER_DAY = 86_400_000_000
+
+FLOAT, INT, BOOL, DATETIME, TEXT = "float", "int", "bool", "datetime", "text"
+
+# 各資料表的欄位型別；查詢結果依「欄位名稱」套用，沒列到的欄位再看 cursor.description
+TABLE_SCHEMAS = {
+    "orders": {
+        "order_id": INT,
+        "order_time": DATETIME,
+        "customer_name": TEXT,
+        "platform": TEXT,
+        "tracking_number": TEXT,
+        "amount_rmb": FLOAT,
+        "amount_twd": FLOAT,
+        "weight_kg": FLOAT,
+        "service_fee": FLOAT,
+        "paid_amount": FLOAT,
+        "paid_at": DATETIME,
+        "payment_method": TEXT,
+        "payment_status": TEXT,
+        "payment_note": TEXT,
+        "is_arrived": BOOL,
+        "is_returned": BOOL,
+        "is_early_returned": BOOL,
+        "early_return": BOOL,
+        "is_delayed": BOOL,
+        "delayed_at": DATETIME,
+        "delayed_by": TEXT,
+        "is_notified": BOOL,
+        "notified_at": DATETIME,
+        "notified_by": TEXT,
+        "return_request_id": INT,
+        "return_batch": TEXT,
+        "returned_at": DATETIME,
+        "remarks": TEXT,
+    },
+    "members": {
+        "member_id": INT,
+        "customer_name": TEXT,
+        "member_level": TEXT,
+        "note": TEXT,
+        "line_user_id": TEXT,
+        "line_name": TEXT,
+        "created_at": DATETIME,
+        "updated_at": DATETIME,
+    },
+    "failed_orders": {
+        "id": INT,
+        "tracking_number": TEXT,
+        "weight_kg": FLOAT,
+        "raw_message": TEXT,
+        "retry_count": INT,
+        "last_error": TEXT,
+        "next_retry_at": DATETIME,
+        "created_at": DATETIME,
+        "updated_at": DATETIME,
+    },
+    "inbound_retry_runs": {
+        "run_id": INT,
+        "run_by": TEXT,
+        "started_at": DATETIME,
+        "finished_at": DATETIME,
+        "due_count": INT,
+        "succeeded": INT,
+        "still_failed": INT,
+        "error": TEXT,
+    },
+    "customer_return_requests": {
+        "request_id": INT,
+        "customer_name": TEXT,
+        "selected_shipping_batch": TEXT,
+        "delivery_method": TEXT,
+        "total_count": INT,
+        "total_weight": FLOAT,
+        "estimated_fee": FLOAT,
+        "status": TEXT,
+        "created_at": DATETIME,
+        "updated_at": DATETIME,
+        "processed_at": DATETIME,
+    },
+    "customer_return_request_items": {
+        "id": INT,
+        "request_id": INT,
+        "order_id": INT,
+        "tracking_number": TEXT,
+        "platform": TEXT,
+        "weight_kg": FLOAT,
+        "created_at": DATETIME,
+    },
+}
+
+
+def _merge_schemas(schemas):
+    merged = {}
+    for table, columns in schemas.items():
+        for name, kind in columns.items():
+            if merged.setdefault(name, kind) != kind:
+                raise ValueError(f"欄位 {name} 在 {table} 的型別和其他表不一致")
+    return merged
+
+
+COLUMN_TYPES = _merge_schemas(TABLE_SCHEMAS)
+
+_FIELD_KINDS = {
+    FieldType.DECIMAL: FLOAT,
+    FieldType.NEWDECIMAL: FLOAT,
+    FieldType.FLOAT: FLOAT,
+    FieldType.DOUBLE: FLOAT,
+    FieldType.TINY: INT,
+    FieldType.SHORT: INT,
+    FieldType.INT24: INT,
+    FieldType.LONG: INT,
+    FieldType.LONGLONG: INT,
+    FieldType.YEAR: INT,
+    FieldType.DATE: DATETIME,
+    FieldType.NEWDATE: DATETIME,
+    FieldType.DATETIME: DATETIME,
+    FieldType.TIMESTAMP: DATETIME,
+}
+
+
+def column_kind(description):
+    """先看宣告的欄位型別，再看 MySQL 回傳的欄位型別。"""
+    name, type_code = description[0], description[1]
+    return COLUMN_TYPES.get(name) or _FIELD_KINDS.get(type_code, TEXT)
+
+
+def _to_float(v):
+    return _NAN if v is None else float(v)
+
+
+def _to_epoch_us(v):
+    # 直接用 date/datetime 的欄位算微秒數，比讓 NumPy / pandas 逐一解析物件快很多
+    if v is None:
+        return _NAT
+    us = (v.toordinal() - _EPOCH_ORDINAL) * _US_PER_DAY
+    if isinstance(v, datetime):
+        us += ((v.hour * 60 + v.minute) * 60 + v.second) * 1_000_000 + v.microsecond
+    return us
+
+
+def decode_column(values, kind):
+    """一整欄的 Python 值 → NumPy / pandas 陣列（NULL 會變 NaN / NaT / False）。"""
+    n = len(values)
+    if kind == TEXT:
+        out = np.empty(n, dtype=object)
+        out[:] = values
+        return out
+    if kind == DATETIME:
+        try:
+            return np.fromiter(map(_to_epoch_us, values), np.int64, n).view("datetime64[us]")
+        except (AttributeError, TypeError):
+            # 不是 date/datetime（例如字串）就交給 pandas 慢慢解析
+            return pd.to_datetime(pd.Series(values, dtype=object), errors="coerce").to_numpy()
+    if kind == FLOAT:
+        return np.fromiter(map(_to_float, values), np.float64, n)  # Decimal → float64
+    floats = np.array(values, dtype=np.float64)  # 0/1/整數/None
+    if kind == BOOL:
+        return floats == 1
+    if np.isnan(floats).any():
+        return pd.array(floats, dtype="Int64")
+    return floats.astype(np.int64)
+
+
+def frame_from_cursor(cur, chunk_size=FETCH_CHUNK):
+    """把已 execute 的 cursor 讀完，逐欄組成 DataFrame；不建立每列 dict。"""
+    if cur.description is None:
+        return pd.DataFrame()
+
+    names = [d[0] for d in cur.description]
+    kinds = [column_kind(d) for d in cur.description]
+    buffers = [[] for _ in names]
+
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        for buf, col in zip(buffers, zip(*rows)):
+            buf.extend(col)
+
+    return pd.DataFrame(
+        {name: decode_column(buf, kind) for name, buf, kind in zip(names, buffers, kinds)},
+        columns=names,
+    )
+
+
+def read_sql_df(sql, conn, params=None):
+    """執行查詢並回傳有型別的 DataFrame（取代 dictionary cursor + pd.DataFrame(rows)）。"""
+    params = params or []
+    with conn.cursor() as cur:
+        cur.execute(sql, tuple(params))
+        return frame_from_cursor(cur)
@@ -0,0 +1,282 @@
+# sql_trace.py —— 每次 rerun 的 SQL / pandas 耗時追蹤（預設關閉）
+#
+# 開啟後，db_pool 借出的連線會包一層代理，記下每個 cursor.execute 的 SQL、參數數、
+# 回傳列數、約略位元組數與耗時（read_sql_df、pd.read_sql、直接 cursor.execute 都會經過）。
+# 較重的 pandas 步驟用 trace_span("名稱") 包起來計時。
+# 每次 rerun 的結果：後台側邊欄可開面板檢視；同時逐筆寫進 JSONL 方便事後彙整。
+#
+# 開關：後台側邊欄「🔬 SQL 追蹤」；前台用環境變數 JUMAO_TRACE=1。
+# 記錄檔：環境變數 JUMAO_TRACE_LOG，預設 logs/sql_trace.jsonl。
+import contextvars
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+TRACE_TOGGLE_KEY = "sql_trace_enabled"
+PENDING_KEY = "_sql_trace_pending"
+DEFAULT_LOG_PATH = os.path.join("logs", "sql_trace.jsonl")
+
+_current = contextvars.ContextVar("sql_trace_current", default=None)
+
+_WS = re.compile(r"\s+")
+_STR = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUM = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)+\s*\)")
+
+
+def trace_enabled_by_env():
+    return os.environ.get("JUMAO_TRACE", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def normalize_sql(sql):
+    """去掉多餘空白、把常數換成 ?、IN (%s, %s, ...) 收成一種寫法，同一句 SQL 才能彙整。"""
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode("utf-8", "replace")
+    s = _WS.sub(" ", str(sql)).strip()
+    s = _STR.sub("?", s)
+    s = _NUM.sub("?", s)
+    return _IN_LIST.sub("(%s, …)", s)
+
+
+def _param_count(params):
+    if params is None:
+        return 0
+    if isinstance(params, dict):
+        return len(params)
+    try:
+        return len(params)
+    except TypeError:
+        return 1
+
+
+def _rows_bytes(rows):
+    """約略的資料量：字串算字元數，其他值一律算 8 bytes。"""
+    n = 0
+    for row in rows:
+        values = row.values() if isinstance(row, dict) else row
+        for v in values:
+            if v is None:
+                continue
+            n += len(v) if isinstance(v, (str, bytes, bytearray)) else 8
+    return n
+
+
+class Trace:
+    """一次 rerun 的追蹤紀錄。"""
+
+    def __init__(self, app):
+        self.app = app
+        self.rerun_id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.page = ""
+        self.events = []
+
+    def add(self, **event):
+        event.setdefault("at_ms", round((time.perf_counter() - self.started) * 1000, 1))
+        self.events.append(event)
+        return event
+
+    def total_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def to_frame(self):
+        return pd.DataFrame(self.events, columns=["kind", "name", "ms", "params", "rows", "bytes", "at_ms"])
+
+
+# ===== 連線 / cursor 代理 =====
+
+class TracedCursor:
+    def __init__(self, cursor, trace):
+        self._cursor = cursor
+        self._trace = trace
+        self._event = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _record(self, sql, params, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            self._event = self._trace.add(
+                kind="sql", name=normalize_sql(sql), ms=round(ms, 2),
+                params=_param_count(params), rows=0, bytes=0,
+            )
+            rowcount = getattr(self._cursor, "rowcount", -1)
+            if self._cursor.description is None and rowcount and rowcount > 0:
+                self._event["rows"] = rowcount  # INSERT / UPDATE / DELETE：影響列數
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        return self._record(operation, params, self._cursor.execute, operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        return self._record(operation, seq_params, self._cursor.executemany, operation, seq_params, *args, **kwargs)
+
+    def _fetched(self, rows, t0):
+        if self._event is not None:
+            self._event["ms"] = round(self._event["ms"] + (time.perf_counter() - t0) * 1000, 2)
+            self._event["rows"] += len(rows)
+            self._event["bytes"] += _rows_bytes(rows)
+        return rows
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched([] if row is None else [row], t0)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        return self._fetched(self._cursor.fetchmany(*args, **kwargs), t0)
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        return self._fetched(self._cursor.fetchall(), t0)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __enter__(self):
+        enter = getattr(self._cursor, "__enter__", None)
+        if enter is not None:
+            enter()
+        return self
+
+    def __exit__(self, *exc):
+        exit_ = getattr(self._cursor, "__exit__", None)
+        if exit_ is not None:
+            return exit_(*exc)
+        self._cursor.close()
+        return None
+
+
+class TracedConnection:
+    def __init__(self, conn, trace):
+        self._conn = conn
+        self._trace = trace
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return TracedCursor(self._conn.cursor(*args, **kwargs), self._trace)
+
+    def __enter__(self):
+        enter = getattr(self._conn, "__enter__", None)
+        if enter is not None:
+            enter()
+        return self
+
+    def __exit__(self, *exc):
+        exit_ = getattr(self._conn, "__exit__", None)
+        if exit_ is not None:
+            return exit_(*exc)
+        return None
+
+
+def traced(conn):
+    """追蹤開啟時回傳代理連線，否則原樣回傳。"""
+    trace = _current.get()
+    if trace is None or conn is None or isinstance(conn, TracedConnection):
+        return conn
+    return TracedConnection(conn, trace)
+
+
+# ===== rerun 生命週期 =====
+
+def start_rerun(app, enabled=None):
+    """每次 rerun 一開始呼叫；先把上一輪沒寫出的紀錄（例如遇到 st.stop()）補寫。"""
+    pending = st.session_state.pop(PENDING_KEY, None)
+    if pending is not None:
+        write_log(pending)
+
+    if enabled is None:
+        enabled = st.session_state.get(TRACE_TOGGLE_KEY, False) or trace_enabled_by_env()
+    trace = Trace(app) if enabled else None
+    _current.set(trace)
+    if trace is not None:
+        st.session_state[PENDING_KEY] = trace
+    return trace
+
+
+def finish_rerun(page=""):
+    """rerun 結束時呼叫：寫 JSONL，回傳這一輪的 Trace（沒開就是 None）。"""
+    trace = _current.get()
+    if trace is None:
+        return None
+    trace.page = str(page or "")
+    st.session_state.pop(PENDING_KEY, None)
+    write_log(trace)
+    _current.set(None)
+    return trace
+
+
+@contextmanager
+def trace_span(name):
+    """替一段 pandas 處理計時；沒開追蹤時幾乎沒有成本。"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(kind="span", name=name, ms=round((time.perf_counter() - t0) * 1000, 2),
+                  params=None, rows=None, bytes=None)
+
+
+def write_log(trace, path=None):
+    path = path or os.environ.get("JUMAO_TRACE_LOG", DEFAULT_LOG_PATH)
+    if not trace.events:
+        return
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for e in trace.events:
+                f.write(json.dumps(dict(
+                    e, ts=trace.started_at, app=trace.app, page=trace.page,
+                    rerun=trace.rerun_id, rerun_ms=trace.total_ms(),
+                ), ensure_ascii=False) + "\n")
+    except OSError:
+        pass  # 記錄檔寫不進去不影響頁面
+
+
+# ===== 後台側邊欄面板 =====
+
+def render_trace_toggle():
+    st.sidebar.toggle("🔬 SQL 追蹤", key=TRACE_TOGGLE_KEY, help="記錄本頁每句 SQL 與 pandas 步驟的耗時（下一次操作起生效）")
+
+
+def render_trace_panel(trace):
+    if trace is None:
+        return
+    df = trace.to_frame()
+    sql = df[df["kind"] == "sql"]
+    with st.sidebar.expander(f"🔬 本次 rerun：{trace.total_ms():,.0f} ms｜SQL {len(sql)} 句", expanded=True):
+        if df.empty:
+            st.caption("這一輪沒有查詢。")
+            return
+        st.caption(f"SQL 合計 {sql['ms'].sum():,.1f} ms")
+        st.dataframe(
+            df.sort_values("ms", ascending=False)[["kind", "ms", "rows", "bytes", "params", "name"]],
+            hide_index=True, use_container_width=True,
+        )
+        if not sql.empty:
+            st.markdown("**同一句 SQL 彙整**")
+            agg = (
+                sql.groupby("name", as_index=False)
+                   .agg(次數=("ms", "size"), 總耗時ms=("ms", "sum"), 列數=("rows", "sum"))
+                   .sort_values("總耗時ms", ascending=False)
+            )
+            st.dataframe(agg, hide_index=True, use_container_width=True)
@@ -0,0 +1,111 @@
+# table_format.py —— 訂單表格的顯示欄位（中文欄名、✔/✘、狀態與標記文字）
+#
+# 這些欄位每次 rerun 都要重做；以前是逐列 apply / 逐列 df.loc 組字串，10 萬列要好幾百毫秒。
+# 這裡一律整欄處理：布林欄用 np.where、多種狀態用 np.select、代碼換文字用 map，
+# 後台（app.py）與前台（customer_app.py / customer_app2.py）共用。
+import numpy as np
+import pandas as pd
+
+ORDER_COLUMN_LABELS = {
+    "order_id": "訂單編號",
+    "order_time": "下單日期",
+    "customer_name": "客戶姓名",
+    "platform": "平台",
+    "tracking_number": "包裹單號",
+    "amount_rmb": "金額（人民幣）",
+    "amount_twd": "應付款項（台幣）",
+    "weight_kg": "公斤數",
+    "is_arrived": "是否到貨",
+    "is_returned": "是否已運回",
+    "is_early_returned": "提前運回",
+    "is_delayed": "延後",
+    "delayed_at": "延後設定時間",
+    "delayed_by": "延後設定來源",
+    "is_notified": "已通知",
+    "notified_at": "通知設定時間",
+    "notified_by": "通知設定來源",
+    "return_request_id": "運回申請編號",
+    "return_batch": "運回船班",
+    "returned_at": "運回時間",
+    "service_fee": "代購手續費",
+    "payment_method": "付款方式",
+    "payment_status": "付款狀態",
+    "paid_amount": "已付款金額",
+    "paid_at": "付款時間",
+    "payment_note": "付款備註",
+    "remarks": "備註",
+    "匯率價差利潤": "匯率價差利潤",
+    "代購手續費收入": "代購手續費收入",
+    "總利潤": "總利潤",
+}
+
+# 顯示成 ✔ / ✘ 的欄位（中文欄名）
+FLAG_LABELS = ["是否到貨", "是否已運回", "提前運回", "延後", "已通知"]
+
+
+# ===== 基本轉換 =====
+
+def truthy(values):
+    """整欄轉成布林陣列：0 / 空值 / 空字串 / 非數字都算 False。"""
+    s = pd.Series(values, copy=False)
+    if s.dtype == bool:
+        return s.to_numpy()
+    if pd.api.types.is_integer_dtype(s.dtype) and not s.hasnans:
+        return s.to_numpy() != 0
+    return pd.to_numeric(s, errors="coerce").fillna(0).to_numpy() != 0
+
+
+def check_marks(values, yes="✔", no="✘"):
+    return np.where(truthy(values), yes, no).astype(object)
+
+
+def mark_columns(df, columns=FLAG_LABELS, yes="✔", no="✘"):
+    """把 df 裡有的布林欄位原地換成 ✔ / ✘；沒有的欄位略過。"""
+    for col in columns:
+        if col in df.columns:
+            df[col] = check_marks(df[col], yes, no)
+    return df
+
+
+def map_labels(values, mapping, default=""):
+    """代碼 → 顯示文字（例如 home_delivery → 宅配）；對不到的給 default。"""
+    return pd.Series(values, copy=False).map(mapping).fillna(default).to_numpy(dtype=object)
+
+
+# ===== 訂單表格 =====
+
+def order_table(df):
+    """欄位改中文＋布林值轉 ✔ / ✘（後台各頁共用）。"""
+    df = df.rename(columns=ORDER_COLUMN_LABELS)
+    return mark_columns(df)
+
+
+def flag_tags(delayed, notified):
+    """可出貨名單的「標記」欄：⚠️ 延後 / 📣 已通知，兩個都有用 ' / ' 連起來。"""
+    d, n = truthy(delayed), truthy(notified)
+    return np.select(
+        [d & n, d, n],
+        ["⚠️ 延後 / 📣 已通知", "⚠️ 延後", "📣 已通知"],
+        default="",
+    ).astype(object)
+
+
+def ratio_labels(count, total, full, partial):
+    """「全部 / 部分」標籤：count 為 0 給空白，等於 total 用 full，否則用 partial，後面接（count/total）。"""
+    c = pd.to_numeric(pd.Series(count, copy=False), errors="coerce").fillna(0).astype(np.int64)
+    t = pd.to_numeric(pd.Series(total, copy=False), errors="coerce").fillna(0).astype(np.int64)
+    out = np.full(len(c), "", dtype=object)
+    hit = ((c > 0) & (t > 0)).to_numpy()
+    if hit.any():
+        prefix = np.where((c == t).to_numpy()[hit], full, partial).astype(object)
+        out[hit] = prefix + "（" + c[hit].astype(str).to_numpy() + "/" + t[hit].astype(str).to_numpy() + "）"
+    return out
+
+
+def arrival_status(is_arrived, tracking_number):
+    """前台到倉狀態：已到倉 / 運送中（有單號）/ 賣家尚未寄出。"""
+    arrived = truthy(is_arrived)
+    has_tracking = (
+        pd.Series(tracking_number, copy=False).fillna("").astype(str).str.strip().to_numpy() != ""
+    )
+    return np.select([arrived, has_tracking], ["已到倉", "運送中"], default="賣家尚未寄出").astype(object)